@@ -0,0 +1,168 @@
+"""Benchmark filtering barns in spatial partitions with different numbers of worker processes.
+
+Run the whole filtering chain on the national barns and isochrones from a clean run:
+    python benchmarks/benchmark_partitions.py
+
+Or on synthetic barns and isochrones if the data isn't available. Synthetic runs skip the exclusion
+filters in config_geo_filters.yaml, and instead compare loading a synthetic exclusion layer for each
+partition against loading it once for every partition:
+    python benchmarks/benchmark_partitions.py --synthetic 200000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from rafi.barn_table import BarnTable
+from rafi.constants import ALBERS_EQUAL_AREA, CLEAN_DIR, RAW_DIR, WGS84
+from rafi.filter_barns import (
+    LayerExtent,
+    apply_filters,
+    filter_barns,
+    footprint_thresholds,
+    get_bounds,
+)
+from rafi.partition import get_partitions
+from rafi.utils import read_barn_centroids
+
+BARNS_FILENAME = "full-usa-3-13-2021_filtered_deduplicated.gpkg"
+
+
+def synthetic_barns(n: int, seed: int = 0) -> gpd.GeoDataFrame:
+    """Creates pairs of barn footprints 30m apart spread across the southeastern USA.
+
+    Args:
+        n: Number of barns.
+        seed: Random seed.
+
+    Returns:
+        GeoDataFrame of barn footprints.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.repeat(rng.uniform(-95, -78, n // 2), 2)
+    y = np.repeat(rng.uniform(30, 37, n // 2), 2)
+    x[1::2] += 0.0003
+    return gpd.GeoDataFrame(geometry=shapely.box(x, y, x + 0.0002, y + 0.0001), crs=WGS84)
+
+
+def synthetic_isochrones(n: int, seed: int = 0) -> gpd.GeoDataFrame:
+    """Creates overlapping square isochrones around random plants.
+
+    Args:
+        n: Number of isochrones.
+        seed: Random seed.
+
+    Returns:
+        GeoDataFrame with "Parent Corporation" and "corp_access" columns.
+    """
+    rng = np.random.default_rng(seed)
+    x, y = rng.uniform(-95, -78, n), rng.uniform(30, 37, n)
+    return gpd.GeoDataFrame(
+        {"Parent Corporation": rng.integers(0, 10, n).astype(str), "corp_access": rng.integers(1, 4, n)},
+        geometry=shapely.box(x - 1, y - 1, x + 1, y + 1),
+        crs=WGS84,
+    )
+
+
+def time_it(func, repeat: int) -> float:
+    """Returns the best time in seconds over several runs of a function."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark_layer_sharing(gdf_barns: gpd.GeoDataFrame, partition_size: float, n_features: int) -> None:
+    """Compares loading an exclusion layer for each partition against loading it once.
+
+    Args:
+        gdf_barns: GeoDataFrame of barn centroids in ALBERS_EQUAL_AREA.
+        partition_size: Width of each partition in meters.
+        n_features: Number of points in the synthetic exclusion layer.
+    """
+    rng = np.random.default_rng(1)
+    coords = shapely.get_coordinates(gdf_barns.geometry.to_numpy())
+    partitions = get_partitions(coords[:, 0], coords[:, 1], partition_size)
+    gdf_barns = gdf_barns.to_crs(WGS84)
+    points = [gdf_barns.geometry.iloc[partition.core] for partition in partitions]
+    extent = LayerExtent(get_bounds(gdf_barns), None)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = Path(tmp_dir)
+        layer = gpd.GeoDataFrame(
+            geometry=gpd.points_from_xy(rng.uniform(-95, -78, n_features), rng.uniform(30, 37, n_features)),
+            crs=WGS84,
+        )
+        layer.to_file(tmp_dir / "airports.geojson", driver="GeoJSON")
+        filters_config = [{"description": "airports", "filename": "airports.geojson", "buffer": 800}]
+
+        results = {}
+        for name, table_extent in [("per partition", None), ("shared", extent)]:
+            cache_dir = tmp_dir / name.replace(" ", "_")
+            start = time.perf_counter()
+            for partition_points in points:
+                apply_filters(
+                    BarnTable.from_points(partition_points),
+                    filters_config,
+                    tmp_dir,
+                    stats_path=None,
+                    extent=table_extent,
+                    cache_dir=cache_dir,
+                )
+            results[name] = (time.perf_counter() - start, len(list(cache_dir.glob("*.parquet"))))
+
+    print(f"Exclusion layer with {n_features} features in {len(points)} partitions")
+    for name, (seconds, n_files) in results.items():
+        print(f"{name:<20}{seconds:>10.2f}s{n_files:>6} layer reads")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--synthetic", type=int, default=0, help="Number of synthetic barns to use")
+    parser.add_argument("--partition_size", type=float, default=200000, help="Partition width in meters")
+    parser.add_argument(
+        "--n_workers", type=int, nargs="+", default=None, help="Worker counts to time. Defaults to powers of 2"
+    )
+    parser.add_argument("--layer_features", type=int, default=50000, help="Points in the synthetic layer")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+    n_workers = args.n_workers or [2**i for i in range(int(np.log2(os.cpu_count())) + 1)]
+
+    if args.synthetic:
+        gdf_barns = synthetic_barns(args.synthetic)
+        gdf_isochrones = synthetic_isochrones(200)
+        # Note: The exclusion filters need the real shapefiles
+        filter_kwargs = {"filter_barns": False}
+    else:
+        gdf_barns = read_barn_centroids(RAW_DIR / BARNS_FILENAME, footprint_thresholds=footprint_thresholds)
+        gdf_isochrones = gpd.read_file(CLEAN_DIR / "_clean_run" / "isochrones.geojson")
+        filter_kwargs = {}
+    print(f"Benchmarking with {len(gdf_barns)} barns on {os.cpu_count()} CPUs")
+
+    # Note: Warm the caches first so every timing reads the same cached layers
+    filter_barns(gdf_barns, gdf_isochrones, n_workers=1, partition_size=args.partition_size, **filter_kwargs)
+    results = {
+        workers: time_it(
+            lambda workers=workers: filter_barns(
+                gdf_barns, gdf_isochrones, n_workers=workers, partition_size=args.partition_size, **filter_kwargs
+            ),
+            args.repeat,
+        )
+        for workers in n_workers
+    }
+    baseline = results[n_workers[0]] * n_workers[0]
+    for workers, seconds in results.items():
+        print(f"{workers:>3} workers{seconds:>10.2f}s  speedup {baseline / seconds:.1f}x")
+
+    if args.synthetic:
+        benchmark_layer_sharing(
+            gdf_barns.to_crs(ALBERS_EQUAL_AREA).centroid.to_frame("geometry"), args.partition_size, args.layer_features
+        )
@@ -0,0 +1,81 @@
+"""Benchmark parallel polygon unions against single-threaded unions on plant isochrones.
+
+Run on the national plant isochrones from a clean run:
+    python benchmarks/benchmark_union.py
+
+Or on synthetic isochrone-like polygons if the clean run isn't available:
+    python benchmarks/benchmark_union.py --synthetic 2000
+"""
+
+import argparse
+import os
+import time
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from rafi.constants import CLEAN_DIR, WGS84
+from rafi.geometry import parallel_dissolve, parallel_union
+
+
+def synthetic_isochrones(n: int, seed: int = 0) -> gpd.GeoDataFrame:
+    """Creates irregular, overlapping polygons spread across the contiguous USA.
+
+    Args:
+        n: Number of polygons.
+        seed: Random seed.
+
+    Returns:
+        GeoDataFrame with "Parent Corporation" and "isochrone" columns.
+    """
+    rng = np.random.default_rng(seed)
+    # Note: isochrones are roughly 60 miles (~1 degree) across with ragged edges
+    angles = np.linspace(0, 2 * np.pi, 256, endpoint=False)
+    polygons = []
+    for x, y in zip(rng.uniform(-105, -75, n), rng.uniform(29, 45, n)):
+        radius = rng.uniform(0.5, 1.0) * (1 + 0.3 * rng.standard_normal(len(angles)).clip(-2, 2))
+        polygons.append(shapely.Polygon(np.column_stack([x + radius * np.cos(angles), y + radius * np.sin(angles)])))
+    return gpd.GeoDataFrame(
+        {"Parent Corporation": rng.integers(0, 40, n).astype(str)},
+        geometry=gpd.GeoSeries(polygons).buffer(0),
+        crs=WGS84,
+    ).rename_geometry("isochrone")
+
+
+def time_it(func, repeat: int) -> float:
+    """Returns the best time in seconds over several runs of a function."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--synthetic", type=int, default=0, help="Number of synthetic polygons to use")
+    parser.add_argument("--n_workers", type=int, default=os.cpu_count())
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        gdf = synthetic_isochrones(args.synthetic)
+    else:
+        gdf = gpd.read_file(CLEAN_DIR / "_clean_run" / "plants_with_isochrones.geojson")
+        gdf = gdf.rename_geometry("isochrone")
+    print(f"Benchmarking with {len(gdf)} isochrones and {args.n_workers} workers")
+
+    results = {
+        "unary_union": time_it(lambda: gdf.geometry.unary_union, args.repeat),
+        "parallel_union": time_it(lambda: parallel_union(gdf.geometry, n_workers=args.n_workers), args.repeat),
+        "dissolve": time_it(lambda: gdf.dissolve(by="Parent Corporation"), args.repeat),
+        "parallel_dissolve": time_it(
+            lambda: parallel_dissolve(gdf, by="Parent Corporation", n_workers=args.n_workers), args.repeat
+        ),
+    }
+    for name, seconds in results.items():
+        print(f"{name:<20}{seconds:>10.2f}s")
+    print(f"Union speedup: {results['unary_union'] / results['parallel_union']:.1f}x")
+    print(f"Dissolve speedup: {results['dissolve'] / results['parallel_dissolve']:.1f}x")
@@ -0,0 +1,204 @@
+"""Record every plant and corporation each barn can reach as compact CSR arrays.
+
+Row i of a CSR array holds indices[offsets[i]:offsets[i + 1]], so the plants and corporations for
+every barn fit in two flat arrays each and can be looked up without any geometry work.
+"""
+
+import argparse
+from pathlib import Path
+from typing import NamedTuple
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from rafi.constants import WGS84
+
+ACCESS_FILENAME = "barn_access.npz"
+PLANTS_FILENAME = "plants_with_isochrones.geojson"
+PLANT_ID_COL = "plant_id"
+
+
+class BarnAccess(NamedTuple):
+    """Plants and corporations each barn can reach, as CSR arrays aligned with barn_index."""
+
+    barn_index: np.ndarray
+    plant_offsets: np.ndarray
+    plant_indices: np.ndarray
+    corp_offsets: np.ndarray
+    corp_indices: np.ndarray
+    plant_ids: np.ndarray
+    corporations: np.ndarray
+
+
+def to_csr(rows: np.ndarray, values: np.ndarray, n_rows: int) -> tuple[np.ndarray, np.ndarray]:
+    """Builds CSR arrays from (row, value) pairs, dropping duplicate pairs.
+
+    Args:
+        rows: Row of each pair.
+        values: Value of each pair.
+        n_rows: Number of rows.
+
+    Returns:
+        Tuple of (offsets, indices) with the values of each row sorted.
+    """
+    pairs = np.unique(np.column_stack([rows, values]).astype(np.int64), axis=0)
+    offsets = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pairs[:, 0], minlength=n_rows), out=offsets[1:])
+    return offsets, pairs[:, 1].astype(np.int32)
+
+
+def get_plant_ids(
+    gdf_plants: pd.DataFrame, id_col: str = "duns_number_fsis", tiebreak_col: str = "establishment_number"
+) -> np.ndarray:
+    """Gets a unique ID for each plant.
+
+    Several establishments can share a DUNS number, so plants with a shared ID get the tiebreak
+    column appended (e.g. "123456789-P123"). Plants that still don't have a unique ID, or every
+    plant if id_col is missing, are identified by their row.
+
+    Args:
+        gdf_plants: DataFrame of plants.
+        id_col: Column name for the plant ID.
+        tiebreak_col: Column name to tell apart plants with the same ID.
+
+    Returns:
+        Array of unique plant IDs as strings.
+    """
+    rows = pd.Series(np.arange(len(gdf_plants)).astype(str))
+    if id_col not in gdf_plants.columns:
+        return rows.to_numpy(dtype=str)
+    ids = pd.Series(gdf_plants[id_col].to_numpy()).astype("string")
+    if tiebreak_col in gdf_plants.columns:
+        tiebreaks = pd.Series(gdf_plants[tiebreak_col].to_numpy()).astype("string")
+        shared = ids.notna() & ids.duplicated(keep=False)
+        ids[shared] = ids[shared] + "-" + tiebreaks[shared]
+    invalid = ids.isna() | ids.duplicated(keep=False)
+    if invalid.any():
+        print(f"Identifying {invalid.sum()} plants without a unique {id_col} by their row")
+    ids[invalid] = rows[invalid]
+    return ids.to_numpy(dtype=str)
+
+
+def get_barn_access(
+    gdf_barns: gpd.GeoDataFrame,
+    gdf_plant_isochrones: gpd.GeoDataFrame,
+    corp_col: str = "Parent Corporation",
+    id_col: str = "duns_number_fsis",
+) -> BarnAccess:
+    """Finds every plant and corporation each barn can reach with one bulk spatial query.
+
+    Args:
+        gdf_barns: GeoDataFrame of barn points.
+        gdf_plant_isochrones: GeoDataFrame with one isochrone per plant (see get_plant_isochrones).
+        corp_col: Column name for the parent corporation.
+        id_col: Column name for the plant ID (see get_plant_ids). Pipeline runs save unique IDs
+            in PLANT_ID_COL.
+
+    Returns:
+        The plants and corporations for each barn. Plant indices are rows of
+        gdf_plant_isochrones.
+    """
+    if gdf_plant_isochrones.crs is None:
+        gdf_plant_isochrones = gdf_plant_isochrones.set_crs(WGS84)
+    # Buffer to fix invalid geometries
+    isochrones = gdf_plant_isochrones.geometry.to_crs(gdf_barns.crs).buffer(0).to_numpy()
+    barn_idx, plant_idx = shapely.STRtree(isochrones).query(gdf_barns.geometry.to_numpy(), predicate="within")
+
+    corps = pd.Categorical(gdf_plant_isochrones[corp_col])
+    plant_corps = corps.codes.astype(np.int64)
+    # Note: Plants without a corporation are still listed, but don't add a corporation
+    has_corp = plant_corps[plant_idx] >= 0
+
+    plant_offsets, plant_indices = to_csr(barn_idx, plant_idx, len(gdf_barns))
+    corp_offsets, corp_indices = to_csr(barn_idx[has_corp], plant_corps[plant_idx[has_corp]], len(gdf_barns))
+    return BarnAccess(
+        gdf_barns.index.to_numpy(),
+        plant_offsets,
+        plant_indices,
+        corp_offsets,
+        corp_indices,
+        # Note: Names aren't unique (e.g. several plants of one corporation in a city), so closures
+        # are looked up by ID
+        get_plant_ids(gdf_plant_isochrones, id_col),
+        np.asarray(corps.categories, dtype=str),
+    )
+
+
+def get_barn_corporations(access: BarnAccess, row: int) -> list[str]:
+    """Gets the corporations a barn can reach.
+
+    Args:
+        access: Barn access arrays.
+        row: Row of the barn (not its index label).
+
+    Returns:
+        List of corporation names.
+    """
+    indices = access.corp_indices[access.corp_offsets[row] : access.corp_offsets[row + 1]]
+    return access.corporations[indices].tolist()
+
+
+def get_barn_plants(access: BarnAccess, row: int) -> list[str]:
+    """Gets the plants a barn can reach.
+
+    Args:
+        access: Barn access arrays.
+        row: Row of the barn (not its index label).
+
+    Returns:
+        List of plant IDs.
+    """
+    indices = access.plant_indices[access.plant_offsets[row] : access.plant_offsets[row + 1]]
+    return access.plant_ids[indices].tolist()
+
+
+def count_corporations(access: BarnAccess) -> np.ndarray:
+    """Counts the corporations each barn can reach.
+
+    Args:
+        access: Barn access arrays.
+
+    Returns:
+        Number of corporations for each barn.
+    """
+    return np.diff(access.corp_offsets)
+
+
+def save_barn_access(access: BarnAccess, filepath: Path) -> None:
+    """Saves barn access arrays as a compressed NumPy sidecar file.
+
+    Args:
+        access: Barn access arrays.
+        filepath: Path to save the .npz file to.
+    """
+    print(f"Saving file to {filepath}")
+    np.savez_compressed(filepath, **access._asdict())
+
+
+def load_barn_access(filepath: Path) -> BarnAccess:
+    """Loads barn access arrays saved with save_barn_access.
+
+    Args:
+        filepath: Path to the .npz file.
+
+    Returns:
+        The barn access arrays.
+    """
+    with np.load(filepath, allow_pickle=False) as data:
+        return BarnAccess(**{field: data[field] for field in BarnAccess._fields})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find every plant and corporation each barn can reach")
+    parser.add_argument("run_dir", type=Path, help="Directory with barns.geojson and the plant isochrones")
+    parser.add_argument("--plants", type=Path, help=f"Plant isochrones. Defaults to {PLANTS_FILENAME} in run_dir")
+    args = parser.parse_args()
+
+    gdf_barns = gpd.read_file(args.run_dir / "barns.geojson")
+    gdf_plant_isochrones = gpd.read_file(args.plants or args.run_dir / PLANTS_FILENAME)
+    # Note: Older runs and plants straight from fsis_match only have the DUNS numbers
+    id_col = PLANT_ID_COL if PLANT_ID_COL in gdf_plant_isochrones.columns else "duns_number_fsis"
+    access = get_barn_access(gdf_barns, gdf_plant_isochrones, id_col=id_col)
+    save_barn_access(access, args.run_dir / ACCESS_FILENAME)
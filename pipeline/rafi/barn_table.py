@@ -0,0 +1,233 @@
+"""Compact table of barns backed by NumPy arrays, so filtering steps don't copy GeoDataFrames."""
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from pyproj import Transformer
+
+MISSING = -1  # Code for a missing state or parent corporation
+OUTPUT_COLS = ["state", "parent_corporation", "integrator_access", "geometry", "exclude", "exclude_reasons"]
+
+
+def merge_categories(categories: pd.Index, values: pd.Categorical | np.ndarray) -> tuple[pd.Index, np.ndarray]:
+    """Adds the categories of some values after the existing categories.
+
+    Existing categories keep their positions, so codes that were already stored stay valid.
+
+    Args:
+        categories: Existing categories.
+        values: Values to encode.
+
+    Returns:
+        Tuple of (categories, codes of values), where missing values get MISSING.
+    """
+    existing = pd.Categorical.from_codes(np.array([], dtype=np.int8), categories=categories)
+    merged = union_categoricals([existing, pd.Categorical(values)])
+    return merged.categories, merged.codes
+
+
+class BarnTable:
+    """Barn points and their attributes as NumPy arrays, with a mask of the rows still active.
+
+    Rows are never dropped or reordered. Steps that drop barns clear them from the active mask,
+    and the GeoDataFrame of active barns is only built once by to_geodataframe.
+    """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, crs: str, index: pd.Index | None = None) -> None:
+        """Creates a table of barns with no attributes set.
+
+        Args:
+            x: Point x coordinates.
+            y: Point y coordinates.
+            crs: CRS of the point coordinates.
+            index: Index labels for the output GeoDataFrame. Defaults to a range index.
+        """
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.crs = crs
+        n = len(self.x)
+        self.index = pd.RangeIndex(n) if index is None else pd.Index(index)
+        self.active = np.ones(n, dtype=bool)
+        self.exclude = np.zeros(n, dtype=bool)
+        self.exclude_reasons = np.zeros(n, dtype=np.uint32)
+        self.integrator_access = np.zeros(n, dtype=np.uint8)
+        self.state_codes = np.full(n, MISSING, dtype=np.int16)
+        self.state_categories = pd.Index([], dtype=object)
+        self.corp_codes = np.full(n, MISSING, dtype=np.int32)
+        self.corp_categories = pd.Index([], dtype=object)
+
+    def __len__(self) -> int:
+        """Number of active barns."""
+        return int(self.active.sum())
+
+    @classmethod
+    def from_points(cls, points: gpd.GeoSeries) -> "BarnTable":
+        """Creates a table from a GeoSeries of points.
+
+        Args:
+            points: GeoSeries of points.
+
+        Returns:
+            The table, with the same index as points.
+        """
+        return cls(points.x.to_numpy(), points.y.to_numpy(), points.crs, points.index)
+
+    @classmethod
+    def from_geodataframe(cls, gdf: gpd.GeoDataFrame) -> "BarnTable":
+        """Creates a table from a GeoDataFrame of points, keeping any output columns it has.
+
+        Args:
+            gdf: GeoDataFrame of points.
+
+        Returns:
+            The table, with the same index as gdf.
+        """
+        table = cls.from_points(gdf.geometry)
+        if "state" in gdf.columns:
+            table.set_states(gdf["state"].to_numpy())
+        if "parent_corporation" in gdf.columns:
+            table.set_corporations(gdf["parent_corporation"].to_numpy())
+        if "integrator_access" in gdf.columns:
+            table.integrator_access[:] = gdf["integrator_access"].to_numpy()
+        if "exclude" in gdf.columns:
+            table.exclude[:] = gdf["exclude"].to_numpy() == 1
+        if "exclude_reasons" in gdf.columns:
+            table.exclude_reasons[:] = gdf["exclude_reasons"].to_numpy()
+        return table
+
+    def to_crs(self, crs: str) -> "BarnTable":
+        """Reprojects the point coordinates in place.
+
+        Args:
+            crs: CRS to project to.
+
+        Returns:
+            The table.
+        """
+        if crs != self.crs:
+            transformer = Transformer.from_crs(self.crs, crs, always_xy=True)
+            self.x, self.y = transformer.transform(self.x, self.y)
+            self.crs = crs
+        return self
+
+    def rows(self, skip_excluded: bool = False) -> np.ndarray:
+        """Gets the positions of the active rows.
+
+        Args:
+            skip_excluded: Whether to skip rows that are already excluded.
+
+        Returns:
+            Array of row positions.
+        """
+        if skip_excluded:
+            return np.flatnonzero(self.active & ~self.exclude)
+        return np.flatnonzero(self.active)
+
+    def points(self, rows: np.ndarray | None = None) -> gpd.GeoSeries:
+        """Builds points for some rows.
+
+        Args:
+            rows: Row positions. Defaults to the active rows.
+
+        Returns:
+            GeoSeries of points with a range index aligned with rows.
+        """
+        rows = self.rows() if rows is None else rows
+        return gpd.GeoSeries.from_xy(self.x[rows], self.y[rows], crs=self.crs)
+
+    def keep(self, mask: np.ndarray) -> "BarnTable":
+        """Drops rows from the active rows.
+
+        Args:
+            mask: Boolean array over every row that is False for rows to drop.
+
+        Returns:
+            The table.
+        """
+        self.active &= mask
+        return self
+
+    def set_excluded(self, rows: np.ndarray, reason_bit: int = 0) -> "BarnTable":
+        """Marks rows as excluded and records why.
+
+        Args:
+            rows: Positions of the rows to exclude.
+            reason_bit: Bit to set in exclude_reasons for excluded rows, if any.
+
+        Returns:
+            The table.
+        """
+        self.exclude[rows] = True
+        if reason_bit:
+            self.exclude_reasons[rows] |= np.uint32(reason_bit)
+        return self
+
+    @property
+    def n_excluded(self) -> int:
+        """Number of active barns that are excluded."""
+        return int((self.active & self.exclude).sum())
+
+    def set_states(self, states: pd.Categorical | np.ndarray, rows: np.ndarray | None = None) -> "BarnTable":
+        """Stores the state of some rows as categorical codes.
+
+        Args:
+            states: States aligned with rows, such as the output of lookup_states.
+            rows: Row positions. Defaults to every row.
+
+        Returns:
+            The table.
+        """
+        self.state_categories, codes = merge_categories(self.state_categories, states)
+        self.state_codes[slice(None) if rows is None else rows] = codes
+        return self
+
+    def set_corporations(
+        self, corporations: pd.Categorical | np.ndarray, rows: np.ndarray | None = None
+    ) -> "BarnTable":
+        """Stores the parent corporation of some rows as categorical codes.
+
+        Args:
+            corporations: Parent corporations aligned with rows. Missing values are None.
+            rows: Row positions. Defaults to every row.
+
+        Returns:
+            The table.
+        """
+        self.corp_categories, codes = merge_categories(self.corp_categories, corporations)
+        self.corp_codes[slice(None) if rows is None else rows] = codes
+        return self
+
+    def get_states(self) -> np.ndarray:
+        """Gets the distinct states of the active rows.
+
+        Returns:
+            Array of state names.
+        """
+        codes = np.unique(self.state_codes[self.active])
+        return self.state_categories[codes[codes != MISSING]].to_numpy()
+
+    def to_geodataframe(self) -> gpd.GeoDataFrame:
+        """Builds the output GeoDataFrame of the active barns.
+
+        Returns:
+            GeoDataFrame with the output columns of filter_barns.
+        """
+        rows = self.rows()
+        corp_codes = self.corp_codes[rows]
+        parent_corporation = np.full(len(rows), None, dtype=object)
+        has_corp = corp_codes != MISSING
+        parent_corporation[has_corp] = self.corp_categories.to_numpy()[corp_codes[has_corp]]
+        gdf = gpd.GeoDataFrame(
+            {
+                "state": pd.Categorical.from_codes(self.state_codes[rows], categories=self.state_categories),
+                "parent_corporation": parent_corporation,
+                "integrator_access": self.integrator_access[rows].astype(int),  # Dashboard expects int dtype
+                "geometry": gpd.points_from_xy(self.x[rows], self.y[rows]),
+                "exclude": self.exclude[rows].astype(int),
+                "exclude_reasons": self.exclude_reasons[rows],
+            },
+            index=self.index[rows],
+            crs=self.crs,
+        )
+        return gdf[OUTPUT_COLS]
@@ -0,0 +1,154 @@
+"""Cache for preprocessed pipeline inputs that are slow to rebuild."""
+
+import hashlib
+import json
+from pathlib import Path
+
+import geopandas as gpd
+import pyarrow.parquet as pq
+from pyproj import CRS, Transformer
+
+from rafi.constants import CACHE_DIR
+
+BBOX_COLUMNS = ["minx", "miny", "maxx", "maxy"]
+
+
+def get_fingerprint(filepath: Path) -> str:
+    """Fingerprint a file (or every file in a directory, like a .gdb) by name, size, and modification time.
+
+    Args:
+        filepath: Path to the file or directory.
+
+    Returns:
+        Hex digest that changes whenever the file changes.
+    """
+    filepath = Path(filepath)
+    if filepath.is_dir():
+        files = sorted(path for path in filepath.rglob("*") if path.is_file())
+    else:
+        files = [filepath]
+    digest = hashlib.sha256()
+    for file in files:
+        stat = file.stat()
+        digest.update(
+            f"{file.relative_to(filepath.parent)}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+        )
+    return digest.hexdigest()
+
+
+def get_cache_key(filepaths: list[Path], **params) -> str:
+    """Build a cache key from source files and the parameters used to process them.
+
+    Args:
+        filepaths: Source files the cached data is built from.
+        **params: Processing parameters. These must be JSON serializable (or convertible with str).
+
+    Returns:
+        Short hex digest to use in the cache filename.
+    """
+    digest = hashlib.sha256()
+    for filepath in filepaths:
+        digest.update(get_fingerprint(filepath).encode())
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return digest.hexdigest()[:16]
+
+
+def get_cache_path(name: str, key: str, suffix: str = ".parquet", cache_dir: Path = CACHE_DIR) -> Path:
+    """Get the path for a cached file.
+
+    Args:
+        name: Human readable name for the cached data (e.g. the filter description).
+        key: Cache key from get_cache_key.
+        suffix: File extension.
+        cache_dir: Directory for cached files.
+
+    Returns:
+        Path to the cached file.
+    """
+    slug = "_".join(name.lower().split())
+    return cache_dir / f"{slug}_{key}{suffix}"
+
+
+def transform_bounds(bbox: tuple, bbox_crs: str, crs: str) -> tuple:
+    """Transform bounds to another CRS.
+
+    Args:
+        bbox: Bounds as (minx, miny, maxx, maxy).
+        bbox_crs: CRS of bbox.
+        crs: CRS to transform to.
+
+    Returns:
+        Bounds in crs that cover bbox.
+    """
+    return Transformer.from_crs(bbox_crs, crs, always_xy=True).transform_bounds(*bbox)
+
+
+def read_cached_geoparquet(
+    name: str,
+    key: str,
+    cache_dir: Path = CACHE_DIR,
+    bbox: tuple | None = None,
+    bbox_crs: str | None = None,
+) -> gpd.GeoDataFrame | None:
+    """Read cached geometries if they exist.
+
+    Args:
+        name: Human readable name for the cached data.
+        key: Cache key from get_cache_key.
+        cache_dir: Directory for cached files.
+        bbox: Bounds of an area of interest. Only rows whose bounding boxes overlap it are read,
+            and row groups outside of it are skipped. Reads every row if None.
+        bbox_crs: CRS of bbox.
+
+    Returns:
+        The cached GeoDataFrame, or None on a cache miss.
+    """
+    filepath = get_cache_path(name, key, cache_dir=cache_dir)
+    if not filepath.exists():
+        return None
+    print(f"Reading cached file {filepath}")
+    filters = None
+    if bbox is not None:
+        metadata = json.loads(pq.read_schema(filepath).metadata[b"geo"])
+        crs = metadata["columns"][metadata["primary_column"]].get("crs")
+        # Note: GeoParquet geometries without a CRS are in longitude and latitude
+        minx, miny, maxx, maxy = transform_bounds(bbox, bbox_crs, CRS.from_json_dict(crs) if crs else "OGC:CRS84")
+        filters = [("maxx", ">=", minx), ("minx", "<=", maxx), ("maxy", ">=", miny), ("miny", "<=", maxy)]
+    gdf = gpd.read_parquet(filepath, filters=filters)
+    return gdf.drop(columns=BBOX_COLUMNS)
+
+
+def write_cached_geoparquet(
+    gdf: gpd.GeoDataFrame,
+    name: str,
+    key: str,
+    cache_dir: Path = CACHE_DIR,
+    row_group_size: int = 10000,
+) -> None:
+    """Write geometries to the cache as GeoParquet.
+
+    Rows are sorted along a Hilbert curve and stored with their bounding boxes, so each row group
+    covers a compact area. This makes loading a spatial index from the cache fast and lets readers
+    skip row groups outside of an area of interest.
+
+    Args:
+        gdf: GeoDataFrame to cache.
+        name: Human readable name for the cached data.
+        key: Cache key from get_cache_key.
+        cache_dir: Directory for cached files.
+        row_group_size: Number of rows per Parquet row group.
+    """
+    Path.mkdir(cache_dir, parents=True, exist_ok=True)
+    filepath = get_cache_path(name, key, cache_dir=cache_dir)
+
+    gdf = gdf[~(gdf.geometry.is_empty | gdf.geometry.isna())]
+    if len(gdf) > 0:
+        gdf = gdf.iloc[gdf.geometry.hilbert_distance().argsort(kind="stable")]
+    gdf = gdf.reset_index(drop=True)
+    gdf[BBOX_COLUMNS] = gdf.geometry.bounds.to_numpy()
+
+    # Note: Write to a temporary file first so an interrupted run doesn't leave a partial cache
+    tmp_filepath = filepath.with_suffix(".tmp")
+    print(f"Caching file to {filepath}")
+    gdf.to_parquet(tmp_filepath, row_group_size=row_group_size)
+    tmp_filepath.replace(filepath)
@@ -4,14 +4,112 @@ from datetime import datetime
 from pathlib import Path
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import shapely
 from tqdm import tqdm
 
-from rafi.constants import CLEAN_DIR, GDF_STATES, STATE2ABBREV, WGS84
+from rafi.constants import CLEAN_DIR, CONUS_ALBERS, GDF_STATES, STATE2ABBREV, WGS84
+from rafi.geometry import parallel_dissolve, parallel_union
 from rafi.utils import save_file
 
 tqdm.pandas()
 
+SQ_METERS_PER_SQ_KM = 1_000_000
+
+
+def get_corp_overlap_matrix(
+    gdf_corps: gpd.GeoDataFrame,
+    corp_col: str = "Parent Corporation",
+) -> pd.DataFrame:
+    """Calculates the overlapping area for every pair of corporations.
+
+    Args:
+        gdf_corps: GeoDataFrame with one dissolved isochrone per corporation.
+        corp_col: Column name for the parent corporation.
+
+    Returns:
+        Square DataFrame of overlap areas in km² indexed by corporation on both axes.
+        The diagonal is the total area for each corporation.
+    """
+    corps = gdf_corps[corp_col].to_numpy()
+    geoms = gdf_corps.geometry.to_crs(CONUS_ALBERS).to_numpy()
+
+    # Only intersect the candidate pairs from the spatial index and calculate each pair once
+    left, right = shapely.STRtree(geoms).query(geoms, predicate="intersects")
+    upper = left <= right
+    left, right = left[upper], right[upper]
+    areas = (
+        shapely.area(shapely.intersection(geoms[left], geoms[right]))
+        / SQ_METERS_PER_SQ_KM
+    )
+
+    matrix = np.zeros((len(corps), len(corps)))
+    matrix[left, right] = areas
+    matrix[right, left] = areas
+    return pd.DataFrame(matrix, index=corps, columns=corps)
+
+
+def calculate_area_metrics(
+    isochrones: gpd.GeoDataFrame,
+    gdf_corps: gpd.GeoDataFrame,
+    corp_col: str = "Parent Corporation",
+    access_col: str = "corp_access",
+) -> pd.DataFrame:
+    """Calculates the area with access to one, two, or three or more corporations by state and by corporation.
+
+    Args:
+        isochrones: GeoDataFrame of captured areas from calculate_captured_areas.
+        gdf_corps: GeoDataFrame with one dissolved isochrone per corporation.
+        corp_col: Column name for the parent corporation.
+        access_col: Column name for the corporation access level.
+
+    Returns:
+        DataFrame with "group" ("state" or "corporation"), "name", access level, and "area_km2" columns.
+    """
+    isochrones = isochrones.to_crs(CONUS_ALBERS)
+    isochrones["area_km2"] = isochrones.area / SQ_METERS_PER_SQ_KM
+
+    by_state = isochrones.groupby(["state", access_col], as_index=False)[
+        "area_km2"
+    ].sum()
+    by_state = by_state.rename(columns={"state": "name"})
+    by_state["group"] = "state"
+
+    # Single corporation areas already belong to a corporation, but areas with access
+    # to multiple corporations have to be split up by their overlap with each corporation
+    single_corp = isochrones[isochrones[access_col] == 1]
+    by_corp_single = single_corp.groupby([corp_col, access_col], as_index=False)[
+        "area_km2"
+    ].sum()
+
+    multi_corp = isochrones[isochrones[access_col] > 1]
+    multi_geoms = multi_corp.geometry.to_numpy()
+    corp_geoms = gdf_corps.geometry.to_crs(CONUS_ALBERS).to_numpy()
+    corp_idx, multi_idx = shapely.STRtree(multi_geoms).query(
+        corp_geoms, predicate="intersects"
+    )
+    by_corp_multi = pd.DataFrame(
+        {
+            corp_col: gdf_corps[corp_col].to_numpy()[corp_idx],
+            access_col: multi_corp[access_col].to_numpy()[multi_idx],
+            "area_km2": shapely.area(
+                shapely.intersection(corp_geoms[corp_idx], multi_geoms[multi_idx])
+            )
+            / SQ_METERS_PER_SQ_KM,
+        }
+    )
+    by_corp = (
+        pd.concat([by_corp_single, by_corp_multi], ignore_index=True)
+        .groupby([corp_col, access_col], as_index=False)["area_km2"]
+        .sum()
+    )
+    by_corp = by_corp.rename(columns={corp_col: "name"})
+    by_corp["group"] = "corporation"
+
+    area_metrics = pd.concat([by_state, by_corp], ignore_index=True)
+    return area_metrics[["group", "name", access_col, "area_km2"]]
+
 
 def calculate_captured_areas(
     gdf_fsis: gpd.GeoDataFrame,
@@ -20,7 +118,8 @@ def calculate_captured_areas(
     access_col: str = "corp_access",
     simplify_tol: float = 0.01,
     multi_corp_threshold: int = 3,
-) -> gpd.GeoDataFrame:
+    return_area_metrics: bool = False,
+) -> gpd.GeoDataFrame | tuple[gpd.GeoDataFrame, pd.DataFrame, pd.DataFrame]:
     """Calculates captured areas for each parent corporation and determines areas with access to one, two, or three or more corporations
 
     Args:
@@ -30,17 +129,17 @@ def calculate_captured_areas(
         access_col: Column name for the corporation access level.
         simplify_tol: Tolerance for simplifying geometries.
         multi_corp_threshold: The minimum number of corporations to count as multi corp access.
+        return_area_metrics: Whether to also return the area metrics and corporation overlap matrix.
 
 
     Returns:
-        GeoDataFrame with captured areas for each parent corporation.
+        GeoDataFrame with captured areas for each parent corporation. If return_area_metrics is set,
+        a tuple of (captured areas, area metrics, corporation overlap matrix).
     """
     gdf_fsis = gdf_fsis.set_geometry(chrone_col).set_crs(WGS84)
 
     # Dissolve by parent corporation to calculate access on a corporation (not plant) level
-    gdf_single_corp_dissolved = gdf_fsis.dissolve(by=corp_col).reset_index()[
-        [corp_col, chrone_col]
-    ]
+    gdf_single_corp_dissolved = parallel_dissolve(gdf_fsis, by=corp_col)
 
     # Self join to find intersections in corporate access
     intersections = gpd.sjoin(
@@ -83,7 +182,9 @@ def calculate_captured_areas(
     intersections_filtered = intersections_filtered.reset_index(drop=True)
 
     print("Calculating single corporation access...")
-    multi_corp_access_area = intersections_filtered["intersection_geometry"].unary_union
+    multi_corp_access_area = parallel_union(
+        intersections_filtered["intersection_geometry"]
+    )
     # Take the difference between each corporate area and the area with access to more than one corp
     # This is the area that has access to only one corporation
     # Note: Make a copy so we can update this and save it in the isochrones
@@ -147,11 +248,10 @@ def calculate_captured_areas(
     multi_corp_intersections["3+ Area"] = multi_corp_intersections[
         "geometry_saved_right"
     ].intersection(multi_corp_intersections["geometry_saved_left"])
-    three_plus_corp_access_area = multi_corp_intersections["3+ Area"].unary_union
+    three_plus_corp_access_area = parallel_union(multi_corp_intersections["3+ Area"])
 
     # Two corp access area is the area with multi corp access minus the area with 3+ corp access
     print("Calculating two corporation access...")
-    multi_corp_access_area = intersections_filtered["intersection_geometry"].unary_union
     two_corp_access_area = multi_corp_access_area.difference(
         three_plus_corp_access_area
     )
@@ -177,6 +277,14 @@ def calculate_captured_areas(
     isochrones["state"] = isochrones["state"].map(STATE2ABBREV)
     isochrones["geometry"] = isochrones.simplify(simplify_tol)
 
+    if return_area_metrics:
+        print("Calculating area metrics...")
+        area_metrics = calculate_area_metrics(
+            isochrones, gdf_single_corp_dissolved, corp_col, access_col
+        )
+        overlap_matrix = get_corp_overlap_matrix(gdf_single_corp_dissolved, corp_col)
+        return isochrones, area_metrics, overlap_matrix
+
     return isochrones
 
 
@@ -192,7 +300,13 @@ if __name__ == "__main__":
 
     # Note: Since we are loading raw GeoJSON, rename "geometry" to match the expected from of GDF passed to function
     gdf_fsis["isochrone"] = gdf_fsis["geometry"]
-    isochrones = calculate_captured_areas(gdf_fsis)
+    isochrones, area_metrics, overlap_matrix = calculate_captured_areas(
+        gdf_fsis, return_area_metrics=True
+    )
 
     print(f"Saving to {RUN_DIR}/isochrones.geojson")
     save_file(isochrones, RUN_DIR / "isochrones.geojson", gzip_file=True)
+    save_file(area_metrics, RUN_DIR / "area_metrics.csv", file_format="csv")
+    save_file(
+        overlap_matrix, RUN_DIR / "corp_overlap_matrix.csv", file_format="csv", index=True
+    )
@@ -12,6 +12,7 @@ DATA_DIR = PIPELINE_DIR.parent / "data"
 CLEAN_DIR = DATA_DIR / "clean"
 RAW_DIR = DATA_DIR / "raw"
 SHAPEFILE_DIR = DATA_DIR / "shapefiles"
+CACHE_DIR = DATA_DIR / "cache"
 
 # dataframe columns
 with Path.open(PACKAGE_DIR / "config_dataframes.yaml") as file:
@@ -25,6 +26,7 @@ HTML_DIR = DATA_DIR / "html"
 
 # mapping
 ALBERS_EQUAL_AREA = "EPSG:9822"
+CONUS_ALBERS = "EPSG:5070"  # units are meters, so use this for buffers, distances, and areas
 WGS84 = "EPSG:4326"
 USA_LAT = 37.0902
 USA_LNG = -95.7129
@@ -0,0 +1,196 @@
+"""Run barn filtering on dask-geopandas partitions for barn datasets that don't fit in memory.
+
+This is optional and needs dask-geopandas. The pandas path in filter_barns is the default.
+"""
+
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from pyogrio import read_info
+
+from rafi.cache import transform_bounds
+from rafi.constants import ALBERS_EQUAL_AREA, CONUS_ALBERS, GDF_STATES, SHAPEFILE_DIR
+from rafi.filter_barns import LayerExtent, build_shared_caches, filter_partition, get_bounds
+from rafi.partition import get_partitions
+from rafi.states import get_state_categories
+
+CELL_COL = "_cell"
+CORE_COL = "_core"
+STATE_DTYPE = pd.CategoricalDtype(get_state_categories())
+OUTPUT_META = gpd.GeoDataFrame(
+    {
+        "state": pd.Series(dtype=STATE_DTYPE),
+        "parent_corporation": pd.Series(dtype=object),
+        "integrator_access": pd.Series(dtype=int),
+        "geometry": gpd.GeoSeries(dtype="geometry"),
+        "exclude": pd.Series(dtype=int),
+        "exclude_reasons": pd.Series(dtype=np.uint32),
+    },
+    crs="EPSG:4326",
+)
+
+
+def assign_cells(
+    gdf: gpd.GeoDataFrame, partition_size: float, halo: float
+) -> gpd.GeoDataFrame:
+    """Projects barns to centroids and assigns each one to a grid cell.
+
+    Barns near the edge of another cell are repeated as halo rows for that cell, so each cell
+    has every barn it needs for the nearest neighbor test.
+
+    Args:
+        gdf: GeoDataFrame of barns.
+        partition_size: Width of each cell in meters.
+        halo: Distance outside of each cell to include barns in its halo.
+
+    Returns:
+        GeoDataFrame of barn centroids in ALBERS_EQUAL_AREA with cell and core columns.
+    """
+    centroids = gdf.geometry.to_crs(ALBERS_EQUAL_AREA).centroid
+    gdf = gpd.GeoDataFrame(geometry=centroids, index=gdf.index, crs=ALBERS_EQUAL_AREA)
+    coords = shapely.get_coordinates(gdf.geometry.to_numpy())
+    if len(coords) == 0:
+        return gdf.assign(**{CELL_COL: pd.Series(dtype=str), CORE_COL: pd.Series(dtype=bool)})
+
+    parts = []
+    for partition in get_partitions(coords[:, 0], coords[:, 1], partition_size, halo=halo):
+        cell = "{:.0f}_{:.0f}".format(*partition.bounds[:2])
+        parts.append(gdf.iloc[partition.core].assign(**{CELL_COL: cell, CORE_COL: True}))
+        parts.append(gdf.iloc[partition.halo].assign(**{CELL_COL: cell, CORE_COL: False}))
+    return pd.concat(parts)
+
+
+def get_file_extent(filepath: Path, gdf_states: gpd.GeoDataFrame = GDF_STATES) -> LayerExtent:
+    """Gets the area to load exclusion layers for from the bounds of a barns file.
+
+    Note: The barns' states aren't known until the file is read, so every state that overlaps
+    the bounds is kept.
+
+    Args:
+        filepath: Path to the barns file.
+        gdf_states: GeoDataFrame of states.
+
+    Returns:
+        The bounds of the file and the states they overlap.
+    """
+    info = read_info(filepath, force_total_bounds=True)
+    bounds = gpd.GeoSeries(
+        [shapely.box(*transform_bounds(info["total_bounds"], info["crs"], CONUS_ALBERS))], crs=CONUS_ALBERS
+    )
+    states = gdf_states.loc[gdf_states.intersects(bounds.to_crs(gdf_states.crs).iloc[0]), "ABBREV"]
+    return LayerExtent(get_bounds(bounds), sorted(states.dropna().unique()))
+
+
+def filter_cells(
+    gdf: gpd.GeoDataFrame, gdf_isochrones: gpd.GeoDataFrame, **kwargs
+) -> gpd.GeoDataFrame:
+    """Runs the barn filtering steps on each whole cell in a dask partition.
+
+    Args:
+        gdf: GeoDataFrame of barn centroids with cell and core columns (see assign_cells).
+        gdf_isochrones: GeoDataFrame of isochrones.
+        **kwargs: Arguments for filter_partition.
+
+    Returns:
+        Filtered GeoDataFrame of barns with the same columns as filter_barns.
+    """
+    # Note: Shuffled partitions can come back as plain DataFrames with a geometry column
+    gdf = gpd.GeoDataFrame(gdf, geometry="geometry", crs=ALBERS_EQUAL_AREA)
+    parts = []
+    for _, cell in gdf.groupby(CELL_COL, sort=False):
+        # Note: filter_partition expects the barns in the cell first, then the halo
+        cell = pd.concat([cell[cell[CORE_COL]], cell[~cell[CORE_COL]]])
+        result = filter_partition(
+            cell.drop(columns=[CELL_COL, CORE_COL]),
+            gdf_isochrones,
+            n_core=int(cell[CORE_COL].sum()),
+            **kwargs,
+        )
+        # Note: Cells only differ in which categories are used, so they combine as categoricals
+        parts.append(result.astype({"state": STATE_DTYPE}))
+    if not parts:
+        return OUTPUT_META
+    return gpd.GeoDataFrame(pd.concat(parts), crs=OUTPUT_META.crs)
+
+
+def filter_barns_dask(
+    filepath: Path,
+    gdf_isochrones: gpd.GeoDataFrame,
+    shapefile_dir: Path = SHAPEFILE_DIR,
+    nearest_neighbor: int = 50,
+    min_neighbors: int = 1,
+    filter_barns: bool = True,
+    skip_excluded: bool = True,
+    partition_size: float = 200000,
+    npartitions: int = 64,
+    scheduler: str = "processes",
+    output_path: Path | None = None,
+) -> gpd.GeoDataFrame | None:
+    """Filter barns read straight from a file with dask-geopandas.
+
+    Barns are read in partitions, projected to centroids, and shuffled so every grid cell (and
+    its halo) ends up in one dask partition. Each partition then runs the same steps as
+    filter_barns, so the outputs match the pandas path. Exclusion layers are cached once for the
+    bounds of the file, and each cell reads only the cached features near its barns.
+
+    Args:
+        filepath: Path to the barns file.
+        gdf_isochrones: GeoDataFrame of isochrones.
+        shapefile_dir: Directory containing shapefiles.
+        nearest_neighbor: Distance to check for nearest neighbor in meters.
+        min_neighbors: Minimum number of other barns within nearest_neighbor to keep a barn.
+        filter_barns: Flag to apply geospatial filtering on barns.
+        skip_excluded: Whether to skip barns that an earlier filter already excluded.
+        partition_size: Width of each grid cell in meters.
+        npartitions: Number of partitions to read the barns file in.
+        scheduler: Local dask scheduler to use ("threads", "processes", or "synchronous").
+        output_path: If set, write the filtered barns to this GeoParquet directory partition by
+            partition instead of returning them.
+
+    Returns:
+        Filtered GeoDataFrame of barns in the same order as the file, or None if output_path
+        is set.
+    """
+    # Note: dask-geopandas is optional, so only import it when this backend is used
+    import dask
+    import dask_geopandas
+
+    extent = get_file_extent(filepath) if filter_barns else None
+    build_shared_caches(shapefile_dir, filter_barns, extent)
+    ddf = dask_geopandas.read_file(filepath, npartitions=npartitions)
+    ddf = ddf.map_partitions(
+        assign_cells,
+        partition_size,
+        nearest_neighbor,
+        meta=gpd.GeoDataFrame(
+            {
+                "geometry": gpd.GeoSeries(dtype="geometry"),
+                CELL_COL: pd.Series(dtype=str),
+                CORE_COL: pd.Series(dtype=bool),
+            },
+            crs=ALBERS_EQUAL_AREA,
+        ),
+    )
+    ddf = ddf.shuffle(CELL_COL)
+    ddf = ddf.map_partitions(
+        filter_cells,
+        # Note: Wrap the isochrones so dask sends them to every partition instead of aligning
+        # them with the barns as another dataframe
+        dask.delayed(gdf_isochrones, pure=True),
+        shapefile_dir=shapefile_dir,
+        nearest_neighbor=nearest_neighbor,
+        min_neighbors=min_neighbors,
+        filter_barns=filter_barns,
+        skip_excluded=skip_excluded,
+        extent=extent,
+        meta=OUTPUT_META,
+    )
+
+    with dask.config.set(scheduler=scheduler):
+        if output_path is not None:
+            ddf.to_parquet(output_path)
+            return None
+        return ddf.compute().sort_index()
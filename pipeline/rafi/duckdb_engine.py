@@ -0,0 +1,353 @@
+"""Run barn filtering as SQL in an embedded DuckDB database with the spatial extension.
+
+DuckDB spills to disk and uses every core, so barns never need to fit in memory. This is
+optional and needs duckdb. The pandas path in filter_barns is the default.
+"""
+
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from pyogrio import open_arrow
+
+from rafi.constants import ALBERS_EQUAL_AREA, CACHE_DIR, CONUS_ALBERS, GDF_STATES, SHAPEFILE_DIR, WGS84
+from rafi.exclude_reasons import CITIES_REASON, get_reason_names
+from rafi.filter_barns import (
+    cities_by_state,
+    get_query_distance,
+    get_tiled_layer,
+    load_city_polygons,
+    load_exclusion_layer,
+)
+
+# Offsets to the 3x3 block of grid cells around a cell, for the nearest neighbor join
+NEIGHBOR_CELLS_SQL = "SELECT * FROM range(-1, 2) AS dx(dx), range(-1, 2) AS dy(dy)"
+
+
+def connect(database: str | Path = ":memory:", threads: int | None = None, memory_limit: str | None = None):
+    """Opens a DuckDB database with the spatial extension loaded.
+
+    Args:
+        database: Path to the database file, or ":memory:" for a temporary database.
+        threads: Number of threads to use. Defaults to the number of CPUs.
+        memory_limit: Memory limit (e.g. "16GB"). Larger intermediate results spill to disk.
+
+    Returns:
+        The DuckDB connection.
+    """
+    # Note: duckdb is optional, so only import it when this engine is used
+    import duckdb
+
+    con = duckdb.connect(str(database))
+    try:
+        # Note: duckdb-extension-spatial ships the extension in a wheel, so it doesn't need to be
+        # downloaded when the connection is opened
+        from duckdb_extensions import import_extension
+
+        import_extension("spatial", con=con)
+    except ImportError:
+        con.execute("INSTALL spatial")
+    con.execute("LOAD spatial")
+    con.execute(f"SET temp_directory = '{CACHE_DIR / 'duckdb_tmp'}'")
+    if threads is not None:
+        con.execute(f"SET threads = {int(threads)}")
+    if memory_limit is not None:
+        con.execute(f"SET memory_limit = '{memory_limit}'")
+    return con
+
+
+def load_geometries(con, name: str, gdf: gpd.GeoDataFrame, columns: list | None = None) -> None:
+    """Loads a GeoDataFrame into a table in CONUS_ALBERS with an R-tree index on its geometry.
+
+    Args:
+        con: DuckDB connection.
+        name: Table name.
+        gdf: GeoDataFrame to load.
+        columns: Attribute columns to keep. Defaults to none.
+    """
+    columns = columns or []
+    df = pd.DataFrame(gdf[columns]).assign(wkb=shapely.to_wkb(gdf.geometry.to_crs(CONUS_ALBERS).to_numpy()))
+    df = df.rename(columns={column: f"col_{i}" for i, column in enumerate(columns)})
+    selected = "".join(f', col_{i} AS "{column}"' for i, column in enumerate(columns))
+    con.register(f"{name}_df", df)
+    con.execute(
+        f"CREATE OR REPLACE TABLE {name} AS "  # noqa: S608
+        f"SELECT ST_GeomFromWKB(wkb) AS geom{selected} FROM {name}_df WHERE wkb IS NOT NULL"
+    )
+    con.unregister(f"{name}_df")
+    con.execute(f"CREATE INDEX {name}_rtree ON {name} USING RTREE (geom)")
+
+
+def load_barns(con, filepath: Path, chunk_size: int = 500000) -> None:
+    """Loads barn centroids in ALBERS_EQUAL_AREA straight from a file into the barns table.
+
+    The file is streamed into DuckDB as Arrow record batches with the feature ID of each barn,
+    so barn_id is the position of the barn in the file however the scan is scheduled.
+    Centroids are computed in the same CRS as the pandas path (see read_barn_centroids).
+
+    Args:
+        con: DuckDB connection.
+        filepath: Path to the barns file.
+        chunk_size: Number of barns to stream at a time.
+    """
+    with open_arrow(filepath, columns=[], return_fids=True, batch_size=chunk_size, use_pyarrow=True) as (
+        meta,
+        reader,
+    ):
+        fid_column = meta["fid_column"] or "OGC_FID"
+        geometry_name = meta["geometry_name"] or "wkb_geometry"
+        # Note: DuckDB reads the GeoArrow WKB column as a GEOMETRY
+        con.register("barns_source", reader)
+        con.execute(
+            "CREATE OR REPLACE TABLE barns AS "  # noqa: S608
+            f'SELECT (row_number() OVER (ORDER BY "{fid_column}")) - 1 AS barn_id, '
+            f'ST_Centroid(ST_Transform("{geometry_name}", ?, ?, always_xy := true)) AS geom '
+            "FROM barns_source",
+            [meta["crs"] or WGS84, ALBERS_EQUAL_AREA],
+        )
+        con.unregister("barns_source")
+
+
+def exclude_isolated_barns(con, distance: float = 50, min_neighbors: int = 1) -> None:
+    """Keeps only barns with enough other barns nearby in the kept table.
+
+    Barns are bucketed into grid cells the size of the search distance, so the neighbor search
+    is an equi-join on the 3x3 block of cells around each barn. Distances are measured in
+    ALBERS_EQUAL_AREA like the pandas path, and kept barns are projected to CONUS_ALBERS for
+    the spatial joins.
+
+    Args:
+        con: DuckDB connection.
+        distance: Distance to search for neighbors in meters.
+        min_neighbors: Minimum number of other barns required within the distance.
+    """
+    con.execute(
+        f"""
+        CREATE OR REPLACE TABLE kept AS
+        WITH cells AS (
+            SELECT barn_id, geom, ST_X(geom) AS x, ST_Y(geom) AS y,
+                floor(ST_X(geom) / $distance)::BIGINT AS cx, floor(ST_Y(geom) / $distance)::BIGINT AS cy
+            FROM barns
+        ),
+        neighbors AS (
+            SELECT a.barn_id
+            FROM cells a, ({NEIGHBOR_CELLS_SQL}) offsets
+            JOIN cells b ON b.cx = a.cx + offsets.dx AND b.cy = a.cy + offsets.dy
+            WHERE a.barn_id != b.barn_id
+                AND (a.x - b.x) * (a.x - b.x) + (a.y - b.y) * (a.y - b.y) <= $distance * $distance
+            GROUP BY a.barn_id
+            HAVING count(*) >= $min_neighbors
+        )
+        SELECT cells.barn_id, ST_Transform(cells.geom, $crs, $join_crs, always_xy := true) AS geom
+        FROM cells SEMI JOIN neighbors USING (barn_id)
+        """,  # noqa: S608
+        {"distance": distance, "min_neighbors": min_neighbors, "crs": ALBERS_EQUAL_AREA, "join_crs": CONUS_ALBERS},
+    )
+
+
+def add_integrator_access(
+    con,
+    gdf_isochrones: gpd.GeoDataFrame,
+    access_col: str = "corp_access",
+    corp_col: str = "Parent Corporation",
+) -> None:
+    """Joins kept barns with captured areas, dropping barns without integrator access.
+
+    Args:
+        con: DuckDB connection.
+        gdf_isochrones: GeoDataFrame of captured areas with access levels.
+        access_col: Column name for the corporation access level.
+        corp_col: Column name for the parent corporation.
+    """
+    # Buffer to fix invalid geometries
+    gdf_isochrones = gdf_isochrones.set_geometry(gdf_isochrones.geometry.buffer(0))
+    load_geometries(con, "isochrones", gdf_isochrones, [access_col, corp_col])
+    # Note: Areas are messy buffered geometries, so a barn can be in more than one.
+    # Take the highest access level for each barn.
+    con.execute(
+        f"""
+        CREATE OR REPLACE TABLE barns_access AS
+        SELECT k.barn_id, any_value(k.geom) AS geom,
+            max(i."{access_col}")::INTEGER AS integrator_access,
+            any_value(i."{corp_col}") FILTER (WHERE i."{access_col}" = 1) AS parent_corporation
+        FROM kept k JOIN isochrones i ON ST_Within(k.geom, i.geom)
+        GROUP BY k.barn_id
+        """  # noqa: S608
+    )
+
+
+def add_states(con, gdf_states: gpd.GeoDataFrame = GDF_STATES) -> None:
+    """Adds the state each barn is in, taking the first state for barns on a border.
+
+    Args:
+        con: DuckDB connection.
+        gdf_states: GeoDataFrame of states.
+    """
+    gdf_states = gdf_states.assign(state_id=np.arange(len(gdf_states)))
+    load_geometries(con, "states", gdf_states, ["state_id", "ABBREV"])
+    con.execute(
+        """
+        CREATE OR REPLACE TABLE barns_out AS
+        SELECT b.*, s.state, 0 AS exclude, 0::UINTEGER AS exclude_reasons
+        FROM barns_access b
+        LEFT JOIN (
+            SELECT b.barn_id, arg_min(s."ABBREV", s.state_id) AS state
+            FROM barns_access b JOIN states s ON ST_Intersects(b.geom, s.geom)
+            GROUP BY b.barn_id
+        ) s USING (barn_id)
+        """
+    )
+
+
+def apply_filter(
+    con, table: str, reason_bit: int, how: str = "inside", distance: float = 0, skip_excluded: bool = True
+) -> int:
+    """Excludes barns in (or near) the geometries in a table.
+
+    Args:
+        con: DuckDB connection.
+        table: Table of exclusion geometries with an R-tree index.
+        reason_bit: Bit to set in exclude_reasons for excluded barns.
+        how: Method of filtering ("inside" or "outside").
+        distance: If greater than 0, barns within this distance of a geometry are members.
+        skip_excluded: Whether to skip barns that an earlier filter already excluded.
+
+    Returns:
+        Number of barns excluded.
+    """
+    if how not in ["inside", "outside"]:
+        raise ValueError(f"Unsupported filter method {how}. Use 'inside' or 'outside'.")
+    predicate = f"ST_DWithin(b.geom, e.geom, {float(distance)})" if distance > 0 else "ST_Within(b.geom, e.geom)"
+    membership = "IN" if how == "inside" else "NOT IN"
+    skip = "AND exclude = 0" if skip_excluded else ""
+    return con.execute(
+        f"""
+        UPDATE barns_out SET exclude = 1, exclude_reasons = exclude_reasons | {int(reason_bit)}
+        WHERE barn_id {membership} (SELECT DISTINCT b.barn_id FROM barns_out b JOIN {table} e ON {predicate}) {skip}
+        """  # noqa: S608
+    ).fetchone()[0]
+
+
+def apply_filters(
+    con,
+    filters_config: list,
+    shapefile_dir: Path = SHAPEFILE_DIR,
+    use_cache: bool = True,
+    skip_excluded: bool = True,
+) -> None:
+    """Applies the major cities filter and every configured filter to the barns_out table.
+
+    Exclusion layers go through the same preprocessing (and cache) as the pandas path.
+
+    Args:
+        con: DuckDB connection.
+        filters_config: List of filter configurations.
+        shapefile_dir: Directory containing shapefiles.
+        use_cache: Whether to use cached preprocessed exclusion layers.
+        skip_excluded: Whether to skip barns that an earlier filter already excluded.
+    """
+    reason_names = get_reason_names(filters_config)
+    states = [row[0] for row in con.execute("SELECT DISTINCT state FROM barns_out WHERE state IS NOT NULL").fetchall()]
+    bbox = con.execute(
+        "SELECT floor(min(ST_X(geom)) / 1000) * 1000, floor(min(ST_Y(geom)) / 1000) * 1000, "
+        "ceil(max(ST_X(geom)) / 1000) * 1000, ceil(max(ST_Y(geom)) / 1000) * 1000 FROM barns_out"
+    ).fetchone()
+    bbox = None if bbox[0] is None else tuple(bbox)
+
+    print("Excluding barns in major cities...")
+    load_geometries(con, "exclude_layer", load_city_polygons(cities_by_state, CONUS_ALBERS, use_cache=use_cache))
+    n_excluded = apply_filter(
+        con, "exclude_layer", 1 << reason_names.index(CITIES_REASON), skip_excluded=skip_excluded
+    )
+    print(f"Excluded {n_excluded} barns in major cities")
+
+    for config in filters_config:
+        description = config["description"]
+        buffer = config.get("buffer", 0)
+        print(f"Filtering barns in/on {description}...")
+        if config.get("tiled", False):
+            # Note: The indexed copy of a tiled layer is already in CONUS_ALBERS, so DuckDB can
+            # read it straight from disk
+            filepath, _ = get_tiled_layer(config, shapefile_dir)
+            con.execute("CREATE OR REPLACE TABLE exclude_layer AS SELECT geom FROM ST_Read(?)", [str(filepath)])
+            con.execute("CREATE INDEX exclude_layer_rtree ON exclude_layer USING RTREE (geom)")
+            distance = buffer
+        else:
+            gdf_exclude = load_exclusion_layer(
+                config,
+                CONUS_ALBERS,
+                valid_states=states if config.get("filter_on_state", False) else None,
+                shapefile_dir=shapefile_dir,
+                use_cache=use_cache,
+                bbox=bbox,
+            )
+            load_geometries(con, "exclude_layer", gdf_exclude)
+            distance = get_query_distance(gdf_exclude, buffer)
+        n_excluded = apply_filter(
+            con,
+            "exclude_layer",
+            1 << reason_names.index(description),
+            how=config.get("how", "inside"),
+            distance=distance,
+            skip_excluded=skip_excluded,
+        )
+        print(f"Excluded {n_excluded} barns in/on {description}")
+
+
+def filter_barns_duckdb(
+    filepath: Path,
+    gdf_isochrones: gpd.GeoDataFrame,
+    filters_config: list,
+    shapefile_dir: Path = SHAPEFILE_DIR,
+    nearest_neighbor: int = 50,
+    min_neighbors: int = 1,
+    filter_barns: bool = True,
+    skip_excluded: bool = True,
+    database: str | Path = ":memory:",
+    threads: int | None = None,
+    memory_limit: str | None = None,
+) -> gpd.GeoDataFrame:
+    """Filter barns read straight from a file with SQL in DuckDB.
+
+    Args:
+        filepath: Path to the barns file.
+        gdf_isochrones: GeoDataFrame of isochrones.
+        filters_config: List of filter configurations.
+        shapefile_dir: Directory containing shapefiles.
+        nearest_neighbor: Distance to check for nearest neighbor in meters.
+        min_neighbors: Minimum number of other barns within nearest_neighbor to keep a barn.
+        filter_barns: Flag to apply geospatial filtering on barns.
+        skip_excluded: Whether to skip barns that an earlier filter already excluded.
+        database: Path to the database file, or ":memory:" for a temporary database.
+        threads: Number of threads to use. Defaults to the number of CPUs.
+        memory_limit: Memory limit (e.g. "16GB"). Larger intermediate results spill to disk.
+
+    Returns:
+        Filtered GeoDataFrame of barns with the same columns as filter_barns, indexed by the row
+        of each barn in the file.
+    """
+    con = connect(database, threads=threads, memory_limit=memory_limit)
+    print(f"Loading barns from {filepath}...")
+    load_barns(con, filepath)
+    print("Excluding barns without a nearest neighbor...")
+    exclude_isolated_barns(con, distance=nearest_neighbor, min_neighbors=min_neighbors)
+    print("Checking integrator access...")
+    add_integrator_access(con, gdf_isochrones)
+    print("Getting states for all barns...")
+    add_states(con)
+
+    if filter_barns:
+        apply_filters(con, filters_config, shapefile_dir, skip_excluded=skip_excluded)
+
+    df = con.execute(
+        "SELECT barn_id, state, parent_corporation, integrator_access, ST_AsWKB(geom) AS wkb, exclude, "
+        "exclude_reasons FROM barns_out ORDER BY barn_id"
+    ).df()
+    con.close()
+    geometry = gpd.GeoSeries.from_wkb(df.pop("wkb").map(bytes), crs=CONUS_ALBERS).to_crs(WGS84)
+    gdf_barns = gpd.GeoDataFrame(df.set_index("barn_id"), geometry=geometry.to_numpy(), crs=WGS84)
+    gdf_barns.index.name = None
+    gdf_barns["exclude_reasons"] = gdf_barns["exclude_reasons"].astype(np.uint32)
+    return gdf_barns[["state", "parent_corporation", "integrator_access", "geometry", "exclude", "exclude_reasons"]]
@@ -0,0 +1,220 @@
+"""Record why barns are excluded and recompute exclusions for a subset of filters."""
+
+import argparse
+import json
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from rafi.utils import save_file
+
+CITIES_REASON = "major cities"
+REASONS_FILENAME = "exclude_reasons.json"
+DISTANCES_FILENAME = "exclusion_distances.parquet"
+
+
+def get_reason_names(filters_config: list) -> list[str]:
+    """Get the name for each exclusion reason in bit order.
+
+    Args:
+        filters_config: List of filter configurations.
+
+    Returns:
+        List of reason names where reason i is stored in bit i of exclude_reasons.
+    """
+    return [CITIES_REASON] + [config["description"] for config in filters_config]
+
+
+def get_reason_bits(reason_names: list[str], reasons: list[str]) -> int:
+    """Combine reasons into a single bitmask.
+
+    Args:
+        reason_names: List of reason names in bit order.
+        reasons: Reasons to include in the bitmask.
+
+    Returns:
+        Bitmask with the bit set for each reason.
+
+    Raises:
+        ValueError: If a reason isn't one of the reason names.
+    """
+    unknown = set(reasons) - set(reason_names)
+    if unknown:
+        raise ValueError(f"Unknown exclusion reasons {sorted(unknown)}. Use one of {reason_names}.")
+    bits = 0
+    for reason in reasons:
+        bits |= 1 << reason_names.index(reason)
+    return bits
+
+
+def recompute_exclude(
+    exclude_reasons: np.ndarray, reason_names: list[str], reasons: list[str], all_reasons: bool = False
+) -> np.ndarray:
+    """Recompute which barns are excluded using only some of the filters.
+
+    Note: This is only exact if exclude_reasons was recorded without skipping barns that an
+    earlier filter already excluded (see apply_filters). Otherwise a barn only has the first
+    reason that excluded it, and dropping that reason would keep it even if a later filter
+    would have excluded it.
+
+    Args:
+        exclude_reasons: Bitmask of exclusion reasons for each barn.
+        reason_names: List of reason names in bit order.
+        reasons: Reasons to apply.
+        all_reasons: Whether every barn was tested against every filter (see load_reason_names).
+
+    Returns:
+        Integer array that is 1 for excluded barns and 0 otherwise.
+
+    Raises:
+        ValueError: If only some reasons are applied to a run that didn't record every reason.
+    """
+    bits = get_reason_bits(reason_names, reasons)
+    if not all_reasons and set(reasons) != set(reason_names):
+        raise ValueError(
+            "Can't recompute exclusions for a subset of filters since the run only recorded the first "
+            "reason for each barn. Rerun filter_barns with --all_reasons."
+        )
+    return ((np.asarray(exclude_reasons, dtype=np.uint32) & bits) != 0).astype(int)
+
+
+def rethreshold_reasons(
+    exclude_reasons: np.ndarray,
+    reason_names: list[str],
+    distances: pd.DataFrame,
+    buffers: dict[str, float],
+    max_distance: float = np.inf,
+) -> np.ndarray:
+    """Update exclusion reasons for new filter buffers using the distance to the nearest feature.
+
+    Note: Like recompute_exclude, this needs a run that recorded every reason.
+
+    Args:
+        exclude_reasons: Bitmask of exclusion reasons for each barn.
+        reason_names: List of reason names in bit order.
+        distances: Distance table from get_exclusion_distances, aligned with exclude_reasons.
+        buffers: New buffer in meters for each reason to update.
+        max_distance: Largest distance searched when building the distance table.
+
+    Returns:
+        Updated bitmask of exclusion reasons.
+
+    Raises:
+        ValueError: If a reason has no distances or a buffer is larger than the distances searched.
+    """
+    exclude_reasons = np.asarray(exclude_reasons, dtype=np.uint32)
+    for reason, buffer in buffers.items():
+        if reason not in distances.columns:
+            raise ValueError(f"No distances for {reason}. Distances are available for {list(distances.columns)}.")
+        if buffer > max_distance:
+            raise ValueError(f"Buffer {buffer} for {reason} is larger than the distances searched ({max_distance}).")
+        bit = np.uint32(get_reason_bits(reason_names, [reason]))
+        within = distances[reason].to_numpy() <= buffer
+        exclude_reasons = np.where(within, exclude_reasons | bit, exclude_reasons & ~bit)
+    return exclude_reasons
+
+
+def save_exclusion_distances(distances: pd.DataFrame, filepath: Path, max_distance: float) -> None:
+    """Save the distance table as Parquet along with the largest distance searched.
+
+    Args:
+        distances: Distance table from get_exclusion_distances.
+        filepath: Path to save the Parquet file to.
+        max_distance: Largest distance searched when building the distance table.
+    """
+    print(f"Saving file to {filepath}")
+    table = pa.Table.from_pandas(distances, preserve_index=False)
+    metadata = {**(table.schema.metadata or {}), b"max_distance": str(max_distance).encode()}
+    pq.write_table(table.replace_schema_metadata(metadata), filepath)
+
+
+def load_exclusion_distances(filepath: Path) -> tuple[pd.DataFrame, float]:
+    """Load a distance table saved with save_exclusion_distances.
+
+    Args:
+        filepath: Path to the Parquet file.
+
+    Returns:
+        Tuple of (distance table, largest distance searched).
+    """
+    table = pq.read_table(filepath)
+    max_distance = float(table.schema.metadata[b"max_distance"])
+    return table.to_pandas(), max_distance
+
+
+def save_reason_names(reason_names: list[str], filepath: Path, all_reasons: bool = False) -> None:
+    """Save reason names alongside the barns so the bitmask can be decoded later.
+
+    Args:
+        reason_names: List of reason names in bit order.
+        filepath: Path to save the JSON file to.
+        all_reasons: Whether every barn was tested against every filter, rather than skipping
+            barns that an earlier filter already excluded.
+    """
+    print(f"Saving file to {filepath}")
+    with Path.open(filepath, "w") as f:
+        json.dump({"reason_names": reason_names, "all_reasons": all_reasons}, f, indent=2)
+
+
+def load_reason_names(filepath: Path) -> tuple[list[str], bool]:
+    """Load reason names saved with save_reason_names.
+
+    Args:
+        filepath: Path to the JSON file.
+
+    Returns:
+        Tuple of (list of reason names in bit order, whether every reason was recorded).
+    """
+    with Path.open(filepath) as f:
+        reasons = json.load(f)
+    # Note: Older runs only saved the list of names and never recorded every reason
+    if isinstance(reasons, list):
+        return reasons, False
+    return reasons["reason_names"], reasons["all_reasons"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Recompute barn exclusions for a subset of filters without redoing spatial joins"
+    )
+    parser.add_argument("run_dir", type=Path, help="Directory with barns.geojson and exclude_reasons.json")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--only", nargs="+", help="Apply only these filters")
+    group.add_argument("--skip", nargs="+", default=[], help="Apply every filter except these")
+    parser.add_argument(
+        "--buffer",
+        nargs="+",
+        default=[],
+        metavar="FILTER=METERS",
+        help=f"New buffers for point or line filters. Requires {DISTANCES_FILENAME} in run_dir",
+    )
+    parser.add_argument("--output", type=Path, help="Output path. Defaults to barns_recomputed.geojson in run_dir")
+    args = parser.parse_args()
+
+    reason_names, all_reasons = load_reason_names(args.run_dir / REASONS_FILENAME)
+    if args.buffer and not all_reasons:
+        parser.error("Changing buffers needs a run that recorded every reason. Rerun filter_barns with --all_reasons.")
+    if args.only:
+        reasons = args.only
+    else:
+        get_reason_bits(reason_names, args.skip)  # Check that the skipped filters exist
+        reasons = [name for name in reason_names if name not in args.skip]
+    print(f"Applying filters: {reasons}")
+
+    gdf_barns = gpd.read_file(args.run_dir / "barns.geojson")
+    if args.buffer:
+        buffers = {name: float(meters) for name, meters in (buffer.rsplit("=", 1) for buffer in args.buffer)}
+        print(f"Updating buffers: {buffers}")
+        distances, max_distance = load_exclusion_distances(args.run_dir / DISTANCES_FILENAME)
+        gdf_barns["exclude_reasons"] = rethreshold_reasons(
+            gdf_barns["exclude_reasons"], reason_names, distances, buffers, max_distance
+        )
+    gdf_barns["exclude"] = recompute_exclude(gdf_barns["exclude_reasons"], reason_names, reasons, all_reasons)
+    print(f"There are {len(gdf_barns[gdf_barns.exclude == 0])} barns remaining")
+
+    output = args.output or args.run_dir / "barns_recomputed.geojson"
+    save_file(gdf_barns, output, gzip_file=True)
@@ -0,0 +1,116 @@
+"""Group barns into farm sites so spatial joins run once per farm instead of once per barn."""
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+from rafi.barn_table import OUTPUT_COLS, BarnTable
+
+FARM_COL = "farm_id"
+
+
+def cluster_points(x: np.ndarray, y: np.ndarray, distance: float) -> np.ndarray:
+    """Cluster points with single linkage.
+
+    Points are in the same cluster if a chain of points links them with each step no longer than
+    the distance, like DBSCAN with a minimum of one point.
+
+    Args:
+        x: Point x coordinates in a projected CRS.
+        y: Point y coordinates in a projected CRS.
+        distance: Largest distance between linked points in the units of the CRS.
+
+    Returns:
+        Cluster label for each point, numbered from 0.
+    """
+    n = len(x)
+    pairs = cKDTree(np.column_stack([x, y])).query_pairs(distance, output_type="ndarray")
+    graph = coo_matrix((np.ones(len(pairs), dtype=bool), (pairs[:, 0], pairs[:, 1])), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+    return labels
+
+
+def get_representatives(x: np.ndarray, y: np.ndarray, labels: np.ndarray) -> np.ndarray:
+    """Find the point closest to the mean of each cluster.
+
+    Note: Using a real point instead of the mean keeps the representative on a barn, even for
+    farms shaped like an L or a ring.
+
+    Args:
+        x: Point x coordinates in a projected CRS.
+        y: Point y coordinates in a projected CRS.
+        labels: Cluster labels from cluster_points.
+
+    Returns:
+        Position of the representative point of each cluster, in label order.
+    """
+    if len(labels) == 0:
+        return np.zeros(0, dtype=np.intp)
+    counts = np.bincount(labels)
+    mean_x = np.bincount(labels, weights=x) / counts
+    mean_y = np.bincount(labels, weights=y) / counts
+    squared_distance = (x - mean_x[labels]) ** 2 + (y - mean_y[labels]) ** 2
+    order = np.lexsort((squared_distance, labels))
+    first = np.flatnonzero(np.r_[True, labels[order][1:] != labels[order][:-1]])
+    return order[first]
+
+
+def get_farm_sites(table: BarnTable, distance: float) -> tuple[BarnTable, np.ndarray, np.ndarray]:
+    """Group the active barns into farm sites.
+
+    Args:
+        table: Table of barns in a projected CRS.
+        distance: Largest distance between barns on the same farm in meters.
+
+    Returns:
+        Tuple of (table of farm sites at their representative barns, positions of the clustered
+        barns in table, farm site of each clustered barn). Farm sites are indexed by the index
+        label of their representative barn.
+    """
+    rows = table.rows()
+    labels = cluster_points(table.x[rows], table.y[rows], distance)
+    representatives = rows[get_representatives(table.x[rows], table.y[rows], labels)]
+    sites = BarnTable(table.x[representatives], table.y[representatives], table.crs, table.index[representatives])
+    return sites, rows, labels
+
+
+def broadcast_farm_sites(sites: BarnTable, table: BarnTable, rows: np.ndarray, labels: np.ndarray) -> BarnTable:
+    """Copy the results for each farm site back to its barns.
+
+    Args:
+        sites: Table of filtered farm sites from get_farm_sites.
+        table: Table of barns the sites were built from.
+        rows: Positions of the clustered barns in table.
+        labels: Farm site of each clustered barn.
+
+    Returns:
+        The table of barns.
+    """
+    table.active[rows] = sites.active[labels]
+    table.integrator_access[rows] = sites.integrator_access[labels]
+    table.set_states(pd.Categorical.from_codes(sites.state_codes[labels], categories=sites.state_categories), rows)
+    table.set_corporations(pd.Categorical.from_codes(sites.corp_codes[labels], categories=sites.corp_categories), rows)
+    table.exclude[rows] = sites.exclude[labels]
+    table.exclude_reasons[rows] = sites.exclude_reasons[labels]
+    return table
+
+
+def get_farms(gdf_barns: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """Summarize filtered barns by farm site.
+
+    Args:
+        gdf_barns: Filtered GeoDataFrame of barns with a farm_id column.
+
+    Returns:
+        GeoDataFrame of farm sites indexed by farm_id, with the number of barns on each farm and
+        the point of its representative barn.
+    """
+    n_barns = gdf_barns.groupby(FARM_COL).size().rename("n_barns")
+    # Note: Every barn on a farm has the same results, so use the representative barn's row
+    gdf_farms = gdf_barns.loc[n_barns.index, OUTPUT_COLS]
+    gdf_farms.index.name = FARM_COL
+    gdf_farms.insert(0, "n_barns", n_barns.to_numpy())
+    return gdf_farms
@@ -1,23 +1,65 @@
 """Filter barns from Microsoft's computer vision model based on various criteria."""
 
 import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from typing import NamedTuple
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import shapely
 import yaml
+from pyogrio import read_info, write_dataframe
+from scipy.spatial import cKDTree
 from tqdm import tqdm
 
+from rafi.barn_table import BarnTable
+from rafi.cache import (
+    get_cache_key,
+    get_cache_path,
+    read_cached_geoparquet,
+    transform_bounds,
+    write_cached_geoparquet,
+)
 from rafi.constants import (
     ALBERS_EQUAL_AREA,
+    CACHE_DIR,
     CLEAN_DIR,
+    CONUS_ALBERS,
     GDF_STATES,
     RAW_DIR,
     SHAPEFILE_DIR,
     WGS84,
 )
-from rafi.utils import save_file
+from rafi.exclude_reasons import (
+    CITIES_REASON,
+    DISTANCES_FILENAME,
+    REASONS_FILENAME,
+    get_reason_names,
+    save_exclusion_distances,
+    save_reason_names,
+)
+from rafi.farms import (
+    FARM_COL,
+    broadcast_farm_sites,
+    get_farm_sites,
+    get_farms,
+)
+from rafi.filter_stats import (
+    FILTER_STATS_PATH,
+    get_filter_stats,
+    load_filter_stats,
+    order_filters,
+    print_filter_stats,
+    save_filter_stats,
+)
+from rafi.geometry import subdivide
+from rafi.partition import get_partitions
+from rafi.states import get_state_grid, lookup_states
+from rafi.utils import iter_chunks, read_barn_centroids, read_layer, save_file
 
 tqdm.pandas()
 
@@ -25,6 +67,15 @@ tqdm.pandas()
 FILTERS_CONFIG_FILEPATH = Path(__file__).resolve().parent / "config_geo_filters.yaml"
 PIPELINE_CONFIG_FILEPATH = Path(__file__).resolve().parent / "config_pipeline.yaml"
 CITIES_PATH = SHAPEFILE_DIR / "municipalities___states.geoparquet"
+POINT_LINE_TYPES = ["Point", "MultiPoint", "LineString", "MultiLineString"]
+DEFAULT_TILE_SIZE = 50000  # meters
+MAX_VERTICES = 256  # Polygons with more vertices are subdivided before spatial joins
+# Note: Census place names end with the type of place (e.g. "Huntsville city"), and the rest of a
+# consolidated city ends with "(balance)" (e.g. "Indianapolis city (balance)")
+CITY_SUFFIX_PATTERN = (
+    r"\s+(city|town|township|village|borough|municipality|cdp|metropolitan government|metro government"
+    r"|urban county|consolidated government|unified government)(\s+balance)?$"
+)
 
 
 with Path.open(FILTERS_CONFIG_FILEPATH) as f:
@@ -33,11 +84,31 @@ with Path.open(FILTERS_CONFIG_FILEPATH) as f:
 with Path.open(PIPELINE_CONFIG_FILEPATH) as f:
     pipeline_config = yaml.safe_load(f)
     cities_by_state = pipeline_config["cities"]
+    footprint_thresholds = pipeline_config.get("footprint")
+
+
+class LayerExtent(NamedTuple):
+    """Area that exclusion layers are loaded and cached for, shared by every partition."""
+
+    bbox: tuple | None
+    states: list | None
+
+
+class FilterMask(NamedTuple):
+    """Points one filter excludes, and the time spent loading and joining its layer."""
+
+    mask: np.ndarray
+    load_seconds: float
+    join_seconds: float
 
 
 # TODO: This is probably a util also...
 def load_geography(
-    filepath: str, states: gpd.GeoDataFrame = GDF_STATES, state: str = None
+    filepath: str,
+    states: gpd.GeoDataFrame = GDF_STATES,
+    state: str = None,
+    columns: list | None = None,
+    bbox: tuple | None = None,
 ) -> gpd.GeoDataFrame:
     """Load geographic data from a file and optionally filter by state.
 
@@ -45,15 +116,21 @@ def load_geography(
         filepath: Path to the geographic file.
         states: GeoDataFrame of states.
         state: State to filter the geographic data.
+        columns: Attribute columns to load. Loads all columns if None.
+        bbox: Bounding box in the CRS of the file. Only features that intersect it are loaded.
 
     Returns:
         The loaded and optionally filtered geographic data.
     """
     file_extension = Path(filepath).suffix
     if file_extension.lower() == ".parquet":
-        gdf = gpd.read_parquet(filepath)
+        gdf = gpd.read_parquet(
+            filepath, columns=None if columns is None else columns + ["geometry"]
+        )
+        if bbox is not None:
+            gdf = gdf.cx[bbox[0] : bbox[2], bbox[1] : bbox[3]]
     else:
-        gdf = gpd.read_file(filepath)
+        gdf = read_layer(filepath, columns=columns, bbox=bbox)
     if state is not None:
         gdf = gdf.to_crs(GDF_STATES.crs)
         gdf = gpd.overlay(
@@ -80,6 +157,13 @@ def get_state_info(
     Returns:
         GeoDataFrame with state information.
     """
+    # Note: Points use the much faster grid lookup and always get a single state
+    if len(gdf) > 0 and (gdf.geom_type == "Point").all():
+        state = pd.Series(lookup_states(gdf.geometry, gdf_states), index=gdf.index)
+        if valid_states is not None:
+            state = state.where(state.isin(valid_states))
+        return gdf.assign(state=state)
+
     if valid_states is not None:
         gdf_states = gdf_states[gdf_states["ABBREV"].isin(valid_states)]
     gdf_states = gdf_states.to_crs(gdf.crs)
@@ -102,30 +186,33 @@ def get_state_info(
     return gdf_with_state
 
 
-def filter_on_membership(
-    gdf: gpd.GeoDataFrame,
+def preprocess_exclusion(
     gdf_exclude: gpd.GeoDataFrame,
-    how: str = "inside",
+    crs: str,
     buffer: float = 0,
     tolerance: float = 0.1,
-    filter_on_state: bool = True,
+    valid_states: list | None = None,
+    max_vertices: int | None = MAX_VERTICES,
 ) -> gpd.GeoDataFrame:
-    """Filter a GeoDataFrame based on membership in exclusion geometries.
+    """Prepare exclusion geometries for spatial joins.
+
+    Point and line layers aren't buffered. They're returned in CONUS_ALBERS instead so they can
+    be queried by distance (see get_membership_mask), which is much faster than buffering
+    millions of line segments.
 
     Args:
-        gdf: Input GeoDataFrame.
         gdf_exclude: GeoDataFrame of exclusion geometries.
-        how: Method of filtering ("inside" or "outside").
-        buffer: Buffer distance for exclusion geometries.
+        crs: CRS of the GeoDataFrame the exclusion geometries will be joined with.
+        buffer: Buffer distance for exclusion geometries in meters.
         tolerance: Tolerance for geometry simplification.
-        filter_on_state: Whether to filter based on state information.
+        valid_states: State abbreviations to keep exclusion geometries for. Keeps all if None.
+        max_vertices: Polygons with more vertices are split into pieces (see subdivide) so the
+            spatial index stays selective. Polygons aren't split if None.
 
     Returns:
-        Filtered GeoDataFrame.
+        Simplified, state filtered, buffered, and subdivided exclusion geometries in the given
+        CRS, or unbuffered geometries in CONUS_ALBERS for point and line layers.
     """
-    if gdf.index.duplicated().any():
-        print("Warning: Duplicate indices detected in input GeoDataFrame")
-
     # Simplify geometries to speed up processing
     gdf_exclude["geometry"] = gdf_exclude["geometry"].simplify(
         tolerance, preserve_topology=True
@@ -133,245 +220,1191 @@ def filter_on_membership(
 
     # Note: This step can be slow, but it's necessary to prevent the process from
     # being killed for large/detailed geometries
-    if filter_on_state:
-        valid_states = gdf["state"].unique()
+    if valid_states is not None:
         print("Getting state info for exclusion geographies...")
         gdf_exclude = get_state_info(gdf_exclude, valid_states=valid_states)
         gdf_exclude = gdf_exclude[gdf_exclude["state"].isin(valid_states)]
 
-    # TODO: Should I use ALBERS_EQUAL_AREA here?
+    if buffer != 0 and is_point_or_line_layer(gdf_exclude):
+        return gdf_exclude.to_crs(CONUS_ALBERS)
+
     if buffer != 0:
-        gdf_exclude = gdf_exclude.to_crs(
-            epsg=5070
-        )  # convert to CRS where the buffer unit is in meters
+        # convert to CRS where the buffer unit is in meters
+        gdf_exclude = gdf_exclude.to_crs(CONUS_ALBERS)
         gdf_exclude["geometry"] = gdf_exclude["geometry"].buffer(buffer)
 
-    gdf_exclude = gdf_exclude.to_crs(gdf.crs)
+    gdf_exclude = gdf_exclude.to_crs(crs)
+    if max_vertices is not None:
+        # Note: A few huge polygons (e.g. lakes, parks) have bounding boxes that cover most barns
+        pieces, parents = subdivide(gdf_exclude.geometry.to_numpy(), max_vertices)
+        gdf_exclude = gdf_exclude.iloc[parents].set_geometry(pieces, crs=crs)
+    return gdf_exclude
+
+
+def get_bounds(gdf: gpd.GeoDataFrame, pad: float = 0) -> tuple | None:
+    """Get the bounds of a GeoDataFrame in CONUS_ALBERS to limit which exclusion features are read.
+
+    Bounds are rounded out to the nearest kilometer so small changes in the input reuse the
+    same cached exclusion layers.
+
+    Args:
+        gdf: Input GeoDataFrame.
+        pad: Distance in meters to pad the bounds by.
+
+    Returns:
+        Tuple of (minx, miny, maxx, maxy) in meters, or None if gdf is empty.
+    """
+    if len(gdf) == 0:
+        return None
+    minx, miny, maxx, maxy = gdf.geometry.to_crs(CONUS_ALBERS).total_bounds
+    return (
+        float(np.floor((minx - pad) / 1000) * 1000),
+        float(np.floor((miny - pad) / 1000) * 1000),
+        float(np.ceil((maxx + pad) / 1000) * 1000),
+        float(np.ceil((maxy + pad) / 1000) * 1000),
+    )
+
+
+def pad_bounds(bbox: tuple | None, pad: float) -> tuple | None:
+    """Pad bounds on every side.
+
+    Args:
+        bbox: Bounds as (minx, miny, maxx, maxy), or None.
+        pad: Distance to pad the bounds by.
+
+    Returns:
+        The padded bounds, or None if bbox is None.
+    """
+    if bbox is None:
+        return None
+    minx, miny, maxx, maxy = bbox
+    return (minx - pad, miny - pad, maxx + pad, maxy + pad)
+
+
+def load_exclusion_layer(
+    config: dict,
+    crs: str,
+    valid_states: list | None = None,
+    shapefile_dir: Path = SHAPEFILE_DIR,
+    tolerance: float = 0.1,
+    use_cache: bool = True,
+    cache_dir: Path = CACHE_DIR,
+    bbox: tuple | None = None,
+    clip_bbox: tuple | None = None,
+) -> gpd.GeoDataFrame:
+    """Load and preprocess the exclusion geometries for a filter, using the cache when possible.
+
+    Only the geometry column is read, and only for features near the bounding box, so national
+    layers load quickly for a smoke test or a subset of states. Cached layers are keyed by the
+    source file and every parameter that changes preprocessing, so editing the file or the
+    filter config rebuilds the cache.
+
+    Args:
+        config: Filter configuration from config_geo_filters.yaml.
+        crs: CRS of the GeoDataFrame the exclusion geometries will be joined with.
+        valid_states: State abbreviations to keep exclusion geometries for. Keeps all if None.
+        shapefile_dir: Directory containing shapefiles.
+        tolerance: Tolerance for geometry simplification.
+        use_cache: Whether to read and write preprocessed layers in the cache.
+        cache_dir: Directory for cached layers.
+        bbox: Bounds in CONUS_ALBERS of the area of interest (see get_bounds). Features farther
+            than the filter buffer from it are skipped. Reads the whole layer if None.
+        clip_bbox: Bounds in CONUS_ALBERS of a smaller area to return features for. The layer
+            is loaded (and cached) for bbox, so calls with different clip bounds share one
+            cached layer. Returns every feature near bbox if None.
+
+    Returns:
+        Preprocessed exclusion geometries.
+    """
+    exclude_gdf_path = shapefile_dir / config["filename"]
+    layer = config.get("layer")
+    buffer = config.get("buffer", 0)
+    valid_states = sorted(valid_states) if valid_states is not None else None
+    # Note: Features just outside the bounds can still cover barns once they're buffered
+    bbox = pad_bounds(bbox, buffer)
+    clip_bbox = pad_bounds(clip_bbox, buffer)
+
+    if use_cache:
+        key = get_cache_key(
+            [exclude_gdf_path],
+            layer=layer,
+            buffer=buffer,
+            tolerance=tolerance,
+            valid_states=valid_states,
+            crs=crs,
+            bbox=bbox,
+            query_by_distance=True,
+            max_vertices=MAX_VERTICES,
+        )
+        cached = read_cached_geoparquet(
+            config["description"], key, cache_dir, bbox=clip_bbox, bbox_crs=CONUS_ALBERS
+        )
+        if cached is not None:
+            return cached
+
+    print(f"Reading file {exclude_gdf_path}")
+    # Note: Only the geometry is needed for filtering
+    gdf_exclude = read_layer(
+        exclude_gdf_path,
+        layer=layer if exclude_gdf_path.suffix == ".gdb" else None,
+        columns=[],
+        bbox=bbox,
+        bbox_crs=CONUS_ALBERS,
+    )
+    gdf_exclude = preprocess_exclusion(
+        gdf_exclude, crs, buffer=buffer, tolerance=tolerance, valid_states=valid_states
+    )
+    gdf_exclude = gdf_exclude[["geometry"]]
+
+    if use_cache:
+        write_cached_geoparquet(gdf_exclude, config["description"], key, cache_dir)
+    if clip_bbox is not None:
+        # Note: Keep the same features that a cached read would (see read_cached_geoparquet)
+        minx, miny, maxx, maxy = transform_bounds(
+            clip_bbox, CONUS_ALBERS, gdf_exclude.crs
+        )
+        bounds = gdf_exclude.geometry.bounds
+        gdf_exclude = gdf_exclude[
+            (bounds["maxx"] >= minx)
+            & (bounds["minx"] <= maxx)
+            & (bounds["maxy"] >= miny)
+            & (bounds["miny"] <= maxy)
+        ]
+    return gdf_exclude
+
+
+def normalize_place_names(names: pd.Series) -> pd.Series:
+    """Normalize place names for matching by lowercasing and removing punctuation and extra spaces.
+
+    Hyphens and slashes are replaced with spaces rather than removed.
+
+    Args:
+        names: Place names.
+
+    Returns:
+        Normalized place names.
+    """
+    return (
+        names.fillna("")
+        .str.lower()
+        # Note: Hyphens and slashes join the names of consolidated cities (e.g. "Nashville-Davidson")
+        .str.replace(r"[-/]", " ", regex=True)
+        .str.replace(r"[^\w\s]", "", regex=True)
+        .str.split()
+        .str.join(" ")
+    )
+
+
+def get_city_keys(names: pd.Series) -> pd.DataFrame:
+    """Split "City, State" place names into normalized (city, state) keys.
+
+    Args:
+        names: Place names.
+
+    Returns:
+        DataFrame with "city" and "state" columns, aligned with names.
+    """
+    parts = names.fillna("").str.rsplit(",", n=1, expand=True).reindex(columns=[0, 1])
+    city = normalize_place_names(parts[0]).str.replace(
+        CITY_SUFFIX_PATTERN, "", regex=True
+    )
+    return pd.DataFrame(
+        {"city": city, "state": normalize_place_names(parts[1])}, index=names.index
+    )
+
+
+def load_city_polygons(
+    cities_by_state: dict,
+    crs: str,
+    cities_path: Path = CITIES_PATH,
+    tolerance: float = 0.1,
+    use_cache: bool = True,
+    cache_dir: Path = CACHE_DIR,
+) -> gpd.GeoDataFrame:
+    """Load the dissolved polygon for each major city, using the cache when possible.
+
+    Cities are matched to places on normalized (city, state) keys in a single join. Cities without
+    an exact match are matched to places in the same state whose names start with the city, which
+    finds consolidated cities like "Nashville-Davidson metropolitan government (balance)".
+
+    Args:
+        cities_by_state: Dictionary of major cities by state.
+        crs: CRS of the GeoDataFrame the cities will be joined with.
+        cities_path: Path to the municipalities GeoParquet file.
+        tolerance: Tolerance for geometry simplification.
+        use_cache: Whether to read and write the city polygons in the cache.
+        cache_dir: Directory for cached layers.
+
+    Returns:
+        GeoDataFrame with "city", "state", and geometry columns.
+
+    Raises:
+        ValueError: If a city doesn't match any place.
+    """
+    if use_cache:
+        key = get_cache_key(
+            [cities_path],
+            cities=cities_by_state,
+            city_suffix_pattern=CITY_SUFFIX_PATTERN,
+            tolerance=tolerance,
+            crs=crs,
+            max_vertices=MAX_VERTICES,
+        )
+        cached = read_cached_geoparquet(CITIES_REASON, key, cache_dir)
+        if cached is not None:
+            return cached
+
+    wanted = pd.DataFrame(
+        [(city, state) for state, cities in cities_by_state.items() for city in cities],
+        columns=["city", "state"],
+    )
+    wanted = wanted.apply(normalize_place_names).drop_duplicates()
+
+    print(f"Reading file {cities_path}")
+    places = gpd.read_parquet(cities_path, columns=["name", "geometry"])
+    places = places.join(get_city_keys(places["name"]))
+    matches = places.merge(wanted, on=["city", "state"])
+
+    missing = wanted.merge(
+        matches[["city", "state"]].drop_duplicates(), how="left", indicator=True
+    )
+    missing = missing[missing["_merge"] == "left_only"]
+    prefix_matches = []
+    for city, state in zip(missing["city"], missing["state"], strict=True):
+        is_match = places["city"].str.startswith(f"{city} ")
+        is_match &= places["state"] == state
+        print(f"Matched {city}, {state} to {places.loc[is_match, 'name'].tolist()}")
+        prefix_matches.append(places[is_match].assign(city=city))
+    matches = pd.concat([matches, *prefix_matches], ignore_index=True)
+
+    unmatched = wanted.merge(
+        matches[["city", "state"]].drop_duplicates(), how="left", indicator=True
+    )
+    unmatched = unmatched[unmatched["_merge"] == "left_only"]
+    if len(unmatched) > 0:
+        raise ValueError(
+            f"No polygons found for {len(unmatched)} cities: "
+            f"{list(unmatched['city'] + ', ' + unmatched['state'])}. "
+            "Check the names in config_pipeline.yaml."
+        )
+
+    gdf_cities = matches.dissolve(by=["city", "state"], as_index=False)
+    gdf_cities = preprocess_exclusion(
+        gdf_cities[["city", "state", "geometry"]], crs, tolerance=tolerance
+    )
+
+    if use_cache:
+        write_cached_geoparquet(gdf_cities, CITIES_REASON, key, cache_dir)
+    return gdf_cities
+
+
+def filter_on_membership(
+    table: BarnTable,
+    gdf_exclude: gpd.GeoDataFrame,
+    how: str = "inside",
+    buffer: float = 0,
+    tolerance: float = 0.1,
+    filter_on_state: bool = True,
+    preprocessed: bool = False,
+    skip_excluded: bool = True,
+    reason_bit: int = 0,
+) -> BarnTable:
+    """Filter barns based on membership in exclusion geometries.
+
+    Args:
+        table: Table of barns.
+        gdf_exclude: GeoDataFrame of exclusion geometries.
+        how: Method of filtering ("inside" or "outside").
+        buffer: Buffer distance for exclusion geometries in meters. Point and line layers are
+            queried by distance instead of being buffered.
+        tolerance: Tolerance for geometry simplification.
+        filter_on_state: Whether to filter based on state information.
+        preprocessed: Whether gdf_exclude is already preprocessed (see load_exclusion_layer).
+        skip_excluded: Whether to skip rows that are already excluded.
+        reason_bit: Bit to set in exclude_reasons for excluded rows, if any.
+
+    Returns:
+        The table with excluded barns marked.
+    """
+    if not preprocessed:
+        valid_states = table.get_states() if filter_on_state else None
+        gdf_exclude = preprocess_exclusion(
+            gdf_exclude,
+            table.crs,
+            buffer=buffer,
+            tolerance=tolerance,
+            valid_states=valid_states,
+        )
 
     # Exclude previously excluded barns to speed up processing
-    joined = gpd.sjoin(
-        gdf[gdf["exclude"] != 1], gdf_exclude, how="left", predicate="within"
+    tested = table.rows(skip_excluded)
+    mask = get_membership_mask(
+        table.points(tested),
+        gdf_exclude,
+        how=how,
+        distance=get_query_distance(gdf_exclude, buffer),
     )
+    return table.set_excluded(tested[mask], reason_bit)
 
-    if how == "inside":
-        joined["exclude"] = joined.progress_apply(
-            lambda row: (1 if not pd.isna(row["index_right"]) else row["exclude"]),
-            axis=1,
+
+def get_query_distance(gdf_exclude: gpd.GeoDataFrame, buffer: float) -> float:
+    """Get the distance to query an exclusion layer by instead of buffering it.
+
+    Args:
+        gdf_exclude: GeoDataFrame of preprocessed exclusion geometries.
+        buffer: Buffer distance from the filter config in meters.
+
+    Returns:
+        The buffer for point and line layers, otherwise 0 since polygon layers are already
+        buffered by preprocess_exclusion.
+    """
+    return buffer if is_point_or_line_layer(gdf_exclude) else 0
+
+
+def get_membership_mask(
+    points: gpd.GeoSeries,
+    gdf_exclude: gpd.GeoDataFrame,
+    how: str = "inside",
+    distance: float = 0,
+) -> np.ndarray:
+    """Find the points that should be excluded based on membership in exclusion geometries.
+
+    Args:
+        points: GeoSeries of points.
+        gdf_exclude: GeoDataFrame of preprocessed exclusion geometries.
+        how: Method of filtering ("inside" or "outside").
+        distance: If greater than 0, points within this distance of an exclusion geometry are
+            members. Uses the units of the exclusion geometries' CRS.
+
+    Returns:
+        Boolean array that is True for points to exclude.
+    """
+    if points.crs != gdf_exclude.crs:
+        points = points.to_crs(gdf_exclude.crs)
+    tree = shapely.STRtree(gdf_exclude.geometry.to_numpy())
+    if distance > 0:
+        point_idx, _ = tree.query(
+            points.to_numpy(), predicate="dwithin", distance=distance
         )
+    else:
+        point_idx, _ = tree.query(points.to_numpy(), predicate="within")
+    inside = np.zeros(len(points), dtype=bool)
+    inside[point_idx] = True
+    if how == "inside":
+        return inside
     elif how == "outside":
-        joined["exclude"] = joined.progress_apply(
-            lambda row: (
-                1
-                if pd.isna(row["index_right"]) and row["exclude"] == 0
-                else row["exclude"]
-            ),
-            axis=1,
+        return ~inside
+    raise ValueError(f"Unsupported filter method {how}. Use 'inside' or 'outside'.")
+
+
+def is_point_or_line_layer(gdf: gpd.GeoDataFrame) -> bool:
+    """Check whether every geometry in a layer is a point or a line.
+
+    Args:
+        gdf: GeoDataFrame to check.
+
+    Returns:
+        True if the layer only has (multi)point and (multi)line geometries.
+    """
+    return bool(gdf.geom_type.isin(POINT_LINE_TYPES).all())
+
+
+def is_polygon_file(filepath: Path, layer: str | None = None) -> bool:
+    """Check whether a file declares a polygon geometry type without reading its features.
+
+    Args:
+        filepath: Path to the file.
+        layer: Layer to check for files with more than one layer.
+
+    Returns:
+        True if the declared geometry type is (multi)polygon. Files with mixed or unknown
+        geometry types return False.
+    """
+    geometry_type = read_info(filepath, layer=layer)["geometry_type"] or ""
+    return "Polygon" in geometry_type
+
+
+def get_tiled_layer(
+    config: dict,
+    shapefile_dir: Path = SHAPEFILE_DIR,
+    use_cache: bool = True,
+    cache_dir: Path = CACHE_DIR,
+    chunk_size: int = 100000,
+) -> tuple[Path, str | None]:
+    """Get a spatially indexed copy of a large layer that can be read one tile at a time.
+
+    Formats like GeoJSON have no spatial index, so every bounding box read scans the whole file.
+    The layer is streamed once in chunks into a GeoPackage in the cache, keeping only the
+    geometry of features that match the filter's "where" clause.
+
+    Args:
+        config: Filter configuration from config_geo_filters.yaml.
+        shapefile_dir: Directory containing shapefiles.
+        use_cache: Whether to build the indexed copy. If False, tiles are read from the source.
+        cache_dir: Directory for cached layers.
+        chunk_size: Number of features to stream at a time.
+
+    Returns:
+        Tuple of (path, layer) to read tiles from.
+    """
+    filepath = shapefile_dir / config["filename"]
+    layer = config.get("layer")
+    if not use_cache:
+        return filepath, layer
+
+    key = get_cache_key([filepath], layer=layer, where=config.get("where"))
+    cache_path = get_cache_path(config["description"], key, ".gpkg", cache_dir)
+    if cache_path.exists():
+        return cache_path, None
+
+    Path.mkdir(cache_dir, parents=True, exist_ok=True)
+    # Note: Write to a temporary file first so an interrupted run doesn't leave a partial cache
+    tmp_path = cache_path.with_suffix(".tmp.gpkg")
+    tmp_path.unlink(missing_ok=True)
+    print(f"Indexing {filepath} to {cache_path}")
+    chunks = iter_chunks(
+        filepath, layer=layer, where=config.get("where"), chunk_size=chunk_size
+    )
+    for chunk in tqdm(chunks):
+        write_dataframe(
+            chunk.to_crs(CONUS_ALBERS),
+            tmp_path,
+            driver="GPKG",
+            append=tmp_path.exists(),
+            promote_to_multi=True,
+        )
+    if not tmp_path.exists():
+        write_dataframe(
+            gpd.GeoDataFrame(geometry=[], crs=CONUS_ALBERS),
+            tmp_path,
+            driver="GPKG",
+            geometry_type="Unknown",
         )
+    tmp_path.replace(cache_path)
+    return cache_path, None
 
-    joined = joined.drop(columns=["index_right"])
 
-    # Ensure unique indices
-    if joined.index.duplicated().any():
-        joined = joined.groupby(joined.index).first()
+def get_tiled_distances(
+    points: gpd.GeoSeries,
+    config: dict,
+    max_distance: float,
+    shapefile_dir: Path = SHAPEFILE_DIR,
+    use_cache: bool = True,
+    cache_dir: Path = CACHE_DIR,
+) -> np.ndarray:
+    """Get the distance from each point to the nearest feature in a large layer, one tile at a time.
 
-    # update original dataframe with newly excluded barns
-    gdf.loc[joined.index, "exclude"] = joined["exclude"]
+    Points are grouped into square tiles ("tile_size" in the filter config, in meters) and only
+    the features within max_distance of a tile are read for it, so memory use depends on the
+    tile size rather than on the size of the layer.
 
-    return gdf
+    Args:
+        points: GeoSeries of points.
+        config: Filter configuration from config_geo_filters.yaml.
+        max_distance: Largest distance to search in meters.
+        shapefile_dir: Directory containing shapefiles.
+        use_cache: Whether to use a spatially indexed copy of the layer (see get_tiled_layer).
+        cache_dir: Directory for cached layers.
+
+    Returns:
+        Float32 array of distances in meters. Points farther than max_distance from every
+        feature get a distance of infinity.
+    """
+    filepath, layer = get_tiled_layer(config, shapefile_dir, use_cache, cache_dir)
+    where = None if use_cache else config.get("where")
+    tile_size = config.get("tile_size", DEFAULT_TILE_SIZE)
+
+    points = points.to_crs(CONUS_ALBERS).to_numpy()
+    distances = np.full(len(points), np.inf, dtype=np.float32)
+    if len(points) == 0:
+        return distances
+
+    tiles = np.floor(shapely.get_coordinates(points) / tile_size).astype(np.int64)
+    tiles, tile_idx = np.unique(tiles, axis=0, return_inverse=True)
+    tile_idx = tile_idx.ravel()
+    order = np.argsort(tile_idx, kind="stable")
+    groups = np.split(order, np.cumsum(np.bincount(tile_idx))[:-1])
+
+    print(f"Getting distances to {config['description']} in {len(tiles)} tiles...")
+    for (tile_x, tile_y), point_idx in zip(tqdm(tiles), groups):
+        bbox = (
+            tile_x * tile_size - max_distance,
+            tile_y * tile_size - max_distance,
+            (tile_x + 1) * tile_size + max_distance,
+            (tile_y + 1) * tile_size + max_distance,
+        )
+        gdf_tile = read_layer(
+            filepath,
+            layer=layer,
+            columns=[],
+            bbox=bbox,
+            bbox_crs=CONUS_ALBERS,
+            where=where,
+        )
+        if len(gdf_tile) == 0:
+            continue
+        geoms = gdf_tile.geometry.to_crs(CONUS_ALBERS).to_numpy()
+        (nearest_idx, _), nearest = shapely.STRtree(geoms).query_nearest(
+            points[point_idx],
+            max_distance=max_distance,
+            return_distance=True,
+            all_matches=False,
+        )
+        distances[point_idx[nearest_idx]] = nearest
+
+    return distances
+
+
+def filter_on_tiles(
+    table: BarnTable,
+    config: dict,
+    shapefile_dir: Path = SHAPEFILE_DIR,
+    use_cache: bool = True,
+    skip_excluded: bool = True,
+    reason_bit: int = 0,
+    cache_dir: Path = CACHE_DIR,
+) -> BarnTable:
+    """Filter barns on distance to a large point or line layer read one tile at a time.
+
+    Args:
+        table: Table of barns.
+        config: Filter configuration from config_geo_filters.yaml.
+        shapefile_dir: Directory containing shapefiles.
+        use_cache: Whether to use a spatially indexed copy of the layer.
+        cache_dir: Directory for cached layers.
+        skip_excluded: Whether to skip rows that are already excluded.
+        reason_bit: Bit to set in exclude_reasons for excluded rows, if any.
+
+    Returns:
+        The table with excluded barns marked.
+    """
+    tested = table.rows(skip_excluded)
+    buffer = config.get("buffer", 0)
+    distances = get_tiled_distances(
+        table.points(tested), config, buffer, shapefile_dir, use_cache, cache_dir
+    )
+    return table.set_excluded(tested[distances <= buffer], reason_bit)
+
+
+def get_exclusion_distances(
+    gdf: gpd.GeoDataFrame,
+    filters_config: list,
+    shapefile_dir: Path = SHAPEFILE_DIR,
+    max_distance: float = 5000,
+    use_cache: bool = True,
+) -> pd.DataFrame:
+    """Get the distance from each point to the nearest feature in each point or line exclusion layer.
+
+    With this table, changing a filter buffer is a comparison against a column rather than
+    another spatial join (see rafi.exclude_reasons.rethreshold_reasons).
+
+    Args:
+        gdf: GeoDataFrame of points.
+        filters_config: List of filter configurations.
+        shapefile_dir: Directory containing shapefiles.
+        max_distance: Largest distance to search in meters. Points farther than this from every
+            feature get a distance of infinity.
+        use_cache: Whether to use cached preprocessed exclusion layers.
+
+    Returns:
+        DataFrame with a float32 distance column in meters for each point or line layer, aligned
+        row for row with gdf.
+    """
+    points = gdf.geometry.to_crs(CONUS_ALBERS).to_numpy()
+    states = gdf["state"].dropna().unique()
+    bbox = get_bounds(gdf, pad=max_distance)
+
+    distances = {}
+    for config in filters_config:
+        description = config["description"]
+        if config.get("tiled", False):
+            distances[description] = get_tiled_distances(
+                gdf.geometry, config, max_distance, shapefile_dir, use_cache
+            )
+            continue
+
+        # Note: Skip polygon layers before reading them since they can be huge
+        filepath = shapefile_dir / config["filename"]
+        layer = config.get("layer") if filepath.suffix == ".gdb" else None
+        if is_polygon_file(filepath, layer):
+            continue
+
+        # Note: Use the same preprocessing as the filter, but don't buffer
+        gdf_exclude = load_exclusion_layer(
+            {**config, "buffer": 0},
+            CONUS_ALBERS,
+            valid_states=states if config.get("filter_on_state", False) else None,
+            shapefile_dir=shapefile_dir,
+            use_cache=use_cache,
+            bbox=bbox,
+        )
+        if not is_point_or_line_layer(gdf_exclude):
+            continue
+
+        print(f"Getting distances to {description}...")
+        (point_idx, _), nearest = shapely.STRtree(
+            gdf_exclude.geometry.to_numpy()
+        ).query_nearest(
+            points, max_distance=max_distance, return_distance=True, all_matches=False
+        )
+        distance = np.full(len(points), np.inf, dtype=np.float32)
+        distance[point_idx] = nearest
+        distances[description] = distance
+
+    return pd.DataFrame(distances)
+
+
+def get_layer_bounds(
+    table: BarnTable, extent: LayerExtent | None = None
+) -> tuple[tuple | None, tuple | None, LayerExtent]:
+    """Get the bounds to load exclusion layers for and to clip them to.
+
+    Args:
+        table: Table of barns.
+        extent: Area to load exclusion layers for. Defaults to the bounds and states of the table.
+
+    Returns:
+        Tuple of (bbox, clip_bbox, extent), where clip_bbox is None if the layers are loaded for
+        the bounds of the table.
+    """
+    bbox = get_bounds(table.points())
+    if extent is None:
+        return bbox, None, LayerExtent(bbox, table.get_states())
+    return extent.bbox, bbox, extent
+
+
+def get_layer_extent(gdf_barns: gpd.GeoDataFrame) -> LayerExtent:
+    """Get the area to load exclusion layers for when filtering barns in partitions.
+
+    Note: Layers filtered on state keep the features in every state with barns, including barns
+    that are later dropped for having no integrator access.
+
+    Args:
+        gdf_barns: GeoDataFrame of barns.
+
+    Returns:
+        The bounds and states of every barn.
+    """
+    states = lookup_states(gdf_barns.geometry)
+    return LayerExtent(get_bounds(gdf_barns), sorted(states.dropna().unique()))
+
+
+def get_filter_mask(
+    config: dict,
+    x: np.ndarray,
+    y: np.ndarray,
+    crs: str,
+    valid_states: list | None = None,
+    shapefile_dir: Path = SHAPEFILE_DIR,
+    use_cache: bool = True,
+    bbox: tuple | None = None,
+    clip_bbox: tuple | None = None,
+    cache_dir: Path = CACHE_DIR,
+) -> FilterMask:
+    """Load a single exclusion layer and find the points it excludes.
+
+    This is self-contained so it can run in a worker process, and times itself so the worker
+    can report the same statistics as apply_filters.
+
+    Args:
+        config: Filter configuration from config_geo_filters.yaml.
+        x: Point x coordinates.
+        y: Point y coordinates.
+        crs: CRS of the point coordinates.
+        valid_states: State abbreviations to keep exclusion geometries for. Keeps all if None.
+        shapefile_dir: Directory containing shapefiles.
+        use_cache: Whether to use cached preprocessed exclusion layers.
+        bbox: Bounds in CONUS_ALBERS of the area of interest (see get_bounds).
+        clip_bbox: Bounds in CONUS_ALBERS of the points, if the layer is loaded for a larger
+            bbox (see load_exclusion_layer).
+        cache_dir: Directory for cached layers.
+
+    Returns:
+        Boolean array that is True for points to exclude, with the load and join seconds.
+    """
+    points = gpd.GeoSeries(gpd.points_from_xy(x, y), crs=crs)
+    start = time.perf_counter()
+    if config.get("tiled", False):
+        buffer = config.get("buffer", 0)
+        distances = get_tiled_distances(
+            points, config, buffer, shapefile_dir, use_cache, cache_dir
+        )
+        # Note: Tiles are read as they're joined, so this is all counted as join time
+        return FilterMask(distances <= buffer, 0.0, time.perf_counter() - start)
+
+    exclude_gdf = load_exclusion_layer(
+        config,
+        crs,
+        valid_states=valid_states,
+        shapefile_dir=shapefile_dir,
+        use_cache=use_cache,
+        cache_dir=cache_dir,
+        bbox=bbox,
+        clip_bbox=clip_bbox,
+    )
+    load_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    mask = get_membership_mask(
+        points,
+        exclude_gdf,
+        how=config.get("how", "inside"),
+        distance=get_query_distance(exclude_gdf, config.get("buffer", 0)),
+    )
+    return FilterMask(mask, load_seconds, time.perf_counter() - start)
 
 
 def filter_barns_handler(
-    gdf_barns: gpd.GeoDataFrame,
+    table: BarnTable,
     filters_config: list,
     data_dir: Path = SHAPEFILE_DIR,
     cities_by_state: dict = cities_by_state,
-) -> gpd.GeoDataFrame:
+    use_cache: bool = True,
+    n_workers: int = 1,
+    skip_excluded: bool = True,
+    extent: LayerExtent | None = None,
+    order_by_cost: bool = False,
+    stats_path: Path | None = None,
+) -> BarnTable:
     """Apply a series of filters to exclude barns based on various criteria.
 
     Args:
-        gdf_barns: GeoDataFrame of barns.
+        table: Table of barns.
         filters_config: List of filter configurations.
         data_dir: Directory containing shapefiles.
         cities_by_state: Dictionary of major cities by state to exclude.
+        use_cache: Whether to use cached preprocessed exclusion layers.
+        n_workers: Number of worker processes for evaluating filters concurrently.
+        skip_excluded: Whether to skip barns that an earlier filter already excluded.
+        extent: Area to load exclusion layers for (see apply_filters).
+        order_by_cost: Whether to order filters by their cost in earlier runs (see apply_filters).
+        stats_path: Path to save filter statistics to (see apply_filters).
 
     Returns:
-        Filtered GeoDataFrame of barns.
+        The table with excluded barns marked and an exclude_reasons bitmask (see
+        get_reason_names).
     """
+    reason_names = get_reason_names(filters_config)
+
     # Exclude barns in major cities
     # Note: Do this separately from the filters in config since we need to aggregate the cities
     print("Excluding barns in major cities...")
-    cities_all = gpd.read_parquet(CITIES_PATH)
-    matches = []
-    for state, cities in cities_by_state.items():
-        for city in cities:
-            match = cities_all[
-                cities_all["name"].str.contains(city, case=False, na=False)
-                & cities_all["name"].str.contains(state, case=False, na=False)
-            ]
-            matches.append(match)
-    cities_filtered = pd.concat(matches, ignore_index=True).drop_duplicates()
-    cities_filtered = gpd.GeoDataFrame(cities_filtered, geometry="geometry")
-    previously_excluded = len(gdf_barns[gdf_barns.exclude == 1])
-    gdf_barns = filter_on_membership(gdf_barns, cities_filtered)
-    print(
-        f"Excluded {len(gdf_barns[gdf_barns.exclude == 1]) - previously_excluded} barns in major cities"
+    gdf_cities = load_city_polygons(cities_by_state, table.crs, use_cache=use_cache)
+    previously_excluded = table.n_excluded
+    table = filter_on_membership(
+        table,
+        gdf_cities,
+        preprocessed=True,
+        skip_excluded=skip_excluded,
+        reason_bit=1 << reason_names.index(CITIES_REASON),
     )
+    print(f"Excluded {table.n_excluded - previously_excluded} barns in major cities")
 
     # Apply all other filters from config
-    gdf_barns = apply_filters(gdf_barns, filters_config, data_dir)
+    table = apply_filters(
+        table,
+        filters_config,
+        data_dir,
+        use_cache=use_cache,
+        n_workers=n_workers,
+        skip_excluded=skip_excluded,
+        extent=extent,
+        order_by_cost=order_by_cost,
+        stats_path=stats_path,
+    )
 
-    print(f"There are {len(gdf_barns[gdf_barns.exclude == 0])} barns remaining")
-    return gdf_barns
+    print(f"There are {len(table) - table.n_excluded} barns remaining")
+    return table
 
 
 def apply_filters(
-    gdf: gpd.GeoDataFrame, filters_config: list, shapefile_dir: Path = SHAPEFILE_DIR
-) -> gpd.GeoDataFrame:
-    """Apply a series of spatial filters to a GeoDataFrame.
+    table: BarnTable,
+    filters_config: list,
+    shapefile_dir: Path = SHAPEFILE_DIR,
+    use_cache: bool = True,
+    n_workers: int = 1,
+    skip_excluded: bool = True,
+    order_by_cost: bool = False,
+    stats_path: Path | None = None,
+    extent: LayerExtent | None = None,
+    cache_dir: Path = CACHE_DIR,
+) -> BarnTable:
+    """Apply a series of spatial filters to a table of barns.
+
+    The load time, join time and fraction of barns excluded by each filter can be saved to
+    stats_path, and later runs can use them to apply the cheapest filters per excluded barn
+    first.
 
     Args:
-        gdf: Input GeoDataFrame.
+        table: Table of barns.
         filters_config: List of filter configurations.
         shapefile_dir: Directory containing shapefiles.
+        use_cache: Whether to use cached preprocessed exclusion layers.
+        n_workers: Number of worker processes. If more than one, every filter is evaluated
+            independently in a process pool and the exclusions are combined at the end.
+        skip_excluded: Whether to skip rows that an earlier filter already excluded. This is
+            faster, but exclude_reasons only records the first filter that excluded each row.
+        order_by_cost: Whether to order filters by their cost per excluded barn in earlier runs
+            instead of the config order. With skip_excluded, exclude_reasons records the first
+            filter that excluded each row in the order they ran, so reasons depend on the order.
+        stats_path: Path to save the statistics of this run to, and to read the statistics for
+            order_by_cost from. Statistics aren't saved if None, and are read from
+            FILTER_STATS_PATH. Only set this for runs on every barn in a single process, since
+            partitions would race to write the file and smoke tests would skew it.
+        extent: Area to load and cache exclusion layers for. Each layer is then clipped to the
+            bounds of the table, so tables in the same extent (like spatial partitions) share
+            one cached copy of each layer. Defaults to the bounds and states of the table.
+        cache_dir: Directory for cached layers.
 
     Returns:
-        Filtered GeoDataFrame.
+        The table with excluded barns marked.
     """
+    if n_workers > 1:
+        return apply_filters_parallel(
+            table,
+            filters_config,
+            shapefile_dir,
+            use_cache,
+            n_workers,
+            skip_excluded,
+            stats_path,
+            extent,
+            cache_dir,
+        )
+
+    reason_names = get_reason_names(filters_config)
+    if order_by_cost:
+        filter_stats = load_filter_stats(stats_path or FILTER_STATS_PATH)
+        filters_config = order_filters(filters_config, filter_stats)
+        print(f"Filter order: {[config['description'] for config in filters_config]}")
+
+    bbox, clip_bbox, extent = get_layer_bounds(table, extent)
+    run_stats = {}
     for config in filters_config:
         description = config["description"]
-        exclude_gdf_path = shapefile_dir / config["filename"]
-        buffer = config.get("buffer", 0)
         how = config.get("how", "inside")
         filter_on_state = config.get("filter_on_state", False)
+        valid_states = extent.states if filter_on_state else None
 
         print(f"Filtering barns in/on {description}...")
-        print(f"Reading file {exclude_gdf_path}")
-        if exclude_gdf_path.suffix == ".gdb":
-            layer = config.get("layer")
-            exclude_gdf = gpd.read_file(exclude_gdf_path, layer=layer)
+        previously_excluded = table.n_excluded
+        n_tested = len(table.rows(skip_excluded))
+        start = time.perf_counter()
+        if config.get("tiled", False):
+            # Note: Tiles are read as they're joined, so this is all counted as join time
+            load_seconds = 0.0
+            table = filter_on_tiles(
+                table,
+                config,
+                shapefile_dir,
+                use_cache=use_cache,
+                skip_excluded=skip_excluded,
+                reason_bit=1 << reason_names.index(description),
+                cache_dir=cache_dir,
+            )
         else:
-            exclude_gdf = gpd.read_file(exclude_gdf_path)
+            exclude_gdf = load_exclusion_layer(
+                config,
+                table.crs,
+                valid_states=valid_states,
+                shapefile_dir=shapefile_dir,
+                use_cache=use_cache,
+                cache_dir=cache_dir,
+                bbox=bbox,
+                clip_bbox=clip_bbox,
+            )
+            load_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+
+            print("Applying filter...")
+            table = filter_on_membership(
+                table,
+                exclude_gdf,
+                how=how,
+                buffer=config.get("buffer", 0),
+                preprocessed=True,
+                skip_excluded=skip_excluded,
+                reason_bit=1 << reason_names.index(description),
+            )
+        join_seconds = time.perf_counter() - start
+        excluded_count = table.n_excluded - previously_excluded
+        print(f"Excluded {excluded_count} barns in/on {description}")
+        run_stats[description] = get_filter_stats(
+            load_seconds, join_seconds, n_tested, excluded_count
+        )
+
+    print_filter_stats(run_stats)
+    if stats_path is not None:
+        save_filter_stats(run_stats, stats_path)
+    return table
+
+
+def apply_filters_parallel(
+    table: BarnTable,
+    filters_config: list,
+    shapefile_dir: Path = SHAPEFILE_DIR,
+    use_cache: bool = True,
+    n_workers: int = 4,
+    skip_excluded: bool = True,
+    stats_path: Path | None = None,
+    extent: LayerExtent | None = None,
+    cache_dir: Path = CACHE_DIR,
+) -> BarnTable:
+    """Apply spatial filters concurrently and combine the exclusions.
+
+    Each filter is evaluated independently, so reading large layers overlaps with the spatial
+    joins for other layers. Every filter tests every barn, so the statistics count the barns
+    each filter excludes on its own, including barns another filter also excludes.
 
-        print("Applying filter...")
-        previously_excluded = len(gdf[gdf.exclude == 1])
-        gdf = filter_on_membership(
-            gdf, exclude_gdf, buffer=buffer, filter_on_state=filter_on_state, how=how
+    Args:
+        table: Table of barns.
+        filters_config: List of filter configurations.
+        shapefile_dir: Directory containing shapefiles.
+        use_cache: Whether to use cached preprocessed exclusion layers.
+        n_workers: Number of worker processes.
+        skip_excluded: Whether to skip rows that were excluded before applying these filters.
+        stats_path: Path to save the statistics of this run to (see apply_filters).
+        extent: Area to load exclusion layers for (see apply_filters).
+        cache_dir: Directory for cached layers.
+
+    Returns:
+        The table with excluded barns marked.
+    """
+    tested = table.rows(skip_excluded)
+    x, y = table.x[tested], table.y[tested]
+    bbox, clip_bbox, extent = get_layer_bounds(table, extent)
+
+    print(f"Filtering barns on {len(filters_config)} layers with {n_workers} workers...")
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [
+            executor.submit(
+                get_filter_mask,
+                config,
+                x,
+                y,
+                table.crs,
+                valid_states=extent.states
+                if config.get("filter_on_state", False)
+                else None,
+                shapefile_dir=shapefile_dir,
+                use_cache=use_cache,
+                bbox=bbox,
+                clip_bbox=clip_bbox,
+                cache_dir=cache_dir,
+            )
+            for config in filters_config
+        ]
+        results = [future.result() for future in futures]
+
+    reason_names = get_reason_names(filters_config)
+    exclude = np.zeros(len(tested), dtype=bool)
+    run_stats = {}
+    for config, (mask, load_seconds, join_seconds) in zip(filters_config, results):
+        description = config["description"]
+        print(f"{mask.sum()} barns are in/on {description}")
+        exclude |= mask
+        table.set_excluded(tested[mask], 1 << reason_names.index(description))
+        run_stats[description] = get_filter_stats(
+            load_seconds, join_seconds, len(tested), int(mask.sum())
         )
-        excluded_count = len(gdf[gdf.exclude == 1]) - previously_excluded
-        print(f"Excluded {excluded_count} barns in/on {description}")
+    print(f"Excluded {exclude.sum()} barns in total")
 
-    return gdf
+    print_filter_stats(run_stats)
+    if stats_path is not None:
+        save_filter_stats(run_stats, stats_path)
+    return table
 
 
-def filter_barns(
+def has_neighbors(
+    gdf: gpd.GeoDataFrame, distance: float = 50, min_neighbors: int = 1
+) -> np.ndarray:
+    """Check whether each point has enough other points nearby.
+
+    Args:
+        gdf: GeoDataFrame of points in a projected CRS.
+        distance: Distance to search for neighbors in the units of the CRS.
+        min_neighbors: Minimum number of other points required within the distance.
+
+    Returns:
+        Boolean array that is True for points with at least min_neighbors neighbors.
+    """
+    if len(gdf) == 0:
+        return np.zeros(0, dtype=bool)
+    coords = np.column_stack([gdf.geometry.x, gdf.geometry.y])
+    # Note: The closest point to each point is itself, so look for one extra point.
+    # Points past the distance upper bound come back with infinite distance.
+    distances, _ = cKDTree(coords).query(
+        coords, k=min_neighbors + 1, distance_upper_bound=distance, workers=-1
+    )
+    return np.isfinite(distances[:, min_neighbors])
+
+
+def get_integrator_access(
+    points: gpd.GeoSeries,
+    gdf_isochrones: gpd.GeoDataFrame,
+    access_col: str = "corp_access",
+    corp_col: str = "Parent Corporation",
+) -> tuple[np.ndarray, np.ndarray]:
+    """Get the integrator access level and parent corporation for each point.
+
+    Args:
+        points: GeoSeries of points.
+        gdf_isochrones: GeoDataFrame of captured areas with access levels.
+        access_col: Column name for the corporation access level.
+        corp_col: Column name for the parent corporation.
+
+    Returns:
+        Tuple of (integrator access, parent corporation) arrays aligned with points.
+        Integrator access is 0 for points outside of all captured areas, and parent corporation
+        is None for points outside of all single corporation areas.
+    """
+    gdf_isochrones = gdf_isochrones.to_crs(points.crs)
+    # Buffer to fix invalid geometries
+    geoms = gdf_isochrones.geometry.buffer(0).to_numpy()
+    access = gdf_isochrones[access_col].to_numpy()
+    corps = gdf_isochrones[corp_col].to_numpy()
+
+    # Note: Areas are messy buffered geometries, so a point can be in more than one.
+    # Take the highest access level for each point.
+    point_idx, area_idx = shapely.STRtree(geoms).query(
+        points.to_numpy(), predicate="within"
+    )
+    integrator_access = np.zeros(len(points), dtype=int)
+    np.maximum.at(integrator_access, point_idx, access[area_idx])
+
+    parent_corporation = np.full(len(points), None, dtype=object)
+    single_corp = access[area_idx] == 1
+    parent_corporation[point_idx[single_corp]] = corps[area_idx[single_corp]]
+
+    return integrator_access, parent_corporation
+
+
+def filter_partition(
     gdf_barns: gpd.GeoDataFrame,
     gdf_isochrones: gpd.GeoDataFrame,
+    n_core: int | None = None,
     shapefile_dir: Path = SHAPEFILE_DIR,
     nearest_neighbor: int = 50,
-    smoke_test: bool = False,
+    min_neighbors: int = 1,
     filter_barns: bool = True,
+    n_workers: int = 1,
+    skip_excluded: bool = True,
+    farm_distance: float | None = None,
+    extent: LayerExtent | None = None,
+    order_by_cost: bool = False,
+    stats_path: Path | None = None,
 ) -> gpd.GeoDataFrame:
-    """Filter barns based on various criteria and return the filtered GeoDataFrame.
+    """Run the barn filtering steps on barn centroids.
+
+    This is self-contained so it can run on one spatial partition in a worker process.
 
     Args:
-        gdf_barns: GeoDataFrame of barns.
+        gdf_barns: GeoDataFrame of barn centroids in ALBERS_EQUAL_AREA. The first n_core barns
+            are filtered. Any others are a halo of barns just outside of the partition, which
+            are only used to find neighbors for barns near its edges.
         gdf_isochrones: GeoDataFrame of isochrones.
+        n_core: Number of barns to filter. Defaults to all of them.
         shapefile_dir: Directory containing shapefiles.
         nearest_neighbor: Distance to check for nearest neighbor in meters.
-        smoke_test: Flag to run in smoke test mode with a smaller sample size.
+        min_neighbors: Minimum number of other barns within nearest_neighbor to keep a barn.
         filter_barns: Flag to apply geospatial filtering on barns.
+        n_workers: Number of worker processes for evaluating filters concurrently.
+        skip_excluded: Whether to skip barns that an earlier filter already excluded.
+        farm_distance: If set, group barns into farm sites of barns within this distance in
+            meters of each other, and run the remaining steps once per farm site (see farms.py).
+        extent: Area to load exclusion layers for (see apply_filters).
+        order_by_cost: Whether to order filters by their cost in earlier runs (see apply_filters).
+        stats_path: Path to save filter statistics to (see apply_filters).
 
     Returns:
-        Filtered GeoDataFrame of barns.
+        Filtered GeoDataFrame of barns, with a farm_id column if farm_distance is set.
     """
-    if smoke_test:
-        n = 10000
-        gdf_barns = gdf_barns.sample(n=n)
-        print(f"Running in smoke test mode with {n} samples.")
-    else:
-        print(f"Running with {len(gdf_barns)} barns.")
-
-    # Project to equal area projection and get centroid for each barn
-    gdf_barns = gdf_barns.to_crs(ALBERS_EQUAL_AREA)
-    gdf_barns["geometry"] = gdf_barns["geometry"].centroid
+    n_core = len(gdf_barns) if n_core is None else n_core
 
     # Exclude barns with no nearest neighbor (barns are almost always in at least groups of two)
-    # TODO: Make this prettier?
-    def nearest_neighbor(geom, gdf, distance=nearest_neighbor):
-        nearest_idx = gdf.sindex.nearest(geom, exclusive=True, max_distance=distance)
-        return nearest_idx.size == 0
-
     print("Excluding barns without a nearest neighbor...")
-    gdf_barns["exclude"] = gdf_barns["geometry"].progress_apply(
-        lambda geom: nearest_neighbor(geom, gdf_barns, distance=50)
+    keep = has_neighbors(
+        gdf_barns, distance=nearest_neighbor, min_neighbors=min_neighbors
     )
+    # Note: Halo barns are only used to find neighbors for barns near the edges
+    keep[n_core:] = False
     # Drop the barns that don't have a nearest neighbor here to save computation time on other steps
-    gdf_barns = gdf_barns[~gdf_barns["exclude"]]
-    gdf_barns["exclude"] = gdf_barns["exclude"].astype(
-        int
-    )  # Dashboard expects int dtype
+    table = BarnTable.from_points(gdf_barns.geometry).keep(keep)
+
+    kwargs = {
+        "shapefile_dir": shapefile_dir,
+        "filter_barns": filter_barns,
+        "n_workers": n_workers,
+        "skip_excluded": skip_excluded,
+        "extent": extent,
+        "order_by_cost": order_by_cost,
+        "stats_path": stats_path,
+    }
+    if farm_distance is None:
+        table = filter_table(table, gdf_isochrones, **kwargs)
+        # Note: Only build the GeoDataFrame once all of the filtering is done
+        return table.to_geodataframe()
+
+    # Note: Barns on a farm are filtered together, so each join runs once per farm
+    sites, rows, labels = get_farm_sites(table, farm_distance)
+    print(f"Grouped {len(rows)} barns into {len(sites)} farm sites")
+    sites = filter_table(sites, gdf_isochrones, **kwargs)
+    table = broadcast_farm_sites(sites, table.to_crs(sites.crs), rows, labels)
+    farm_id = np.empty(len(table.x), dtype=sites.index.dtype)
+    farm_id[rows] = sites.index[labels]
+    return table.to_geodataframe().assign(**{FARM_COL: farm_id[table.rows()]})
+
+
+def filter_table(
+    table: BarnTable,
+    gdf_isochrones: gpd.GeoDataFrame,
+    shapefile_dir: Path = SHAPEFILE_DIR,
+    filter_barns: bool = True,
+    n_workers: int = 1,
+    skip_excluded: bool = True,
+    extent: LayerExtent | None = None,
+    order_by_cost: bool = False,
+    stats_path: Path | None = None,
+) -> BarnTable:
+    """Run the integrator access, state, and exclusion steps on a table of barns.
 
+    Args:
+        table: Table of barn centroids (or farm sites) in ALBERS_EQUAL_AREA.
+        gdf_isochrones: GeoDataFrame of isochrones.
+        shapefile_dir: Directory containing shapefiles.
+        filter_barns: Flag to apply geospatial filtering on barns.
+        n_workers: Number of worker processes for evaluating filters concurrently.
+        skip_excluded: Whether to skip barns that an earlier filter already excluded.
+        extent: Area to load exclusion layers for (see apply_filters).
+        order_by_cost: Whether to order filters by their cost in earlier runs (see apply_filters).
+        stats_path: Path to save filter statistics to (see apply_filters).
+
+    Returns:
+        The table in WGS84 with barns outside of the isochrones dropped and excluded barns
+        marked.
+    """
     # Project to latitude and longitude
-    gdf_barns = gdf_barns.to_crs(WGS84)
+    table.to_crs(WGS84)
 
     # Join with plant access isochrones
     print("Checking integrator access...")
-    gdf_barns["integrator_access"] = 0
-    gdf_single_corp = gdf_isochrones[gdf_isochrones["corp_access"] == 1]
-    gdf_two_corps = gdf_isochrones[gdf_isochrones["corp_access"] == 2]  #  noqa
-    gdf_three_plus_corps = gdf_isochrones[gdf_isochrones["corp_access"] == 3]  #  noqa
-
-    # Buffer to fix invalid geometries
-    gdf_single_corp["geometry"] = gdf_single_corp.geometry.buffer(0)
-    gdf_two_corps["geometry"] = gdf_two_corps.geometry.buffer(0)
-    gdf_three_plus_corps["geometry"] = gdf_three_plus_corps.geometry.buffer(0)
-
-    fsis_union = gpd.GeoDataFrame(
-        geometry=[gdf_single_corp.geometry.unary_union], crs=gdf_barns.crs
-    )
-
-    # TODO: can prob do this as a function
-    # Note: I think I'm preprocessing for the barn calculation here?
-    gdf_barns = gpd.sjoin(gdf_barns, fsis_union, how="left", predicate="within")
-    gdf_barns.loc[gdf_barns["index_right"].notna(), "integrator_access"] = 1
-    # TODO: is this the right dataframe here...
-    gdf_barns["parent_corporation"] = gdf_barns.progress_apply(
-        lambda row: (
-            gdf_single_corp.loc[row["index_right"], "Parent Corporation"]
-            if pd.notna(row["index_right"])
-            else None
-        ),
-        axis=1,
-    )
-    # Note: Need to drop the index column created by the join for future joins
-    gdf_barns = gdf_barns.drop("index_right", axis=1)
-
-    gdf_barns = gpd.sjoin(gdf_barns, gdf_two_corps, how="left", predicate="within")
-    gdf_barns.loc[gdf_barns["index_right"].notna(), "integrator_access"] = 2
-    gdf_barns = gdf_barns.drop("index_right", axis=1)
-
-    gdf_barns = gpd.sjoin(
-        gdf_barns, gdf_three_plus_corps, how="left", predicate="within"
+    rows = table.rows()
+    integrator_access, parent_corporation = get_integrator_access(
+        table.points(rows), gdf_isochrones
     )
-    gdf_barns.loc[gdf_barns["index_right"].notna(), "integrator_access"] = 3
-    gdf_barns = gdf_barns.drop("index_right", axis=1)
+    table.integrator_access[rows] = integrator_access
+    table.set_corporations(parent_corporation, rows)
 
     # TODO: add a flag for excluding barns without integrator access
-    gdf_barns = gdf_barns[gdf_barns["integrator_access"] != 0]
+    table.keep(table.integrator_access != 0)
 
     # TODO: I think I should have this as a flag in the utils function
     # Get state membership for each barn
+    # Note: Each barn gets exactly one state and one access level, so there are no duplicates
     print("Getting states for all barns...")
-    gdf_barns = get_state_info(gdf_barns)
+    rows = table.rows()
+    table.set_states(lookup_states(table.points(rows)), rows)
 
-    # Choose the first barn in each group of duplicates
-    # Note: This happens with joins on messy buffered geometries
-    if gdf_barns.index.duplicated().any():
-        original_crs = gdf_barns.crs
-        gdf_barns = gdf_barns.groupby(gdf_barns.index).first()
-        gdf_barns = gdf_barns.set_crs(original_crs)
-
-    print(f"Barns before filtering on shapefiles: {len(gdf_barns)}")
+    print(f"Barns before filtering on shapefiles: {len(table)}")
 
     with Path.open(FILTERS_CONFIG_FILEPATH) as f:
         filters_config = yaml.safe_load(f)
@@ -380,20 +1413,213 @@ def filter_barns(
 
     # Note: Option for skipping geospatial filtering on barns for faster runs
     if filter_barns:
-        gdf_barns = filter_barns_handler(gdf_barns, filters, shapefile_dir)
+        table = filter_barns_handler(
+            table,
+            filters,
+            shapefile_dir,
+            n_workers=n_workers,
+            skip_excluded=skip_excluded,
+            extent=extent,
+            order_by_cost=order_by_cost,
+            stats_path=stats_path,
+        )
+
+    return table
+
+
+def build_shared_caches(
+    shapefile_dir: Path = SHAPEFILE_DIR,
+    filter_barns: bool = True,
+    extent: LayerExtent | None = None,
+) -> None:
+    """Build the caches that every partition uses up front, so workers don't race to write them.
+
+    Each exclusion layer is read and preprocessed once for the whole extent, and partitions
+    read only the cached features near their barns.
+
+    Args:
+        shapefile_dir: Directory containing shapefiles.
+        filter_barns: Whether the exclusion filters will be applied.
+        extent: Area to load exclusion layers for (see get_layer_extent).
+    """
+    get_state_grid()
+    if filter_barns:
+        load_city_polygons(cities_by_state, WGS84)
+        for config in filters_config["filters"]:
+            if config.get("tiled", False):
+                get_tiled_layer(config, shapefile_dir)
+            elif extent is not None:
+                # Note: Partitions filter in WGS84 (see filter_table), so use the same cache key
+                filter_on_state = config.get("filter_on_state", False)
+                load_exclusion_layer(
+                    config,
+                    WGS84,
+                    valid_states=extent.states if filter_on_state else None,
+                    shapefile_dir=shapefile_dir,
+                    bbox=extent.bbox,
+                )
+
+
+def filter_barns_partitioned(
+    gdf_barns: gpd.GeoDataFrame,
+    gdf_isochrones: gpd.GeoDataFrame,
+    partition_size: float,
+    shapefile_dir: Path = SHAPEFILE_DIR,
+    nearest_neighbor: int = 50,
+    min_neighbors: int = 1,
+    filter_barns: bool = True,
+    n_workers: int = 4,
+    skip_excluded: bool = True,
+    farm_distance: float | None = None,
+    order_by_cost: bool = False,
+) -> gpd.GeoDataFrame:
+    """Run the barn filtering steps on square spatial partitions in a process pool.
+
+    Each worker gets only the barns in (and just around) its partition and the isochrones that
+    intersect it. Exclusion layers are preprocessed and cached once for every barn, and each
+    worker reads only the cached features near its barns.
+
+    Args:
+        gdf_barns: GeoDataFrame of barn centroids in ALBERS_EQUAL_AREA.
+        gdf_isochrones: GeoDataFrame of isochrones.
+        partition_size: Width of each partition in meters.
+        shapefile_dir: Directory containing shapefiles.
+        nearest_neighbor: Distance to check for nearest neighbor in meters.
+        min_neighbors: Minimum number of other barns within nearest_neighbor to keep a barn.
+        filter_barns: Flag to apply geospatial filtering on barns.
+        n_workers: Number of worker processes.
+        skip_excluded: Whether to skip barns that an earlier filter already excluded.
+        farm_distance: If set, group barns into farm sites within each partition (see
+            filter_partition).
+        order_by_cost: Whether to order filters by their cost in earlier runs (see
+            apply_filters). Partitions don't save filter statistics.
+
+    Returns:
+        Filtered GeoDataFrame of barns, in the same order as the input.
+    """
+    if len(gdf_barns) == 0:
+        return filter_partition(
+            gdf_barns,
+            gdf_isochrones,
+            shapefile_dir=shapefile_dir,
+            filter_barns=filter_barns,
+            skip_excluded=skip_excluded,
+            farm_distance=farm_distance,
+        )
+
+    coords = shapely.get_coordinates(gdf_barns.geometry.to_numpy())
+    partitions = get_partitions(
+        coords[:, 0], coords[:, 1], partition_size, halo=nearest_neighbor
+    )
+    isochrones_tree = shapely.STRtree(
+        gdf_isochrones.geometry.to_crs(gdf_barns.crs).to_numpy()
+    )
+
+    extent = get_layer_extent(gdf_barns) if filter_barns else None
+    build_shared_caches(shapefile_dir, filter_barns, extent)
+
+    print(f"Filtering barns in {len(partitions)} partitions with {n_workers} workers...")
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [
+            executor.submit(
+                filter_partition,
+                gdf_barns.iloc[np.concatenate([partition.core, partition.halo])],
+                gdf_isochrones.iloc[
+                    np.sort(isochrones_tree.query(shapely.box(*partition.bounds)))
+                ],
+                n_core=len(partition.core),
+                shapefile_dir=shapefile_dir,
+                nearest_neighbor=nearest_neighbor,
+                min_neighbors=min_neighbors,
+                filter_barns=filter_barns,
+                skip_excluded=skip_excluded,
+                farm_distance=farm_distance,
+                extent=extent,
+                order_by_cost=order_by_cost,
+            )
+            for partition in partitions
+        ]
+        parts = [future.result() for future in futures]
+
+    gdf_filtered = pd.concat(parts)
+    # Note: Restore the input order, since partitions are processed by location
+    order = np.argsort(gdf_barns.index.get_indexer(gdf_filtered.index), kind="stable")
+    return gdf_filtered.iloc[order]
+
+
+def filter_barns(
+    gdf_barns: gpd.GeoDataFrame,
+    gdf_isochrones: gpd.GeoDataFrame,
+    shapefile_dir: Path = SHAPEFILE_DIR,
+    nearest_neighbor: int = 50,
+    min_neighbors: int = 1,
+    smoke_test: bool = False,
+    filter_barns: bool = True,
+    n_workers: int = 1,
+    skip_excluded: bool = True,
+    partition_size: float | None = None,
+    farm_distance: float | None = None,
+    order_by_cost: bool = False,
+    stats_path: Path | None = None,
+) -> gpd.GeoDataFrame:
+    """Filter barns based on various criteria and return the filtered GeoDataFrame.
 
-    # TODO: Maybe put this in a config
-    OUTPUT_COLS = [
-        "state",
-        "parent_corporation",
-        "integrator_access",
-        "geometry",
-        "exclude",
-    ]
-    gdf_barns = gdf_barns[OUTPUT_COLS]
-    gdf_barns = gdf_barns.set_geometry("geometry")
+    Args:
+        gdf_barns: GeoDataFrame of barns.
+        gdf_isochrones: GeoDataFrame of isochrones.
+        shapefile_dir: Directory containing shapefiles.
+        nearest_neighbor: Distance to check for nearest neighbor in meters.
+        min_neighbors: Minimum number of other barns within nearest_neighbor to keep a barn.
+        smoke_test: Flag to run in smoke test mode with a smaller sample size.
+        filter_barns: Flag to apply geospatial filtering on barns.
+        n_workers: Number of worker processes. Filters are evaluated concurrently, or partitions
+            are processed concurrently if partition_size is set.
+        skip_excluded: Whether to skip barns that an earlier filter already excluded. Set this to
+            False to record every reason a barn is excluded in "exclude_reasons".
+        partition_size: If set, split barns into square partitions of this width in meters and
+            run every filtering step on each partition in a process pool.
+        farm_distance: If set, group barns within this distance in meters of each other into
+            farm sites and run the joins once per farm site. Off by default.
+        order_by_cost: Whether to order filters by their cost in earlier runs (see
+            apply_filters).
+        stats_path: Path to save filter statistics to (see apply_filters). Statistics aren't
+            saved for smoke tests or partitioned runs.
+
+    Returns:
+        Filtered GeoDataFrame of barns.
+    """
+    if smoke_test:
+        n = 10000
+        gdf_barns = gdf_barns.sample(n=n)
+        print(f"Running in smoke test mode with {n} samples.")
+    else:
+        print(f"Running with {len(gdf_barns)} barns.")
 
-    return gdf_barns
+    # Project to equal area projection and get centroid for each barn
+    gdf_barns = gdf_barns.to_crs(ALBERS_EQUAL_AREA)
+    gdf_barns["geometry"] = gdf_barns["geometry"].centroid
+
+    kwargs = {
+        "shapefile_dir": shapefile_dir,
+        "nearest_neighbor": nearest_neighbor,
+        "min_neighbors": min_neighbors,
+        "filter_barns": filter_barns,
+        "n_workers": n_workers,
+        "skip_excluded": skip_excluded,
+        "farm_distance": farm_distance,
+        "order_by_cost": order_by_cost,
+    }
+    if partition_size is not None:
+        return filter_barns_partitioned(
+            gdf_barns, gdf_isochrones, partition_size, **kwargs
+        )
+    # Note: A sample of barns would skew the statistics of full runs
+    return filter_partition(
+        gdf_barns,
+        gdf_isochrones,
+        stats_path=None if smoke_test else stats_path,
+        **kwargs,
+    )
 
 
 if __name__ == "__main__":
@@ -407,15 +1633,127 @@ if __name__ == "__main__":
     parser.add_argument(
         "--smoke_test", action="store_true", help="Run in smoke test mode"
     )
+    parser.add_argument(
+        "--n_workers",
+        type=int,
+        default=1,
+        help="Number of worker processes for evaluating filters concurrently",
+    )
+    parser.add_argument(
+        "--partition_size",
+        type=float,
+        default=None,
+        help="Split barns into square partitions of this width in meters and process them in parallel",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["pandas", "dask", "duckdb"],
+        default="pandas",
+        help="Run on one GeoDataFrame (pandas), on dask-geopandas partitions read from the file (dask), "
+        "or as SQL in DuckDB (duckdb)",
+    )
+    parser.add_argument(
+        "--memory_limit",
+        default=None,
+        help="Memory limit for the duckdb backend (e.g. 16GB). Larger intermediate results spill to disk",
+    )
+    parser.add_argument(
+        "--scheduler",
+        choices=["threads", "processes", "synchronous"],
+        default="processes",
+        help="Local dask scheduler for the dask backend",
+    )
+    parser.add_argument(
+        "--farm_distance",
+        type=float,
+        default=None,
+        help="Group barns within this distance in meters into farm sites and filter each site once",
+    )
+    parser.add_argument(
+        "--all_reasons",
+        action="store_true",
+        help="Test every barn against every filter to record all exclusion reasons",
+    )
+    parser.add_argument(
+        "--order_filters",
+        action="store_true",
+        help="Apply the filters with the lowest cost per excluded barn in earlier runs first. "
+        "exclude_reasons then records the first filter in that order to exclude each barn",
+    )
+    parser.add_argument(
+        "--distances",
+        action="store_true",
+        help="Save the distance from each barn to each point or line exclusion layer",
+    )
+    parser.add_argument(
+        "--max_distance",
+        type=float,
+        default=5000,
+        help="Largest distance in meters to search for exclusion features",
+    )
     args = parser.parse_args()
 
     SMOKE_TEST = args.smoke_test
 
-    # TODO: Maybe create a read function for this
-    gdf_barns = gpd.read_file(RAW_DIR / BARNS_FILENAME)
     # TODO: Filepaths...
     gdf_isochrones = gpd.read_file(CLEAN_DIR / "_clean_run" / "isochrones.geojson")
 
-    gdf_barns = filter_barns(gdf_barns, gdf_isochrones, smoke_test=SMOKE_TEST)
+    if args.backend == "dask":
+        # Note: Imported here since dask-geopandas is optional
+        from rafi.dask_backend import filter_barns_dask
+
+        if SMOKE_TEST:
+            raise ValueError("The dask backend doesn't support smoke tests")
+        gdf_barns = filter_barns_dask(
+            RAW_DIR / BARNS_FILENAME,
+            gdf_isochrones,
+            skip_excluded=not args.all_reasons,
+            partition_size=args.partition_size or 200000,
+            scheduler=args.scheduler,
+        )
+    elif args.backend == "duckdb":
+        # Note: Imported here since duckdb is optional
+        from rafi.duckdb_engine import filter_barns_duckdb
+
+        if SMOKE_TEST:
+            raise ValueError("The duckdb backend doesn't support smoke tests")
+        gdf_barns = filter_barns_duckdb(
+            RAW_DIR / BARNS_FILENAME,
+            gdf_isochrones,
+            filters_config["filters"],
+            skip_excluded=not args.all_reasons,
+            threads=args.n_workers if args.n_workers > 1 else None,
+            memory_limit=args.memory_limit,
+        )
+    else:
+        gdf_barns = read_barn_centroids(
+            RAW_DIR / BARNS_FILENAME, footprint_thresholds=footprint_thresholds
+        )
+        gdf_barns = filter_barns(
+            gdf_barns,
+            gdf_isochrones,
+            smoke_test=SMOKE_TEST,
+            n_workers=args.n_workers,
+            skip_excluded=not args.all_reasons,
+            partition_size=args.partition_size,
+            farm_distance=args.farm_distance,
+            order_by_cost=args.order_filters,
+            stats_path=FILTER_STATS_PATH,
+        )
 
     save_file(gdf_barns, RUN_DIR / "barns.geojson", gzip_file=True)
+    if FARM_COL in gdf_barns.columns:
+        save_file(get_farms(gdf_barns), RUN_DIR / "farms.geojson", gzip_file=True)
+    save_reason_names(
+        get_reason_names(filters_config["filters"]),
+        RUN_DIR / REASONS_FILENAME,
+        all_reasons=args.all_reasons,
+    )
+
+    if args.distances:
+        distances = get_exclusion_distances(
+            gdf_barns, filters_config["filters"], max_distance=args.max_distance
+        )
+        save_exclusion_distances(
+            distances, RUN_DIR / DISTANCES_FILENAME, args.max_distance
+        )
@@ -0,0 +1,120 @@
+"""Record how long each filter takes and how many barns it excludes, and order filters by cost."""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from rafi.constants import CACHE_DIR
+
+FILTER_STATS_PATH = CACHE_DIR / "filter_stats.json"
+
+
+def get_filter_stats(load_seconds: float, join_seconds: float, n_tested: int, n_excluded: int) -> dict:
+    """Build the statistics for one run of one filter.
+
+    Args:
+        load_seconds: Time spent loading the exclusion layer.
+        join_seconds: Time spent finding the barns to exclude.
+        n_tested: Number of barns tested, which are the barns that are still active.
+        n_excluded: Number of tested barns that were excluded.
+
+    Returns:
+        Dictionary of statistics for the filter.
+    """
+    return {
+        "load_seconds": load_seconds,
+        "join_seconds": join_seconds,
+        "n_tested": n_tested,
+        "n_excluded": n_excluded,
+        "fraction_excluded": n_excluded / n_tested if n_tested else 0.0,
+    }
+
+
+def get_cost_per_excluded(stats: dict) -> float:
+    """Get the join seconds a filter spends for each barn it excludes.
+
+    Note: With join time per tested barn c and fraction of tested barns excluded p, running
+    filters in increasing order of c / p minimizes the total time when excluded barns are
+    skipped. Load time is left out, since each layer is loaded once whatever the order. Both
+    rates are per tested barn, so a filter doesn't look cheaper just because it ran early and
+    tested more barns.
+
+    Args:
+        stats: Statistics for a filter from get_filter_stats.
+
+    Returns:
+        Join seconds per excluded barn, or infinity for filters that excluded nothing.
+    """
+    if stats["n_excluded"] == 0:
+        return np.inf
+    cost_per_barn = stats["join_seconds"] / stats["n_tested"]
+    return cost_per_barn / stats["fraction_excluded"]
+
+
+def order_filters(filters_config: list, filter_stats: dict) -> list:
+    """Order filters by cost per excluded barn from earlier runs.
+
+    Filters without statistics go first so they get measured, and ties keep the config order.
+
+    Args:
+        filters_config: List of filter configurations.
+        filter_stats: Statistics by filter description from load_filter_stats.
+
+    Returns:
+        Reordered list of filter configurations.
+    """
+    costs = [
+        get_cost_per_excluded(filter_stats[config["description"]]) if config["description"] in filter_stats else 0
+        for config in filters_config
+    ]
+    order = np.argsort(costs, kind="stable")
+    return [filters_config[i] for i in order]
+
+
+def load_filter_stats(filepath: Path = FILTER_STATS_PATH) -> dict:
+    """Load the filter statistics saved by earlier runs.
+
+    Args:
+        filepath: Path to the JSON file.
+
+    Returns:
+        Statistics by filter description. Empty if there are none yet.
+    """
+    if not Path(filepath).exists():
+        return {}
+    with Path.open(filepath) as f:
+        return json.load(f)
+
+
+def save_filter_stats(filter_stats: dict, filepath: Path = FILTER_STATS_PATH) -> None:
+    """Save statistics from this run over the statistics of earlier runs.
+
+    Args:
+        filter_stats: Statistics by filter description from this run.
+        filepath: Path to the JSON file.
+    """
+    filepath = Path(filepath)
+    Path.mkdir(filepath.parent, parents=True, exist_ok=True)
+    filter_stats = {**load_filter_stats(filepath), **filter_stats}
+    # Note: Write to a temporary file first so concurrent runs never read a partial file
+    tmp_path = filepath.with_suffix(f".{os.getpid()}.tmp")
+    with Path.open(tmp_path, "w") as f:
+        json.dump(filter_stats, f, indent=2)
+    tmp_path.replace(filepath)
+
+
+def print_filter_stats(filter_stats: dict) -> None:
+    """Print a table of the cost of each filter in the order they ran.
+
+    Args:
+        filter_stats: Statistics by filter description from this run.
+    """
+    if not filter_stats:
+        return
+    df = pd.DataFrame.from_dict(filter_stats, orient="index")
+    df["seconds_per_excluded"] = [get_cost_per_excluded(stats) for stats in filter_stats.values()]
+    print("Filter costs:")
+    print(df.to_string(float_format="{:.4g}".format))
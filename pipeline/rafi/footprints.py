@@ -0,0 +1,112 @@
+"""Drop implausible barn detections using the shape of their footprints."""
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from rafi.constants import ALBERS_EQUAL_AREA
+
+# Note: Each threshold is (statistic, comparison). Barns are dropped when the comparison fails.
+THRESHOLDS = {
+    "min_area": ("area", np.greater_equal),
+    "max_area": ("area", np.less_equal),
+    "min_width": ("width", np.greater_equal),
+    "max_width": ("width", np.less_equal),
+    "max_length": ("length", np.less_equal),
+    "max_aspect_ratio": ("aspect_ratio", np.less_equal),
+}
+
+
+def get_footprint_stats(footprints: gpd.GeoSeries, crs: str = ALBERS_EQUAL_AREA) -> pd.DataFrame:
+    """Measure barn footprints using their minimum rotated rectangles.
+
+    Args:
+        footprints: GeoSeries of barn polygons.
+        crs: Equal area CRS to measure in.
+
+    Returns:
+        DataFrame aligned with footprints with the area, the length and width of the minimum
+        rotated rectangle, and the aspect ratio (length / width, infinite for zero width).
+    """
+    geoms = footprints.to_crs(crs).to_numpy()
+    rectangles = shapely.oriented_envelope(geoms)
+    # Note: Degenerate footprints give a line or point instead of a rectangle
+    length = shapely.length(rectangles)
+    width = np.zeros(len(geoms))
+
+    is_polygon = shapely.get_type_id(rectangles) == shapely.GeometryType.POLYGON
+    coords, idx = shapely.get_coordinates(shapely.get_exterior_ring(rectangles[is_polygon]), return_index=True)
+    first = np.searchsorted(idx, np.arange(is_polygon.sum()))
+    # Note: Two adjacent sides of the rectangle start at its first corner
+    side_a = np.hypot(*(coords[first + 1] - coords[first]).T)
+    side_b = np.hypot(*(coords[first + 2] - coords[first + 1]).T)
+    length[is_polygon] = np.maximum(side_a, side_b)
+    width[is_polygon] = np.minimum(side_a, side_b)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        aspect_ratio = np.where(width > 0, length / width, np.inf)
+    return pd.DataFrame(
+        {"area": shapely.area(geoms), "length": length, "width": width, "aspect_ratio": aspect_ratio},
+        index=footprints.index,
+    )
+
+
+def get_footprint_mask(stats: pd.DataFrame, thresholds: dict) -> tuple[np.ndarray, dict[str, int]]:
+    """Find the barns whose footprints are within the thresholds.
+
+    Args:
+        stats: Footprint statistics from get_footprint_stats.
+        thresholds: Threshold values by name (see THRESHOLDS). Thresholds that are missing or
+            None aren't applied.
+
+    Returns:
+        Tuple of (boolean array that is True for barns to keep, number of barns that fail each
+        threshold). A barn can fail more than one threshold.
+
+    Raises:
+        ValueError: If a threshold name is unknown.
+    """
+    unknown = set(thresholds) - set(THRESHOLDS)
+    if unknown:
+        raise ValueError(f"Unknown footprint thresholds {sorted(unknown)}. Use any of {list(THRESHOLDS)}.")
+    keep = np.ones(len(stats), dtype=bool)
+    counts = {}
+    for name, value in thresholds.items():
+        if value is None:
+            continue
+        column, comparison = THRESHOLDS[name]
+        passes = comparison(stats[column].to_numpy(), value)
+        counts[name] = int((~passes).sum())
+        keep &= passes
+    return keep, counts
+
+
+def filter_footprints(
+    gdf: gpd.GeoDataFrame, thresholds: dict, crs: str = ALBERS_EQUAL_AREA
+) -> tuple[gpd.GeoDataFrame, dict[str, int]]:
+    """Drop barns with footprints outside of the thresholds.
+
+    Args:
+        gdf: GeoDataFrame of barn polygons.
+        thresholds: Threshold values by name (see THRESHOLDS).
+        crs: Equal area CRS to measure in.
+
+    Returns:
+        Tuple of (barns to keep, number of barns that fail each threshold).
+    """
+    keep, counts = get_footprint_mask(get_footprint_stats(gdf.geometry, crs), thresholds)
+    return gdf[keep].copy(), counts
+
+
+def print_footprint_counts(counts: dict[str, int], n_barns: int, n_kept: int) -> None:
+    """Report how many barns the footprint thresholds dropped.
+
+    Args:
+        counts: Number of barns that failed each threshold.
+        n_barns: Number of barns before filtering.
+        n_kept: Number of barns after filtering.
+    """
+    print(f"Dropped {n_barns - n_kept} of {n_barns} barns with implausible footprints")
+    for name, count in counts.items():
+        print(f"  {name}: {count}")
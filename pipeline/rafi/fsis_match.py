@@ -466,7 +466,8 @@ def fsis_match(
 
     output_geojson = output_geojson.rename(columns=GEOJSON_RENAME_COLS)
 
-    GEOJSON_COLS = list(GEOJSON_RENAME_COLS.values()) + ["geometry"]
+    # Note: Keep the DUNS and establishment numbers to identify plants (see get_plant_ids)
+    GEOJSON_COLS = ["duns_number_fsis", "establishment_number"] + list(GEOJSON_RENAME_COLS.values()) + ["geometry"]
     output_geojson = gpd.GeoDataFrame(output_geojson, geometry=output_geojson.geometry)
     # Note: Remove ZIP+4 from ZIP code when present
     output_geojson["Zip"] = output_geojson["Zip"].str.replace(r"-\d{4}$", "", regex=True)
@@ -0,0 +1,210 @@
+"""Geometry helpers for large spatial operations in the pipeline."""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from shapely.geometry.base import BaseGeometry
+
+
+def hilbert_order(geoms: np.ndarray) -> np.ndarray:
+    """Gets the order that sorts geometries along a Hilbert curve so nearby geometries are grouped together.
+
+    Args:
+        geoms: Array of shapely geometries.
+
+    Returns:
+        Array of indices that sorts the geometries.
+    """
+    return np.argsort(gpd.GeoSeries(geoms).hilbert_distance().to_numpy(), kind="stable")
+
+
+def is_coverage(geoms: np.ndarray, batch_size: int = 64) -> bool:
+    """Checks whether polygons only touch each other (ie none of them overlap).
+
+    Args:
+        geoms: Array of shapely geometries.
+        batch_size: Number of candidate pairs to check at a time.
+
+    Note: This doesn't check that shared edges have the same vertices on both sides, which
+    coverage_union_all also needs (see parallel_union).
+
+    Returns:
+        True if all of the geometries are polygons and no two polygons share interior area.
+    """
+    if not np.isin(shapely.get_type_id(geoms), [3, 6]).all():  # Polygon, MultiPolygon
+        return False
+    # Check each candidate pair from the spatial index once for shared interior area
+    left, right = shapely.STRtree(geoms).query(geoms)
+    pairs = left < right
+    left, right = left[pairs], right[pairs]
+    # Note: stop at the first overlapping batch since overlapping inputs usually overlap everywhere
+    for i in range(0, len(left), batch_size):
+        if shapely.relate_pattern(
+            geoms[left[i : i + batch_size]], geoms[right[i : i + batch_size]], "T********"
+        ).any():
+            return False
+    return True
+
+
+def subdivide(
+    geoms: gpd.GeoSeries | np.ndarray,
+    max_vertices: int = 256,
+    max_area: float | None = None,
+    max_depth: int = 16,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Splits large polygons into quadrants until each piece is small.
+
+    The bounding box of a huge polygon covers everything near it, so a spatial index can't skip
+    it and every predicate test runs against the whole polygon. Clipping it into quadtree cells
+    makes the index selective again.
+
+    Note: Points on the cut lines are on the boundary of the pieces rather than inside them.
+
+    Args:
+        geoms: Geometries to subdivide. Only polygons are split.
+        max_vertices: Largest number of vertices to leave in a piece.
+        max_area: Largest bounding box area to leave in a piece, if any.
+        max_depth: Largest number of times to split a polygon.
+
+    Returns:
+        Tuple of (pieces, index of the input geometry each piece came from).
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    # Note: Only loop over the geometries that might need splitting and pass the rest through
+    is_large = shapely.get_num_coordinates(geoms) > max_vertices
+    if max_area is not None:
+        minx, miny, maxx, maxy = shapely.bounds(geoms).T
+        is_large |= (maxx - minx) * (maxy - miny) > max_area
+    is_large &= np.isin(shapely.get_type_id(geoms), [3, 6])  # Polygon, MultiPolygon
+    keep = ~is_large & ~(shapely.is_missing(geoms) | shapely.is_empty(geoms))
+    pieces, parents = list(geoms[keep]), list(np.flatnonzero(keep))
+    for i in np.flatnonzero(is_large):
+        stack = [(geoms[i], 0)]
+        while stack:
+            piece, depth = stack.pop()
+            if shapely.is_missing(piece) or shapely.is_empty(piece):
+                continue
+            minx, miny, maxx, maxy = shapely.bounds(piece)
+            too_big = shapely.get_num_coordinates(piece) > max_vertices or (
+                max_area is not None and (maxx - minx) * (maxy - miny) > max_area
+            )
+            if depth >= max_depth or not too_big or shapely.get_type_id(piece) not in [3, 6]:
+                pieces.append(piece)
+                parents.append(i)
+                continue
+            midx, midy = (minx + maxx) / 2, (miny + maxy) / 2
+            for rect in [
+                (minx, miny, midx, midy),
+                (midx, miny, maxx, midy),
+                (minx, midy, midx, maxy),
+                (midx, midy, maxx, maxy),
+            ]:
+                clipped = shapely.clip_by_rect(piece, *rect)
+                # Note: clip_by_rect is fast but can return invalid polygons for polygons with holes
+                if not shapely.is_valid(clipped):
+                    clipped = shapely.intersection(piece, shapely.box(*rect))
+                stack.append((clipped, depth + 1))
+    pieces, parents = np.array(pieces, dtype=object), np.array(parents, dtype=np.intp)
+    order = np.argsort(parents, kind="stable")
+    return pieces[order], parents[order]
+
+
+def parallel_union(
+    geoms: gpd.GeoSeries | np.ndarray,
+    n_workers: int | None = None,
+    chunk_size: int = 256,
+) -> BaseGeometry:
+    """Unions geometries by splitting them into spatially compact chunks and reducing the chunks in parallel.
+
+    Geometries are sorted along a Hilbert curve so each chunk covers a small area, then each chunk
+    is unioned in a process pool and the results are unioned pairwise until one geometry is left.
+    If the polygons don't overlap and their shared edges line up, the much faster coverage union
+    is used instead.
+
+    Args:
+        geoms: Geometries to union.
+        n_workers: Number of worker processes. Defaults to the number of CPUs.
+        chunk_size: Number of geometries to union in each task.
+
+    Returns:
+        The union of all of the geometries.
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    geoms = geoms[~(shapely.is_missing(geoms) | shapely.is_empty(geoms))]
+    if len(geoms) == 0:
+        return shapely.GeometryCollection()
+    if is_coverage(geoms):
+        try:
+            return shapely.coverage_union_all(geoms)
+        except shapely.errors.GEOSException:
+            # Note: Adjacent polygons often split a shared edge at different vertices, which the
+            # coverage union can't handle, so fall back to a full union
+            pass
+
+    n_workers = n_workers or os.cpu_count()
+    if n_workers == 1 or len(geoms) <= chunk_size:
+        return shapely.union_all(geoms)
+
+    geoms = geoms[hilbert_order(geoms)]
+    chunks = [geoms[i : i + chunk_size] for i in range(0, len(geoms), chunk_size)]
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        parts = list(executor.map(shapely.union_all, chunks))
+        # Note: neighbouring parts are close to each other, so pairwise unions stay small
+        while len(parts) > 1:
+            pairs = [np.array(parts[i : i + 2], dtype=object) for i in range(0, len(parts), 2)]
+            parts = list(executor.map(shapely.union_all, pairs))
+    return parts[0]
+
+
+def parallel_dissolve(
+    gdf: gpd.GeoDataFrame,
+    by: str,
+    n_workers: int | None = None,
+    chunk_size: int = 256,
+    min_parallel_size: int = 2048,
+) -> gpd.GeoDataFrame:
+    """Dissolves geometries by a column, unioning the groups in a process pool.
+
+    Small groups are each unioned in one task, and groups larger than chunk_size are split into
+    chunks with parallel_union so one big group doesn't run in a single worker.
+
+    Args:
+        gdf: GeoDataFrame to dissolve.
+        by: Column to group by.
+        n_workers: Number of worker processes. Defaults to the number of CPUs.
+        chunk_size: Number of geometries to union in each task.
+        min_parallel_size: Smallest number of geometries to start a process pool for. Smaller
+            inputs are unioned serially since starting the pool takes longer.
+
+    Returns:
+        GeoDataFrame with the group column and the unioned geometry for each group.
+    """
+    geometry_col = gdf.geometry.name
+    groups = {
+        key: group.to_numpy()
+        for key, group in gdf.geometry.groupby(gdf[by], sort=True)
+    }
+    n_workers = n_workers or os.cpu_count()
+    if n_workers == 1 or len(gdf) < min_parallel_size:
+        unioned = {key: shapely.union_all(geoms) for key, geoms in groups.items()}
+    else:
+        small = [key for key, geoms in groups.items() if len(geoms) <= chunk_size]
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            unioned = dict(
+                zip(
+                    small,
+                    executor.map(shapely.union_all, [groups[key] for key in small]),
+                    strict=True,
+                )
+            )
+        for key, geoms in groups.items():
+            if key not in unioned:
+                unioned[key] = parallel_union(geoms, n_workers, chunk_size)
+    return gpd.GeoDataFrame(
+        {by: list(groups.keys()), geometry_col: [unioned[key] for key in groups]},
+        geometry=geometry_col,
+        crs=gdf.crs,
+    )
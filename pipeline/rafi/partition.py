@@ -0,0 +1,81 @@
+"""Split points into square spatial partitions so they can be processed independently."""
+
+from typing import NamedTuple
+
+import numpy as np
+
+
+class Partition(NamedTuple):
+    """Points in one square cell of a grid, plus a halo of points just outside of it."""
+
+    bounds: tuple[float, float, float, float]
+    core: np.ndarray
+    halo: np.ndarray
+
+
+def get_partitions(x: np.ndarray, y: np.ndarray, size: float, halo: float = 0) -> list[Partition]:
+    """Assigns points to square grid cells.
+
+    Each point is in the core of exactly one partition. Points within the halo distance of
+    another cell are also in the halo of that cell, so neighbour tests near the edges of a cell
+    see the same points they would without partitioning.
+
+    Args:
+        x: Point x coordinates in a projected CRS.
+        y: Point y coordinates in a projected CRS.
+        size: Width of each cell in the units of the CRS.
+        halo: Distance outside of each cell to include points in its halo.
+
+    Returns:
+        Partition for each cell that has at least one point, with indices into x and y.
+    """
+    col = np.floor(x / size).astype(np.int64)
+    row = np.floor(y / size).astype(np.int64)
+    idx = np.arange(len(x))
+
+    # Note: Find the other cells that overlap the square of side 2 * halo around each point
+    n_cells = int(np.ceil(halo / size))
+    halo_keys = []
+    for d_col in range(-n_cells, n_cells + 1):
+        for d_row in range(-n_cells, n_cells + 1):
+            if d_col == 0 and d_row == 0:
+                continue
+            other_col, other_row = col + d_col, row + d_row
+            near = (
+                (other_col * size <= x + halo)
+                & ((other_col + 1) * size >= x - halo)
+                & (other_row * size <= y + halo)
+                & ((other_row + 1) * size >= y - halo)
+            )
+            halo_keys.append(np.column_stack([other_col[near], other_row[near], idx[near]]))
+    halo_keys.append(np.zeros((0, 3), dtype=np.int64))
+    halo_keys = np.unique(np.concatenate(halo_keys), axis=0)
+    halo_by_cell = {
+        (cell_col, cell_row): halo_keys[start:end, 2]
+        for cell_col, cell_row, start, end in _group_by_cell(halo_keys[:, 0], halo_keys[:, 1])
+    }
+
+    order = np.lexsort((idx, row, col))
+    partitions = []
+    for cell_col, cell_row, start, end in _group_by_cell(col[order], row[order]):
+        bounds = (cell_col * size, cell_row * size, (cell_col + 1) * size, (cell_row + 1) * size)
+        halo_idx = halo_by_cell.get((cell_col, cell_row), np.zeros(0, dtype=idx.dtype))
+        partitions.append(Partition(bounds, order[start:end], halo_idx))
+    return partitions
+
+
+def _group_by_cell(col: np.ndarray, row: np.ndarray) -> list[tuple[int, int, int, int]]:
+    """Finds the runs of equal cells in sorted cell coordinates.
+
+    Args:
+        col: Sorted cell columns.
+        row: Cell rows, sorted within each column.
+
+    Returns:
+        List of (col, row, start, end) for each run.
+    """
+    if len(col) == 0:
+        return []
+    starts = np.flatnonzero(np.r_[True, (col[1:] != col[:-1]) | (row[1:] != row[:-1])])
+    ends = np.r_[starts[1:], len(col)]
+    return [(int(col[start]), int(row[start]), start, end) for start, end in zip(starts, ends)]
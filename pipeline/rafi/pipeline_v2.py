@@ -9,11 +9,22 @@ import pandas as pd
 import yaml
 from calculate_captured_areas import calculate_captured_areas
 from constants import CLEAN_DIR, RAW_DIR
-from filter_barns import filter_barns
+from filter_barns import filter_barns, filters_config, footprint_thresholds, get_exclusion_distances
 from fsis_match import clean_fsis, clean_nets, fsis_match
 from get_plant_isochrones import get_plant_isochrones
 
-from rafi.utils import save_file
+from rafi.barn_access import ACCESS_FILENAME, PLANT_ID_COL, get_barn_access, get_plant_ids, save_barn_access
+from rafi.exclude_reasons import (
+    DISTANCES_FILENAME,
+    REASONS_FILENAME,
+    get_reason_names,
+    save_exclusion_distances,
+    save_reason_names,
+)
+from rafi.plant_distances import PLANT_DISTANCES_FILENAME, get_plant_distances, save_plant_distances
+from rafi.utils import read_barn_centroids, save_file
+
+MAX_EXCLUSION_DISTANCE = 5000  # meters
 
 
 def pipeline(
@@ -21,6 +32,8 @@ def pipeline(
     gdf_nets: gpd.GeoDataFrame,
     gdf_barns: gpd.GeoDataFrame,
     smoke_test: bool = False,
+    output_dir: Path | None = None,
+    all_reasons: bool = False,
 ) -> tuple[gpd.GeoDataFrame, gpd.GeoDataFrame, gpd.GeoDataFrame, gpd.GeoDataFrame]:
     """Runs the full pipeline for the RAFI project.
 
@@ -29,16 +42,32 @@ def pipeline(
         gdf_nets: GeoDataFrame of NETS data.
         gdf_barns: GeoDataFrame of barns data.
         smoke_test: Boolean flag to run a smoke test with a smaller dataset.
+        output_dir: Directory to save supplementary outputs (e.g. area metrics) to. Skipped if None.
+        all_reasons: Whether to test every barn against every filter, so exclusion distances can be used
+            to change buffers later (see exclude_reasons.py).
 
     Returns:
         A tuple of GeoDataFrames: (gdf_fsis, gdf_fsis_isochrones, gdf_isochrones, gdf_barns).
     """
     # TODO: Do I want to also return and save intermediate files?
     gdf_fsis, _, _, _ = fsis_match(gdf_fsis, gdf_nets)
+    # Note: Set plant IDs before the slow steps, so the saved plants and barn access share them
+    gdf_fsis[PLANT_ID_COL] = get_plant_ids(gdf_fsis)
     gdf_fsis_isochrones = get_plant_isochrones(gdf_fsis)
-    gdf_isochrones = calculate_captured_areas(gdf_fsis_isochrones)
+    captured_areas = calculate_captured_areas(gdf_fsis_isochrones, return_area_metrics=output_dir is not None)
+    if output_dir is None:
+        gdf_isochrones = captured_areas
+    else:
+        gdf_isochrones, area_metrics, overlap_matrix = captured_areas
+        save_file(area_metrics, output_dir / "area_metrics.csv", file_format="csv")
+        save_file(
+            overlap_matrix,
+            output_dir / "corp_overlap_matrix.csv",
+            file_format="csv",
+            index=True,
+        )
     # TODO: maybe add something to skip filtering for testing
-    gdf_barns = filter_barns(gdf_barns, gdf_isochrones, smoke_test=smoke_test)
+    gdf_barns = filter_barns(gdf_barns, gdf_isochrones, smoke_test=smoke_test, skip_excluded=not all_reasons)
     return gdf_fsis, gdf_fsis_isochrones, gdf_isochrones, gdf_barns
 
 
@@ -60,6 +89,12 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--smoke_test", action="store_true")
+    parser.add_argument(
+        "--distances",
+        action="store_true",
+        help="Test every barn against every filter and save the distance from each barn to each point or line "
+        "exclusion layer",
+    )
     args = parser.parse_args()
 
     SMOKE_TEST = args.smoke_test
@@ -99,13 +134,24 @@ if __name__ == "__main__":
     if SMOKE_TEST:
         gdf_fsis = gdf_fsis.sample(30)
 
-    gdf_barns = gpd.read_file(BARNS_PATH)
+    gdf_barns = read_barn_centroids(BARNS_PATH, footprint_thresholds=footprint_thresholds)
 
     gdf_fsis, gdf_fsis_isochrones, gdf_isochrones, gdf_barns = pipeline(
-        gdf_fsis, gdf_nets, gdf_barns, smoke_test=SMOKE_TEST
+        gdf_fsis, gdf_nets, gdf_barns, smoke_test=SMOKE_TEST, output_dir=RUN_DIR, all_reasons=args.distances
     )
 
     save_file(gdf_fsis, RUN_DIR / "plants.geojson")
     save_file(gdf_isochrones, RUN_DIR / "isochrones.geojson", gzip_file=True)
     save_file(gdf_fsis_isochrones, RUN_DIR / "plants_with_isochrones.geojson", gzip_file=True)
     save_file(gdf_barns, RUN_DIR / "barns.geojson", gzip_file=True)
+    save_reason_names(
+        get_reason_names(filters_config["filters"]), RUN_DIR / REASONS_FILENAME, all_reasons=args.distances
+    )
+
+    # Note: Save the supplementary outputs after the run itself, so an error here doesn't lose the run
+    if args.distances:
+        distances = get_exclusion_distances(gdf_barns, filters_config["filters"], max_distance=MAX_EXCLUSION_DISTANCE)
+        save_exclusion_distances(distances, RUN_DIR / DISTANCES_FILENAME, MAX_EXCLUSION_DISTANCE)
+    access = get_barn_access(gdf_barns, gdf_fsis_isochrones, id_col=PLANT_ID_COL)
+    save_barn_access(access, RUN_DIR / ACCESS_FILENAME)
+    save_plant_distances(get_plant_distances(gdf_barns, gdf_fsis), RUN_DIR / PLANT_DISTANCES_FILENAME)
@@ -0,0 +1,133 @@
+"""Straight-line distances from every barn to the nearest plants and to the nearest plant of each corporation."""
+
+import argparse
+import re
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from scipy.spatial import cKDTree
+
+from rafi.constants import CONUS_ALBERS
+
+PLANT_DISTANCES_FILENAME = "plant_distances.parquet"
+
+
+def query_nearest(tree: cKDTree, coords: np.ndarray, k: int = 1, batch_size: int = 1000000) -> tuple:
+    """Finds the k nearest points in a tree for coordinates in batches.
+
+    Args:
+        tree: KD-tree of plant coordinates.
+        coords: Array of (x, y) coordinates to query.
+        k: Number of nearest points to find.
+        batch_size: Number of coordinates to query at a time.
+
+    Returns:
+        Tuple of (distances, indices) arrays of shape (len(coords), k). Missing neighbors have an
+        infinite distance and an index of tree.n.
+    """
+    distances = np.full((len(coords), k), np.inf)
+    indices = np.full((len(coords), k), tree.n, dtype=np.int64)
+    for start in range(0, len(coords), batch_size):
+        batch = slice(start, start + batch_size)
+        batch_distances, batch_indices = tree.query(coords[batch], k=[*range(1, k + 1)], workers=-1)
+        distances[batch], indices[batch] = batch_distances, batch_indices
+    return distances, indices
+
+
+def get_corp_column(corp: str) -> str:
+    """Gets the snake case column name for the distance to the nearest plant of a corporation.
+
+    Args:
+        corp: Parent corporation name (e.g. "Pilgrim's Pride").
+
+    Returns:
+        Column name (e.g. "distance_pilgrim_s_pride").
+    """
+    return "distance_" + re.sub(r"[^0-9a-z]+", "_", corp.lower()).strip("_")
+
+
+def get_plant_distances(
+    gdf_barns: gpd.GeoDataFrame,
+    gdf_plants: gpd.GeoDataFrame,
+    k: int = 3,
+    corp_col: str = "Parent Corporation",
+    name_col: str = "Establishment Name",
+    sales_col: str = "Sales",
+    batch_size: int = 1000000,
+) -> pd.DataFrame:
+    """Builds a table of distances in meters from each barn to nearby plants.
+
+    Distances are measured in CONUS_ALBERS with KD-trees over the plant coordinates.
+
+    Args:
+        gdf_barns: GeoDataFrame of barn points.
+        gdf_plants: GeoDataFrame of plant points (see fsis_match).
+        k: Number of nearest plants to record for each barn.
+        corp_col: Column name for the parent corporation.
+        name_col: Column name for the plant name.
+        sales_col: Column name for the plant's display sales.
+        batch_size: Number of barns to query at a time.
+
+    Returns:
+        DataFrame aligned with gdf_barns with the name, distance, corporation and sales of each of
+        the k nearest plants, and the distance to the nearest plant of each corporation (see
+        get_corp_column). Missing plants have an infinite distance.
+
+    Raises:
+        ValueError: If two corporations have the same column name.
+    """
+    coords = shapely.get_coordinates(gdf_barns.geometry.to_crs(CONUS_ALBERS).to_numpy())
+    plants = gdf_plants.to_crs(CONUS_ALBERS)
+    plant_coords = shapely.get_coordinates(plants.geometry.to_numpy())
+
+    columns = {}
+    distances, indices = query_nearest(cKDTree(plant_coords), coords, k=k, batch_size=batch_size)
+    # Note: Add a row of missing values for the index of missing neighbors
+    names = pd.Categorical(plants[name_col])
+    name_codes = np.append(names.codes, -1)
+    corps = pd.Categorical(plants[corp_col])
+    corp_codes = np.append(corps.codes, -1)
+    sales = np.append(plants[sales_col].to_numpy(dtype=float), np.nan)
+    for i in range(k):
+        columns[f"plant_{i + 1}"] = pd.Categorical.from_codes(name_codes[indices[:, i]], categories=names.categories)
+        columns[f"plant_{i + 1}_distance"] = distances[:, i].astype(np.float32)
+        columns[f"plant_{i + 1}_corporation"] = pd.Categorical.from_codes(
+            corp_codes[indices[:, i]], categories=corps.categories
+        )
+        columns[f"plant_{i + 1}_sales"] = sales[indices[:, i]]
+
+    corp_columns = [get_corp_column(corp) for corp in corps.categories]
+    if len(set(corp_columns)) < len(corp_columns):
+        raise ValueError(f"Corporations {list(corps.categories)} don't have distinct column names")
+    for code, column in enumerate(corp_columns):
+        corp_tree = cKDTree(plant_coords[corps.codes == code])
+        corp_distances, _ = query_nearest(corp_tree, coords, batch_size=batch_size)
+        columns[column] = corp_distances[:, 0].astype(np.float32)
+
+    return pd.DataFrame(columns, index=gdf_barns.index)
+
+
+def save_plant_distances(distances: pd.DataFrame, filepath: Path) -> None:
+    """Saves the plant distance table as Parquet, indexed like the barns.
+
+    Args:
+        distances: Plant distance table from get_plant_distances.
+        filepath: Path to save the Parquet file to.
+    """
+    print(f"Saving file to {filepath}")
+    distances.to_parquet(filepath)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find the distance from each barn to the nearest plants")
+    parser.add_argument("run_dir", type=Path, help="Directory with barns.geojson and plants.geojson")
+    parser.add_argument("-k", type=int, default=3, help="Number of nearest plants to record for each barn")
+    args = parser.parse_args()
+
+    gdf_barns = gpd.read_file(args.run_dir / "barns.geojson")
+    gdf_plants = gpd.read_file(args.run_dir / "plants.geojson")
+    distances = get_plant_distances(gdf_barns, gdf_plants, k=args.k)
+    save_plant_distances(distances, args.run_dir / PLANT_DISTANCES_FILENAME)
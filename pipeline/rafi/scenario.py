@@ -0,0 +1,192 @@
+"""Update barn access for plant closures and openings without rerunning the pipeline.
+
+Only barns that could reach a closed plant or are inside a new plant's isochrone are recomputed,
+using the barn access arrays saved with a run (see barn_access.py).
+"""
+
+import argparse
+from pathlib import Path
+from typing import NamedTuple
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from rafi.barn_access import ACCESS_FILENAME, PLANTS_FILENAME, BarnAccess, load_barn_access, to_csr
+from rafi.constants import WGS84
+from rafi.utils import save_file
+
+
+class ScenarioResult(NamedTuple):
+    """Barns and barn counts after a set of plant changes."""
+
+    barns: gpd.GeoDataFrame
+    deltas: pd.DataFrame
+    state_counts: pd.DataFrame
+    state_count_deltas: pd.DataFrame
+
+
+def get_closed_plants(access: BarnAccess, closures: list[str]) -> np.ndarray:
+    """Find the plants to close by ID.
+
+    Args:
+        access: Barn access arrays.
+        closures: IDs of the plants to close (see get_plant_ids).
+
+    Returns:
+        Indices of the closed plants.
+
+    Raises:
+        ValueError: If a plant ID is unknown.
+    """
+    closures = [str(plant_id) for plant_id in closures]
+    unknown = set(closures) - set(access.plant_ids)
+    if unknown:
+        raise ValueError(f"Unknown plants {sorted(unknown)}")
+    return np.flatnonzero(np.isin(access.plant_ids, closures))
+
+
+def get_state_counts(gdf_barns: gpd.GeoDataFrame) -> pd.DataFrame:
+    """Count the barns that aren't excluded in each state by integrator access level.
+
+    Args:
+        gdf_barns: GeoDataFrame of barns with state, integrator_access and exclude columns.
+
+    Returns:
+        DataFrame of barn counts indexed by state with a column for each access level.
+    """
+    gdf_barns = gdf_barns[(gdf_barns["exclude"] == 0) & (gdf_barns["integrator_access"] != 0)]
+    return pd.crosstab(gdf_barns["state"], gdf_barns["integrator_access"])
+
+
+def get_scenario(
+    gdf_barns: gpd.GeoDataFrame,
+    access: BarnAccess,
+    gdf_plants: pd.DataFrame,
+    closures: list[str] | None = None,
+    gdf_openings: gpd.GeoDataFrame | None = None,
+    corp_col: str = "Parent Corporation",
+    multi_corp_threshold: int = 3,
+) -> ScenarioResult:
+    """Recompute integrator access and parent corporation for the barns a set of plant changes affects.
+
+    Note: A run only keeps barns inside at least one isochrone, so openings only reach barns that
+    already had access to some plant in the baseline run.
+
+    Note: Affected barns are recomputed from the per-plant isochrones in access, while the rest keep
+    the access from the run's captured-area polygons (see calculate_captured_areas). The two can
+    disagree near isochrone edges, since captured areas are dissolved by corporation, overlaid and
+    simplified, so small deltas in the state counts can come from this rather than from the plant
+    changes.
+
+    Args:
+        gdf_barns: GeoDataFrame of barns from a run, in the same row order as access.
+        access: Barn access arrays from the same run.
+        gdf_plants: Plants from the same run, in the same row order as the plant indices in access.
+        closures: IDs of plants to close (see get_plant_ids).
+        gdf_openings: GeoDataFrame of new plants with their isochrones as the geometry, and the
+            corporation column.
+        corp_col: Column name for the parent corporation.
+        multi_corp_threshold: The minimum number of corporations to count as multi corp access
+            (see calculate_captured_areas).
+
+    Returns:
+        The scenario's barns with barns that lost all access dropped, a DataFrame of the barns
+        whose access or parent corporation changed, and the barn counts by state and access level
+        for the scenario and as changes from the baseline.
+
+    Raises:
+        ValueError: If the barns or plants don't line up with access, or a closed plant is unknown.
+    """
+    n_barns = len(gdf_barns)
+    if n_barns != len(access.barn_index):
+        raise ValueError(f"There are {n_barns} barns but access arrays for {len(access.barn_index)}")
+    if len(gdf_plants) != len(access.plant_ids):
+        raise ValueError(f"There are {len(gdf_plants)} plants but access arrays for {len(access.plant_ids)}")
+    closed = get_closed_plants(access, closures or [])
+    if gdf_openings is None:
+        gdf_openings = gpd.GeoDataFrame({corp_col: []}, geometry=[], crs=WGS84)
+
+    # Note: Expand the CSR arrays into (barn row, plant) pairs
+    plant_rows = np.repeat(np.arange(n_barns), np.diff(access.plant_offsets))
+    plant_indices = access.plant_indices.astype(np.int64)
+    is_closed = np.isin(plant_indices, closed)
+
+    if gdf_openings.crs is None:
+        gdf_openings = gdf_openings.set_crs(WGS84)
+    # Buffer to fix invalid geometries
+    isochrones = gdf_openings.geometry.to_crs(gdf_barns.crs).buffer(0).to_numpy()
+    open_rows, open_idx = shapely.STRtree(isochrones).query(gdf_barns.geometry.to_numpy(), predicate="within")
+    # Note: New plants are numbered after the baseline plants
+    open_plants = open_idx + len(gdf_plants)
+
+    affected = np.unique(np.concatenate([plant_rows[is_closed], open_rows]))
+    print(f"Recomputing access for {len(affected)} of {n_barns} barns")
+    keep = np.isin(plant_rows, affected) & ~is_closed
+    rows = np.searchsorted(affected, np.concatenate([plant_rows[keep], open_rows]))
+    plants = np.concatenate([plant_indices[keep], open_plants])
+
+    plant_corps, corporations = pd.factorize(pd.concat([gdf_plants[corp_col], gdf_openings[corp_col]]))
+    # Note: Plants without a corporation don't add a corporation
+    has_corp = plant_corps[plants] >= 0
+    corp_offsets, corp_indices = to_csr(rows[has_corp], plant_corps[plants[has_corp]], len(affected))
+    n_corps = np.diff(corp_offsets)
+
+    integrator_access = np.minimum(n_corps, multi_corp_threshold)
+    parent_corporation = np.full(len(affected), None, dtype=object)
+    single_corp = n_corps == 1
+    parent_corporation[single_corp] = np.asarray(corporations)[corp_indices[corp_offsets[:-1][single_corp]]]
+
+    gdf_scenario = gdf_barns.copy()
+    gdf_scenario["parent_corporation"] = gdf_scenario["parent_corporation"].astype(object)
+    gdf_scenario.iloc[affected, gdf_scenario.columns.get_loc("integrator_access")] = integrator_access
+    gdf_scenario.iloc[affected, gdf_scenario.columns.get_loc("parent_corporation")] = parent_corporation
+
+    before = gdf_barns.iloc[affected]
+    deltas = pd.DataFrame(
+        {
+            "state": before["state"].to_numpy(),
+            "exclude": before["exclude"].to_numpy(),
+            "integrator_access_before": before["integrator_access"].to_numpy(),
+            "integrator_access_after": integrator_access,
+            "parent_corporation_before": before["parent_corporation"].to_numpy(),
+            "parent_corporation_after": parent_corporation,
+        },
+        index=before.index,
+    )
+    changed = (deltas["integrator_access_before"] != deltas["integrator_access_after"]) | (
+        deltas["parent_corporation_before"].fillna("") != deltas["parent_corporation_after"].fillna("")
+    )
+    deltas = deltas[changed]
+
+    state_counts = get_state_counts(gdf_scenario)
+    state_count_deltas = state_counts.sub(get_state_counts(gdf_barns), fill_value=0).astype(int)
+    gdf_scenario = gdf_scenario[gdf_scenario["integrator_access"] != 0]
+    return ScenarioResult(gdf_scenario, deltas, state_counts, state_count_deltas)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Update barn access for plant closures and openings")
+    parser.add_argument("run_dir", type=Path, help=f"Directory with barns.geojson, {ACCESS_FILENAME} and the plants")
+    parser.add_argument("--close", nargs="+", default=[], metavar="PLANT", help="IDs of plants to close")
+    parser.add_argument("--open", type=Path, help="GeoJSON of new plants with their isochrones")
+    parser.add_argument("--plants", type=Path, help=f"Plant isochrones. Defaults to {PLANTS_FILENAME} in run_dir")
+    parser.add_argument("--output_dir", type=Path, help="Output directory. Defaults to scenario in run_dir")
+    args = parser.parse_args()
+
+    gdf_barns = gpd.read_file(args.run_dir / "barns.geojson")
+    access = load_barn_access(args.run_dir / ACCESS_FILENAME)
+    # Note: Only the plant attributes are needed, so skip reading the isochrones
+    gdf_plants = gpd.read_file(args.plants or args.run_dir / PLANTS_FILENAME, ignore_geometry=True)
+    gdf_openings = gpd.read_file(args.open) if args.open else None
+    result = get_scenario(gdf_barns, access, gdf_plants, closures=args.close, gdf_openings=gdf_openings)
+
+    print(f"Access changed for {len(result.deltas)} barns")
+    print(result.state_count_deltas.to_string())
+    output_dir = args.output_dir or args.run_dir / "scenario"
+    Path.mkdir(output_dir, exist_ok=True, parents=True)
+    save_file(result.barns, output_dir / "barns.geojson", gzip_file=True)
+    save_file(result.deltas, output_dir / "barn_deltas.csv", file_format="csv", index=True)
+    save_file(result.state_counts, output_dir / "state_counts.csv", file_format="csv", index=True)
+    save_file(result.state_count_deltas, output_dir / "state_count_deltas.csv", file_format="csv", index=True)
@@ -0,0 +1,165 @@
+"""Fast state lookups for large numbers of points using a precomputed grid of state codes."""
+
+import hashlib
+from pathlib import Path
+from typing import NamedTuple
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from rafi.cache import get_cache_key, get_cache_path
+from rafi.constants import CACHE_DIR, CONUS_ALBERS, GDF_STATES
+
+OUTSIDE = -1  # Cell isn't in any state
+BOUNDARY = -2  # Cell crosses a state boundary, so points in it need an exact test
+
+
+class StateGrid(NamedTuple):
+    """Grid of state codes where each cell holds a row of the states GeoDataFrame, OUTSIDE, or BOUNDARY."""
+
+    codes: np.ndarray
+    minx: float
+    miny: float
+    cell_size: float
+
+
+def build_state_grid(
+    gdf_states: gpd.GeoDataFrame = GDF_STATES,
+    cell_size: float = 10000,
+    crs: str = CONUS_ALBERS,
+) -> StateGrid:
+    """Rasterizes states into a grid of state codes.
+
+    A cell gets the code of a state only if it's entirely inside that state and doesn't touch
+    any other state.
+
+    Args:
+        gdf_states: GeoDataFrame of states.
+        cell_size: Width of each cell in the units of crs.
+        crs: Projected CRS to build the grid in.
+
+    Returns:
+        The state grid.
+    """
+    states = gdf_states.geometry.to_crs(crs).to_numpy()
+    tree = shapely.STRtree(states)
+    minx, miny, maxx, maxy = shapely.total_bounds(states)
+    n_cols = int(np.ceil((maxx - minx) / cell_size))
+    n_rows = int(np.ceil((maxy - miny) / cell_size))
+    codes = np.full((n_rows, n_cols), OUTSIDE, dtype=np.int16)
+
+    # Note: Build one row at a time so only one row of cells is in memory
+    x = minx + cell_size * np.arange(n_cols)
+    for row in range(n_rows):
+        y = miny + cell_size * row
+        cells = shapely.box(x, y, x + cell_size, y + cell_size)
+        cell_idx, _ = tree.query(cells, predicate="intersects")
+        n_states = np.bincount(cell_idx, minlength=n_cols)
+        codes[row, n_states > 0] = BOUNDARY
+        cell_idx, state_idx = tree.query(cells, predicate="within")
+        interior = n_states[cell_idx] == 1
+        codes[row, cell_idx[interior]] = state_idx[interior]
+
+    return StateGrid(codes, minx, miny, cell_size)
+
+
+def get_state_grid(
+    gdf_states: gpd.GeoDataFrame = GDF_STATES,
+    cell_size: float = 10000,
+    use_cache: bool = True,
+    cache_dir: Path | None = None,
+) -> StateGrid:
+    """Gets the state grid for a set of states, using the cache when possible.
+
+    Args:
+        gdf_states: GeoDataFrame of states.
+        cell_size: Width of each cell in meters.
+        use_cache: Whether to read and write the grid in the cache.
+        cache_dir: Directory for cached files. Defaults to CACHE_DIR.
+
+    Returns:
+        The state grid in CONUS_ALBERS.
+    """
+    if not use_cache:
+        return build_state_grid(gdf_states, cell_size)
+    # Note: Look up CACHE_DIR when called so tests can point it somewhere else
+    cache_dir = cache_dir or CACHE_DIR
+
+    geometry_digest = hashlib.sha256(b"".join(shapely.to_wkb(gdf_states.geometry.to_numpy()))).hexdigest()
+    key = get_cache_key([], states=geometry_digest, cell_size=cell_size, crs=CONUS_ALBERS)
+    filepath = get_cache_path("state grid", key, ".npz", cache_dir)
+    if filepath.exists():
+        with np.load(filepath) as data:
+            return StateGrid(data["codes"], float(data["minx"]), float(data["miny"]), float(data["cell_size"]))
+
+    print("Building state grid...")
+    grid = build_state_grid(gdf_states, cell_size)
+    Path.mkdir(cache_dir, parents=True, exist_ok=True)
+    print(f"Caching file to {filepath}")
+    np.savez(filepath, **grid._asdict())
+    return grid
+
+
+def lookup_states(
+    points: gpd.GeoSeries,
+    gdf_states: gpd.GeoDataFrame = GDF_STATES,
+    grid: StateGrid | None = None,
+    state_col: str = "ABBREV",
+) -> pd.Categorical:
+    """Finds the state each point is in.
+
+    Most points are resolved by looking up their grid cell. Only points in cells that cross a
+    state boundary are tested against the state polygons.
+
+    Args:
+        points: GeoSeries of points.
+        gdf_states: GeoDataFrame of states. This must be the one the grid was built from.
+        grid: State grid from get_state_grid. Built (or read from the cache) if None.
+        state_col: Column of gdf_states with the state names to return.
+
+    Returns:
+        Categorical of states aligned with points. Points outside every state are missing. Points
+        on a border between states get the first of the states.
+    """
+    if grid is None:
+        grid = get_state_grid(gdf_states)
+    points = points.to_crs(CONUS_ALBERS).to_numpy()
+
+    # Note: Missing and empty points have NaN coordinates, which fall outside the grid
+    col = np.floor((shapely.get_x(points) - grid.minx) / grid.cell_size)
+    row = np.floor((shapely.get_y(points) - grid.miny) / grid.cell_size)
+    n_rows, n_cols = grid.codes.shape
+    in_grid = (col >= 0) & (col < n_cols) & (row >= 0) & (row < n_rows)
+    codes = np.full(len(points), OUTSIDE, dtype=np.int16)
+    codes[in_grid] = grid.codes[row[in_grid].astype(np.intp), col[in_grid].astype(np.intp)]
+
+    boundary = np.flatnonzero(codes == BOUNDARY)
+    codes[boundary] = OUTSIDE
+    states = gdf_states.geometry.to_crs(CONUS_ALBERS).to_numpy()
+    point_idx, state_idx = shapely.STRtree(states).query(points[boundary], predicate="intersects")
+    # Note: Points on a border match several states, so take the first state for each point
+    order = np.lexsort((state_idx, point_idx))
+    point_idx, state_idx = point_idx[order], state_idx[order]
+    _, first = np.unique(point_idx, return_index=True)
+    codes[boundary[point_idx[first]]] = state_idx[first]
+
+    names = gdf_states[state_col].to_numpy()
+    categories = get_state_categories(gdf_states, state_col)
+    category_codes = np.append(categories.get_indexer(names), -1)
+    return pd.Categorical.from_codes(category_codes[codes], categories=categories)
+
+
+def get_state_categories(gdf_states: gpd.GeoDataFrame = GDF_STATES, state_col: str = "ABBREV") -> pd.Index:
+    """Gets the categories of the states from lookup_states, so separate lookups can be combined.
+
+    Args:
+        gdf_states: GeoDataFrame of states.
+        state_col: Column of gdf_states with the state names.
+
+    Returns:
+        Index of the distinct state names in the order of gdf_states.
+    """
+    names = gdf_states[state_col].to_numpy()
+    return pd.Index(pd.unique(names[pd.notna(names)]))
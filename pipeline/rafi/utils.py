@@ -2,9 +2,18 @@
 
 import gzip
 import shutil
+from collections.abc import Iterator
 from pathlib import Path
 
 import geopandas as gpd
+import pandas as pd
+from pyogrio import read_dataframe, read_info
+from pyogrio.raw import open_arrow
+from pyproj import Transformer
+from tqdm import tqdm
+
+from rafi.constants import ALBERS_EQUAL_AREA
+from rafi.footprints import filter_footprints, print_footprint_counts
 
 
 def save_file(
@@ -29,6 +38,8 @@ def save_file(
     if file_format == "geojson":
         final_filepath = filepath.with_suffix(".geojson")
         print(f"Saving file to {final_filepath}")
+        # Note: GeoJSON has no categorical type, so write categories as strings
+        gdf = gdf.astype(dict.fromkeys(gdf.select_dtypes("category").columns, object))
         gdf.to_file(f"{final_filepath}", driver="GeoJSON")
     elif file_format == "csv":
         final_filepath = filepath.with_suffix(".csv")
@@ -44,3 +55,121 @@ def save_file(
         with final_filepath.open("rb") as f_in:
             with gzip.open(gzip_filepath, "wb") as f_out:
                 shutil.copyfileobj(f_in, f_out)
+
+
+def iter_chunks(
+    filepath: Path,
+    layer: str | None = None,
+    columns: list | None = None,
+    where: str | None = None,
+    chunk_size: int = 500000,
+) -> Iterator[gpd.GeoDataFrame]:
+    """Reads a vector file in chunks by streaming it as Arrow record batches.
+
+    Args:
+        filepath: Path to the file.
+        layer: Layer to read. Defaults to the first layer.
+        columns: Attribute columns to read. Defaults to none.
+        where: SQL WHERE clause to filter features with while reading.
+        chunk_size: Number of features to read at a time.
+
+    Yields:
+        GeoDataFrame for each chunk in the CRS of the file.
+    """
+    with open_arrow(
+        filepath,
+        layer=layer,
+        columns=columns or [],
+        where=where,
+        batch_size=chunk_size,
+        use_pyarrow=True,
+    ) as (meta, reader):
+        geometry_name = meta["geometry_name"] or "wkb_geometry"
+        for batch in reader:
+            df = batch.to_pandas()
+            geometry = gpd.GeoSeries.from_wkb(df.pop(geometry_name), crs=meta["crs"])
+            yield gpd.GeoDataFrame(df, geometry=geometry.to_numpy(), crs=meta["crs"])
+
+
+def read_barn_centroids(
+    filepath: Path,
+    crs: str = ALBERS_EQUAL_AREA,
+    columns: list | None = None,
+    chunk_size: int = 500000,
+    layer: str | None = None,
+    footprint_thresholds: dict | None = None,
+) -> gpd.GeoDataFrame:
+    """Reads barn footprints in chunks and keeps only the centroid of each barn.
+
+    The file is streamed as Arrow record batches, so only one chunk of barn polygons is in
+    memory at a time. Barns with implausible footprints can be dropped from each chunk before
+    centroiding, since the footprints are gone afterwards.
+
+    Args:
+        filepath: Path to the barns file (e.g. the full USA GeoPackage).
+        crs: Projected CRS to calculate centroids in. The output is in this CRS.
+        columns: Attribute columns to keep. Defaults to none.
+        chunk_size: Number of barns to read at a time.
+        layer: Layer to read. Defaults to the first layer.
+        footprint_thresholds: Footprint thresholds by name (see footprints.THRESHOLDS). Barns
+            outside of them are dropped. Thresholds that are None are skipped, and every barn
+            is kept if footprint_thresholds is None.
+
+    Returns:
+        GeoDataFrame of barn centroids.
+    """
+    print(f"Reading barns from {filepath} in chunks of {chunk_size}")
+    # Note: Skip measuring footprints if every threshold is off
+    footprint_thresholds = {name: value for name, value in (footprint_thresholds or {}).items() if value is not None}
+    chunks = []
+    n_barns = 0
+    footprint_counts = {}
+    for chunk in tqdm(iter_chunks(filepath, layer=layer, columns=columns, chunk_size=chunk_size)):
+        n_barns += len(chunk)
+        if footprint_thresholds:
+            chunk, counts = filter_footprints(chunk, footprint_thresholds)
+            for name, count in counts.items():
+                footprint_counts[name] = footprint_counts.get(name, 0) + count
+        chunk["geometry"] = chunk.geometry.to_crs(crs).centroid
+        chunks.append(chunk.set_crs(crs, allow_override=True))
+
+    if footprint_thresholds:
+        print_footprint_counts(footprint_counts, n_barns, sum(len(chunk) for chunk in chunks))
+
+    if not chunks:
+        return gpd.GeoDataFrame(columns=columns or [], geometry=[], crs=crs)
+    return gpd.GeoDataFrame(pd.concat(chunks, ignore_index=True), crs=crs)
+
+
+def read_layer(
+    filepath: Path,
+    layer: str | None = None,
+    columns: list | None = None,
+    bbox: tuple | None = None,
+    bbox_crs: str | None = None,
+    where: str | None = None,
+) -> gpd.GeoDataFrame:
+    """Reads a vector file through Arrow, optionally pruning columns and features outside a bounding box.
+
+    Args:
+        filepath: Path to the file.
+        layer: Layer to read. Defaults to the first layer.
+        columns: Attribute columns to read. Use an empty list to read only the geometry. Reads all
+            columns if None.
+        bbox: Bounding box (minx, miny, maxx, maxy). Only features that intersect it are read.
+        bbox_crs: CRS of the bounding box. Defaults to the CRS of the file.
+        where: SQL WHERE clause to filter features with while reading.
+
+    Returns:
+        GeoDataFrame in the CRS of the file.
+    """
+    if bbox is not None and bbox_crs is not None:
+        file_crs = read_info(filepath, layer=layer)["crs"]
+        # Note: Densify the edges since a projected box is curved in geographic coordinates
+        if file_crs is not None:
+            bbox = Transformer.from_crs(bbox_crs, file_crs, always_xy=True).transform_bounds(
+                *bbox, densify_pts=21
+            )
+    return read_dataframe(
+        filepath, layer=layer, columns=columns, bbox=bbox, where=where, use_arrow=True
+    )
@@ -0,0 +1,42 @@
+import geopandas as gpd
+import pytest
+from shapely.geometry import box
+
+from rafi.constants import WGS84
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    # Keep caches built by the code under test out of the real data directory
+    monkeypatch.setattr("rafi.states.CACHE_DIR", tmp_path / "cache")
+    return tmp_path / "cache"
+
+
+@pytest.fixture
+def barns():
+    # Pairs of barns 30m apart, plus one isolated barn, in each access area
+    centers = [(-86.8, 32.5), (-86.3, 32.5), (-85.5, 32.5), (-84.5, 32.5)]
+    footprints = []
+    for x, y in centers:
+        footprints += [
+            box(x, y, x + 0.0002, y + 0.0001),
+            box(x + 0.0003, y, x + 0.0005, y + 0.0001),
+            box(x + 0.05, y + 0.05, x + 0.0502, y + 0.0501),
+        ]
+    return gpd.GeoDataFrame(geometry=footprints, crs=WGS84)
+
+
+@pytest.fixture
+def isochrones():
+    return gpd.GeoDataFrame(
+        {
+            "Parent Corporation": ["Tyson", None, None],
+            "corp_access": [1, 2, 3],
+        },
+        geometry=[
+            box(-87.0, 32.0, -86.5, 33.0),
+            box(-86.5, 32.0, -86.0, 33.0),
+            box(-86.0, 32.0, -85.0, 33.0),
+        ],
+        crs=WGS84,
+    )
@@ -0,0 +1,96 @@
+import geopandas as gpd
+import numpy as np
+from shapely.geometry import Point, box
+
+from rafi.barn_access import (
+    count_corporations,
+    get_barn_access,
+    get_barn_corporations,
+    get_barn_plants,
+    get_plant_ids,
+    load_barn_access,
+    save_barn_access,
+)
+from rafi.constants import WGS84
+
+
+def make_plant_isochrones():
+    return gpd.GeoDataFrame(
+        {
+            "Parent Corporation": ["Tyson", "Tyson", "Perdue"],
+            "Establishment Name": ["Tyson A", "Tyson B", "Perdue A"],
+            "duns_number_fsis": ["001", "002", "003"],
+        },
+        geometry=[box(0, 0, 2, 2), box(1, 0, 3, 2), box(1.5, 0, 4, 2)],
+        crs=WGS84,
+    )
+
+
+def test_get_barn_access(tmp_path):
+    gdf_barns = gpd.GeoDataFrame(
+        geometry=[Point(0.5, 1), Point(1.2, 1), Point(1.7, 1), Point(5, 1)],
+        index=[10, 11, 12, 13],
+        crs=WGS84,
+    )
+    access = get_barn_access(gdf_barns, make_plant_isochrones())
+
+    assert access.barn_index.tolist() == [10, 11, 12, 13]
+    assert [get_barn_plants(access, i) for i in range(4)] == [
+        ["001"],
+        ["001", "002"],
+        ["001", "002", "003"],
+        [],
+    ]
+    # Two Tyson plants only count as one corporation
+    assert [get_barn_corporations(access, i) for i in range(4)] == [
+        ["Tyson"],
+        ["Tyson"],
+        ["Perdue", "Tyson"],
+        [],
+    ]
+    assert count_corporations(access).tolist() == [1, 1, 2, 0]
+
+    save_barn_access(access, tmp_path / "barn_access.npz")
+    loaded = load_barn_access(tmp_path / "barn_access.npz")
+    for field, expected in access._asdict().items():
+        assert np.array_equal(getattr(loaded, field), expected)
+
+
+def test_get_plant_ids():
+    gdf_plants = make_plant_isochrones()
+    assert get_plant_ids(gdf_plants).tolist() == ["001", "002", "003"]
+
+    # Plants without an ID are identified by their row
+    gdf_plants.loc[1, "duns_number_fsis"] = None
+    assert get_plant_ids(gdf_plants).tolist() == ["001", "1", "003"]
+
+    # Establishments that share a DUNS number get their establishment number appended
+    gdf_plants["duns_number_fsis"] = ["001", "001", "003"]
+    gdf_plants["establishment_number"] = ["P1", "P2", "P3"]
+    assert get_plant_ids(gdf_plants).tolist() == ["001-P1", "001-P2", "003"]
+
+    # Without establishment numbers to tell them apart, they fall back to their rows
+    gdf_plants["establishment_number"] = ["P1", "P1", "P3"]
+    assert get_plant_ids(gdf_plants).tolist() == ["0", "1", "003"]
+    assert get_plant_ids(gdf_plants.drop(columns="duns_number_fsis")).tolist() == [
+        "0",
+        "1",
+        "2",
+    ]
+
+
+def test_get_barn_access_duplicate_duns():
+    gdf_barns = gpd.GeoDataFrame(geometry=[Point(1.7, 1)], crs=WGS84)
+    gdf_plants = make_plant_isochrones()
+    gdf_plants["duns_number_fsis"] = ["001", "001", "003"]
+    gdf_plants["establishment_number"] = ["P1", "P2", "P3"]
+
+    access = get_barn_access(gdf_barns, gdf_plants)
+    assert get_barn_plants(access, 0) == ["001-P1", "001-P2", "003"]
+
+
+def test_get_barn_access_no_barns():
+    gdf_barns = gpd.GeoDataFrame(geometry=[], crs=WGS84)
+    access = get_barn_access(gdf_barns, make_plant_isochrones())
+    assert access.plant_offsets.tolist() == [0]
+    assert len(access.corp_indices) == 0
@@ -0,0 +1,71 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely.geometry import Point
+
+from rafi.barn_table import BarnTable
+from rafi.constants import CONUS_ALBERS, WGS84
+
+
+def make_table():
+    points = gpd.GeoSeries(
+        [Point(-86.8, 32.5), Point(-85.5, 32.5), Point(-84.5, 32.5)],
+        index=[10, 20, 30],
+        crs=WGS84,
+    )
+    return BarnTable.from_points(points)
+
+
+def test_keep_and_exclude():
+    table = make_table()
+    table.keep(np.array([True, False, True]))
+    assert len(table) == 2
+    assert table.rows().tolist() == [0, 2]
+
+    table.set_excluded(np.array([0]), reason_bit=4)
+    assert table.n_excluded == 1
+    assert table.rows(skip_excluded=True).tolist() == [2]
+
+    gdf = table.to_geodataframe()
+    assert gdf.index.tolist() == [10, 30]
+    assert gdf["exclude"].tolist() == [1, 0]
+    assert gdf["exclude_reasons"].tolist() == [4, 0]
+
+
+def test_categorical_attributes():
+    table = make_table()
+    table.set_states(pd.Categorical(["AL", None], categories=["AL", "GA"]), [0, 2])
+    table.set_corporations(np.array(["Tyson", None], dtype=object), [1, 2])
+    table.integrator_access[:] = [1, 2, 3]
+    assert table.get_states().tolist() == ["AL"]
+
+    gdf = table.to_geodataframe()
+    assert gdf["state"].tolist()[0] == "AL"
+    assert gdf["state"].isna().tolist() == [False, True, True]
+    assert list(gdf["state"].cat.categories) == ["AL", "GA"]
+    assert gdf["parent_corporation"].tolist() == [None, "Tyson", None]
+    assert gdf["integrator_access"].tolist() == [1, 2, 3]
+
+
+def test_set_categories_on_subsets():
+    table = make_table()
+    table.set_states(np.array(["AL", "GA"], dtype=object), [0, 1])
+    table.set_corporations(np.array(["Tyson"], dtype=object), [0])
+    # Later subsets with other categories don't change the rows that are already set
+    table.set_states(np.array(["TN"], dtype=object), [2])
+    table.set_corporations(np.array(["Perdue", None], dtype=object), [1, 2])
+
+    gdf = table.to_geodataframe()
+    assert gdf["state"].tolist() == ["AL", "GA", "TN"]
+    assert gdf["parent_corporation"].tolist() == ["Tyson", "Perdue", None]
+    assert sorted(table.get_states()) == ["AL", "GA", "TN"]
+
+
+def test_to_crs_round_trip():
+    table = make_table().to_crs(CONUS_ALBERS)
+    assert table.crs == CONUS_ALBERS
+    expected = make_table().points().to_crs(CONUS_ALBERS)
+    assert np.allclose(table.x, expected.x)
+
+    gdf = table.to_crs(WGS84).to_geodataframe()
+    assert np.allclose(gdf.geometry.x, [-86.8, -85.5, -84.5])
@@ -1,4 +1,51 @@
-# def test_calculate_captured_areas():
-#     gdf_fsis_isochrones = ...
-#     result = calculate_captured_areas(gdf_fsis_isochrones)
-#     assert ...  # Add assertions
+import geopandas as gpd
+import numpy as np
+from shapely.geometry import box
+
+from rafi.calculate_captured_areas import (
+    calculate_captured_areas,
+    get_corp_overlap_matrix,
+)
+from rafi.constants import WGS84
+
+
+def make_plants():
+    return gpd.GeoDataFrame(
+        {
+            "Parent Corporation": ["Tyson", "Perdue", "Koch Foods"],
+            "isochrone": [
+                box(-87.0, 32.0, -86.0, 33.0),
+                box(-86.5, 32.0, -85.5, 33.0),
+                box(-86.25, 32.5, -85.0, 33.5),
+            ],
+        },
+        geometry="isochrone",
+        crs=WGS84,
+    )
+
+
+def test_get_corp_overlap_matrix():
+    gdf_corps = make_plants()
+    result = get_corp_overlap_matrix(gdf_corps)
+    assert list(result.index) == list(gdf_corps["Parent Corporation"])
+    assert np.allclose(result.to_numpy(), result.to_numpy().T)
+    # Diagonal is the full area of each corporation, which bounds its overlaps
+    assert (result.to_numpy() <= np.diag(result.to_numpy())[:, None] + 1e-6).all()
+    assert result.loc["Tyson", "Perdue"] > 0
+
+
+def test_calculate_captured_areas_metrics():
+    isochrones, area_metrics, overlap_matrix = calculate_captured_areas(
+        make_plants(), return_area_metrics=True
+    )
+    assert set(area_metrics["group"]) == {"state", "corporation"}
+    assert set(area_metrics["corp_access"]) == {1, 2, 3}
+    assert overlap_matrix.shape == (3, 3)
+    by_state = area_metrics[area_metrics["group"] == "state"]
+    by_corp = area_metrics[area_metrics["group"] == "corporation"]
+    # Each corporation's areas by access level should add back up to its total area
+    corp_totals = by_corp.groupby("name")["area_km2"].sum()
+    assert np.allclose(
+        corp_totals[overlap_matrix.index], np.diag(overlap_matrix), rtol=0.05
+    )
+    assert by_state["area_km2"].sum() > 0
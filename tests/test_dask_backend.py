@@ -0,0 +1,47 @@
+import pytest
+
+from rafi.dask_backend import assign_cells, filter_cells, get_file_extent
+from rafi.filter_barns import filter_barns, get_bounds
+from rafi.states import lookup_states
+
+
+def test_filter_cells_matches_filter_barns(barns, isochrones):
+    expected = filter_barns(barns, isochrones, filter_barns=False)
+
+    # Each dask partition gets whole cells, so filtering one partition with every cell in it
+    # should match the pandas path
+    gdf = assign_cells(barns, partition_size=20, halo=50)
+    result = filter_cells(gdf, isochrones, filter_barns=False).sort_index()
+
+    assert result.index.tolist() == expected.index.tolist()
+    assert result.drop(columns="geometry").equals(expected.drop(columns="geometry"))
+
+
+def test_get_file_extent(tmp_path, barns):
+    barns.to_file(tmp_path / "barns.gpkg", driver="GPKG")
+    extent = get_file_extent(tmp_path / "barns.gpkg")
+    minx, miny, maxx, maxy = get_bounds(barns)
+    assert extent.bbox[0] <= minx and extent.bbox[1] <= miny
+    assert extent.bbox[2] >= maxx and extent.bbox[3] >= maxy
+    # Every state the bounds overlap is kept, since the barns haven't been read yet
+    assert set(lookup_states(barns.geometry).dropna()) <= set(extent.states)
+
+
+def test_filter_barns_dask_matches_filter_barns(tmp_path, barns, isochrones):
+    pytest.importorskip("dask_geopandas")
+    from rafi.dask_backend import filter_barns_dask
+
+    barns.to_file(tmp_path / "barns.gpkg", driver="GPKG")
+    expected = filter_barns(barns, isochrones, filter_barns=False)
+    result = filter_barns_dask(
+        tmp_path / "barns.gpkg",
+        isochrones,
+        filter_barns=False,
+        partition_size=20,
+        npartitions=2,
+        scheduler="synchronous",
+    )
+
+    assert result.index.tolist() == expected.index.tolist()
+    assert result.drop(columns="geometry").equals(expected.drop(columns="geometry"))
+    assert result.geometry.geom_equals_exact(expected.geometry, tolerance=1e-9).all()
@@ -0,0 +1,81 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+from shapely.geometry import Point
+
+from rafi.constants import ALBERS_EQUAL_AREA, CONUS_ALBERS, WGS84
+from rafi.filter_barns import filter_barns
+from rafi.utils import read_barn_centroids
+
+pytest.importorskip("duckdb")
+
+from rafi.duckdb_engine import (
+    apply_filter,
+    connect,
+    filter_barns_duckdb,
+    load_barns,
+    load_geometries,
+)
+
+
+def test_filter_barns_duckdb_matches_filter_barns(tmp_path, barns, isochrones):
+    filepath = tmp_path / "barns.gpkg"
+    barns.to_file(filepath, driver="GPKG")
+    expected = filter_barns(barns, isochrones, filter_barns=False)
+
+    result = filter_barns_duckdb(
+        filepath, isochrones, [], filter_barns=False, threads=1
+    )
+
+    assert result.index.tolist() == expected.index.tolist()
+    assert result["state"].tolist() == expected["state"].astype(object).tolist()
+    assert (
+        result["integrator_access"].tolist() == expected["integrator_access"].tolist()
+    )
+    assert (
+        result["parent_corporation"].fillna("").tolist()
+        == expected["parent_corporation"].fillna("").tolist()
+    )
+    assert result["exclude"].tolist() == expected["exclude"].tolist()
+
+
+def test_load_barns(tmp_path, barns):
+    filepath = tmp_path / "barns.gpkg"
+    barns.to_file(filepath, driver="GPKG")
+    expected = read_barn_centroids(filepath)
+
+    con = connect(threads=2)
+    # Note: Small chunks split the file into several Arrow batches
+    load_barns(con, filepath, chunk_size=5)
+    df = con.execute(
+        "SELECT barn_id, ST_X(geom) AS x, ST_Y(geom) AS y FROM barns ORDER BY barn_id"
+    ).df()
+    con.close()
+
+    # Barn IDs follow the file order, and centroids match the pandas path
+    assert df["barn_id"].tolist() == list(range(len(barns)))
+    assert expected.crs == ALBERS_EQUAL_AREA
+    assert np.allclose(df["x"], expected.geometry.x)
+    assert np.allclose(df["y"], expected.geometry.y)
+
+
+def test_apply_filter(tmp_path):
+    points = [Point(-86.8, 32.5), Point(-86.8, 32.51), Point(-84.5, 32.5)]
+    gdf = gpd.GeoDataFrame(geometry=points, crs=WGS84)
+    con = connect(threads=1)
+    load_geometries(con, "barns", gdf)
+    con.execute(
+        "CREATE TABLE barns_out AS SELECT (row_number() OVER ()) - 1 AS barn_id, geom, "
+        "0 AS exclude, 0::UINTEGER AS exclude_reasons FROM barns"
+    )
+    airports = gpd.GeoDataFrame(geometry=[points[0]], crs=WGS84).to_crs(CONUS_ALBERS)
+    load_geometries(con, "airports", airports)
+
+    assert apply_filter(con, "airports", 2, distance=800) == 1
+    # Without skipping excluded barns, barns within the larger distance get the bit too
+    assert apply_filter(con, "airports", 4, distance=2000, skip_excluded=False) == 2
+    reasons = con.execute(
+        "SELECT exclude_reasons FROM barns_out ORDER BY barn_id"
+    ).fetchall()
+    con.close()
+    assert [row[0] for row in reasons] == [6, 4, 0]
@@ -0,0 +1,95 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from rafi.exclude_reasons import (
+    get_reason_bits,
+    get_reason_names,
+    load_reason_names,
+    recompute_exclude,
+    rethreshold_reasons,
+    save_reason_names,
+)
+
+FILTERS_CONFIG = [{"description": "prisons"}, {"description": "airports"}]
+
+
+def test_recompute_exclude(tmp_path):
+    reason_names = get_reason_names(FILTERS_CONFIG)
+    assert reason_names == ["major cities", "prisons", "airports"]
+
+    save_reason_names(reason_names, tmp_path / "exclude_reasons.json", all_reasons=True)
+    assert load_reason_names(tmp_path / "exclude_reasons.json") == (reason_names, True)
+
+    exclude_reasons = np.array([0, 1, 2, 4, 6], dtype=np.uint32)
+    assert list(recompute_exclude(exclude_reasons, reason_names, reason_names)) == [
+        0,
+        1,
+        1,
+        1,
+        1,
+    ]
+    assert list(
+        recompute_exclude(exclude_reasons, reason_names, ["airports"], all_reasons=True)
+    ) == [
+        0,
+        0,
+        0,
+        1,
+        1,
+    ]
+    assert (
+        list(recompute_exclude(exclude_reasons, reason_names, [], all_reasons=True))
+        == [0] * 5
+    )
+
+
+def test_recompute_exclude_first_reason_only(tmp_path):
+    reason_names = get_reason_names(FILTERS_CONFIG)
+    exclude_reasons = np.array([0, 1, 2, 4], dtype=np.uint32)
+    # Applying every reason is still exact when only the first reason was recorded
+    assert list(recompute_exclude(exclude_reasons, reason_names, reason_names)) == [
+        0,
+        1,
+        1,
+        1,
+    ]
+    with pytest.raises(ValueError, match="--all_reasons"):
+        recompute_exclude(exclude_reasons, reason_names, ["airports"])
+
+    # Runs from before all_reasons was saved only have the list of names
+    with Path.open(tmp_path / "exclude_reasons.json", "w") as f:
+        json.dump(reason_names, f)
+    assert load_reason_names(tmp_path / "exclude_reasons.json") == (reason_names, False)
+
+
+def test_get_reason_bits_unknown():
+    with pytest.raises(ValueError):
+        get_reason_bits(get_reason_names(FILTERS_CONFIG), ["schools"])
+
+
+def test_rethreshold_reasons():
+    reason_names = get_reason_names(FILTERS_CONFIG)
+    distances = pd.DataFrame({"airports": [100, 500, 900, np.inf]})
+    exclude_reasons = np.array([4, 4, 2, 0], dtype=np.uint32)
+
+    result = rethreshold_reasons(
+        exclude_reasons, reason_names, distances, {"airports": 600}, max_distance=5000
+    )
+    assert list(result) == [4, 4, 2, 0]
+    result = rethreshold_reasons(
+        exclude_reasons, reason_names, distances, {"airports": 200}, max_distance=5000
+    )
+    assert list(result) == [4, 0, 2, 0]
+    result = rethreshold_reasons(
+        exclude_reasons, reason_names, distances, {"airports": 1000}, max_distance=5000
+    )
+    assert list(result) == [4, 4, 6, 0]
+
+    with pytest.raises(ValueError):
+        rethreshold_reasons(
+            exclude_reasons, reason_names, distances, {"airports": 6000}, 5000
+        )
@@ -0,0 +1,65 @@
+import numpy as np
+
+from rafi.barn_table import BarnTable
+from rafi.constants import CONUS_ALBERS
+from rafi.farms import (
+    FARM_COL,
+    broadcast_farm_sites,
+    cluster_points,
+    get_farms,
+    get_representatives,
+)
+from rafi.filter_barns import filter_barns
+
+
+def test_cluster_points():
+    # A chain of points 40m apart is one farm even though its ends are 80m apart
+    x = np.array([0.0, 40.0, 80.0, 500.0, 1000.0, 1030.0])
+    y = np.zeros(6)
+    labels = cluster_points(x, y, distance=50)
+    assert labels[0] == labels[1] == labels[2]
+    assert labels[4] == labels[5]
+    assert len(np.unique(labels)) == 3
+    assert len(cluster_points(np.zeros(0), np.zeros(0), distance=50)) == 0
+
+
+def test_get_representatives():
+    x = np.array([0.0, 40.0, 80.0, 500.0])
+    y = np.zeros(4)
+    labels = np.array([0, 0, 0, 1])
+    assert get_representatives(x, y, labels).tolist() == [1, 3]
+
+
+def test_broadcast_farm_sites():
+    table = BarnTable(np.array([0.0, 30.0, 500.0]), np.zeros(3), CONUS_ALBERS)
+    table.set_states(np.array(["GA"], dtype=object), [2])
+    sites = BarnTable(np.array([0.0]), np.zeros(1), CONUS_ALBERS)
+    sites.set_states(np.array(["AL"], dtype=object))
+    sites.set_corporations(np.array(["Tyson"], dtype=object))
+
+    # Barns outside of the farm sites keep their own states
+    table = broadcast_farm_sites(sites, table, np.array([0, 1]), np.array([0, 0]))
+    gdf = table.to_geodataframe()
+    assert gdf["state"].tolist() == ["AL", "AL", "GA"]
+    assert gdf["parent_corporation"].tolist() == ["Tyson", "Tyson", None]
+
+
+def test_filter_barns_with_farms(barns, isochrones):
+    expected = filter_barns(barns, isochrones, filter_barns=False)
+
+    result = filter_barns(barns, isochrones, filter_barns=False, farm_distance=50)
+    assert result.index.tolist() == expected.index.tolist()
+    assert (
+        result.drop(columns=FARM_COL)
+        .drop(columns="geometry")
+        .equals(expected.drop(columns="geometry"))
+    )
+    # Each pair of barns 30m apart is one farm, named after one of its barns
+    farm_ids = result[FARM_COL].tolist()
+    assert farm_ids[0::2] == farm_ids[1::2]
+    assert set(farm_ids) <= set(result.index)
+
+    gdf_farms = get_farms(result)
+    assert gdf_farms.index.tolist() == farm_ids[0::2]
+    assert gdf_farms["n_barns"].tolist() == [2, 2, 2]
+    assert gdf_farms["integrator_access"].tolist() == [1, 2, 3]
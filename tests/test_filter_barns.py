@@ -1,5 +1,435 @@
-# def test_filter_barns():
-#     gdf_barns = ...
-#     gdf_isochrones = ...
-#     result = filter_barns(gdf_barns, gdf_isochrones)
-#     assert ...  # Add assertions
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+from shapely.geometry import LineString, Point, box
+
+from rafi.barn_table import BarnTable
+from rafi.constants import CONUS_ALBERS, WGS84
+from rafi.filter_barns import (
+    LayerExtent,
+    apply_filters,
+    filter_barns,
+    filter_on_tiles,
+    get_bounds,
+    get_city_keys,
+    get_exclusion_distances,
+    get_membership_mask,
+    has_neighbors,
+    load_city_polygons,
+    load_exclusion_layer,
+)
+from rafi.filter_stats import get_filter_stats, load_filter_stats, save_filter_stats
+
+
+def test_has_neighbors():
+    gdf = gpd.GeoDataFrame(
+        geometry=[Point(0, 0), Point(30, 0), Point(60, 0), Point(500, 0)],
+        crs=CONUS_ALBERS,
+    )
+    assert list(has_neighbors(gdf, distance=50)) == [True, True, True, False]
+    assert list(has_neighbors(gdf, distance=50, min_neighbors=2)) == [
+        False,
+        True,
+        False,
+        False,
+    ]
+    assert list(has_neighbors(gdf, distance=70, min_neighbors=2)) == [
+        True,
+        True,
+        True,
+        False,
+    ]
+
+
+def test_filter_barns(barns, isochrones):
+    result = filter_barns(barns, isochrones, filter_barns=False)
+    assert list(result.columns) == [
+        "state",
+        "parent_corporation",
+        "integrator_access",
+        "geometry",
+        "exclude",
+        "exclude_reasons",
+    ]
+    # Isolated barns and barns outside of the isochrones are dropped
+    assert len(result) == 6
+    assert sorted(result["integrator_access"]) == [1, 1, 2, 2, 3, 3]
+    single = result[result["integrator_access"] == 1]
+    assert (single["parent_corporation"] == "Tyson").all()
+    assert (result["exclude"] == 0).all()
+    assert np.allclose(result.geometry.x.min(), -86.8, atol=0.01)
+
+
+def test_filter_barns_partitioned(barns, isochrones):
+    expected = filter_barns(barns, isochrones, filter_barns=False)
+    # Small partitions split the first pair of barns across a partition edge
+    result = filter_barns(
+        barns,
+        isochrones,
+        filter_barns=False,
+        n_workers=2,
+        partition_size=20,
+    )
+    assert result.index.tolist() == expected.index.tolist()
+    assert result.drop(columns="geometry").equals(expected.drop(columns="geometry"))
+
+
+def test_load_exclusion_layer_cache(tmp_path):
+    airports = gpd.GeoDataFrame(
+        {"name": ["A", "B"]},
+        geometry=[Point(-86.8, 32.5), Point(-85.5, 32.5)],
+        crs=WGS84,
+    )
+    airports.to_file(tmp_path / "airports.geojson", driver="GeoJSON")
+    config = {
+        "description": "airports",
+        "filename": "airports.geojson",
+        "buffer": 800,
+    }
+    kwargs = {"shapefile_dir": tmp_path, "cache_dir": tmp_path / "cache"}
+
+    result = load_exclusion_layer(config, WGS84, **kwargs)
+    assert list(result.columns) == ["geometry"]
+    assert len(list((tmp_path / "cache").glob("airports_*.parquet"))) == 1
+
+    # Point layers are kept unbuffered in meters so they can be queried by distance
+    cached = load_exclusion_layer(config, WGS84, **kwargs)
+    assert cached.crs == CONUS_ALBERS
+    assert (cached.geom_type == "Point").all()
+    assert sorted(cached.geometry.x) == pytest.approx(sorted(result.geometry.x))
+
+    # Changing the buffer changes the cache key
+    load_exclusion_layer({**config, "buffer": 400}, WGS84, **kwargs)
+    assert len(list((tmp_path / "cache").glob("airports_*.parquet"))) == 2
+
+
+def test_load_exclusion_layer_bbox(tmp_path, barns):
+    # One airport 2.5km east of the barns and one far away
+    gdf = barns.iloc[:2]
+    airports = gpd.GeoDataFrame(
+        {"name": ["A", "B"]},
+        geometry=[Point(-86.773, 32.5), Point(-80.0, 40.0)],
+        crs=WGS84,
+    )
+    airports.to_file(tmp_path / "airports.geojson", driver="GeoJSON")
+    config = {"description": "airports", "filename": "airports.geojson", "buffer": 3000}
+
+    result = load_exclusion_layer(
+        config, WGS84, shapefile_dir=tmp_path, use_cache=False, bbox=get_bounds(gdf)
+    )
+    assert len(result) == 1
+
+    # The bounds are padded by the buffer, so an unbuffered read misses the nearby airport
+    result = load_exclusion_layer(
+        {**config, "buffer": 0},
+        WGS84,
+        shapefile_dir=tmp_path,
+        use_cache=False,
+        bbox=get_bounds(gdf),
+    )
+    assert len(result) == 0
+
+
+def test_apply_filters_parallel(tmp_path):
+    points = [Point(-86.8, 32.5), Point(-85.5, 32.5), Point(-84.5, 32.5)]
+    gdf = gpd.GeoDataFrame(
+        {"state": ["AL"] * 3, "exclude": [0] * 3}, geometry=points, crs=WGS84
+    )
+    gpd.GeoDataFrame(geometry=[points[0]], crs=WGS84).to_file(
+        tmp_path / "airports.geojson", driver="GeoJSON"
+    )
+    gpd.GeoDataFrame(geometry=[points[1].buffer(0.01)], crs=WGS84).to_file(
+        tmp_path / "parks.geojson", driver="GeoJSON"
+    )
+    filters_config = [
+        {"description": "airports", "filename": "airports.geojson", "buffer": 800},
+        {"description": "parks", "filename": "parks.geojson"},
+    ]
+
+    sequential = apply_filters(
+        BarnTable.from_geodataframe(gdf),
+        filters_config,
+        tmp_path,
+        use_cache=False,
+        n_workers=1,
+        stats_path=tmp_path / "filter_stats.json",
+    ).to_geodataframe()
+    parallel = apply_filters(
+        BarnTable.from_geodataframe(gdf),
+        filters_config,
+        tmp_path,
+        use_cache=False,
+        n_workers=2,
+        stats_path=tmp_path / "parallel_stats.json",
+    ).to_geodataframe()
+    assert list(sequential["exclude"]) == [1, 1, 0]
+    assert list(parallel["exclude"]) == list(sequential["exclude"])
+    # Bit 0 is for major cities, so config filters start at bit 1
+    assert list(parallel["exclude_reasons"]) == [2, 4, 0]
+    assert list(parallel["exclude_reasons"]) == list(sequential["exclude_reasons"])
+    assert sorted(load_filter_stats(tmp_path / "filter_stats.json")) == [
+        "airports",
+        "parks",
+    ]
+    # The parallel path records the same statistics for every filter
+    parallel_stats = load_filter_stats(tmp_path / "parallel_stats.json")
+    assert sorted(parallel_stats) == ["airports", "parks"]
+    assert [stats["n_excluded"] for stats in parallel_stats.values()] == [1, 1]
+    assert all(stats["n_tested"] == 3 for stats in parallel_stats.values())
+
+
+def test_apply_filters_order_by_cost(tmp_path):
+    point = Point(-86.8, 32.5)
+    gdf = gpd.GeoDataFrame(
+        {"state": ["AL"], "exclude": [0]}, geometry=[point], crs=WGS84
+    )
+    gpd.GeoDataFrame(geometry=[point], crs=WGS84).to_file(
+        tmp_path / "airports.geojson", driver="GeoJSON"
+    )
+    gpd.GeoDataFrame(geometry=[point.buffer(0.01)], crs=WGS84).to_file(
+        tmp_path / "parks.geojson", driver="GeoJSON"
+    )
+    filters_config = [
+        {"description": "airports", "filename": "airports.geojson", "buffer": 800},
+        {"description": "parks", "filename": "parks.geojson"},
+    ]
+    stats_path = tmp_path / "filter_stats.json"
+    save_filter_stats(
+        {
+            "airports": get_filter_stats(0.0, 10.0, 100, 1),
+            "parks": get_filter_stats(0.0, 1.0, 100, 1),
+        },
+        stats_path,
+    )
+    kwargs = {"use_cache": False}
+
+    # Filters run in config order by default, so the barn is excluded for the airport
+    result = apply_filters(
+        BarnTable.from_geodataframe(gdf), filters_config, tmp_path, **kwargs
+    ).to_geodataframe()
+    assert list(result["exclude_reasons"]) == [2]
+
+    # Parks are cheaper per excluded barn, so they run first and take the reason
+    result = apply_filters(
+        BarnTable.from_geodataframe(gdf),
+        filters_config,
+        tmp_path,
+        order_by_cost=True,
+        stats_path=stats_path,
+        **kwargs,
+    ).to_geodataframe()
+    assert list(result["exclude_reasons"]) == [4]
+    assert load_filter_stats(stats_path)["parks"]["n_tested"] == 1
+
+
+def test_apply_filters_extent(tmp_path, cache_dir):
+    points = [Point(-86.8, 32.5), Point(-85.5, 32.5), Point(-84.5, 32.5)]
+    gdf = gpd.GeoDataFrame(
+        {"state": ["AL", "AL", "GA"], "exclude": [0] * 3}, geometry=points, crs=WGS84
+    )
+    gpd.GeoDataFrame(geometry=points[:2], crs=WGS84).to_file(
+        tmp_path / "airports.geojson", driver="GeoJSON"
+    )
+    filters_config = [
+        {"description": "airports", "filename": "airports.geojson", "buffer": 800}
+    ]
+    kwargs = {"stats_path": None, "cache_dir": cache_dir}
+    expected = apply_filters(
+        BarnTable.from_geodataframe(gdf), filters_config, tmp_path, **kwargs
+    ).to_geodataframe()
+
+    # Partitions in the extent of the whole table reuse its cached copy of the layer
+    extent = LayerExtent(get_bounds(gdf), ["AL", "GA"])
+    parts = [
+        apply_filters(
+            BarnTable.from_geodataframe(gdf.iloc[rows]),
+            filters_config,
+            tmp_path,
+            extent=extent,
+            **kwargs,
+        ).to_geodataframe()
+        for rows in [[0], [1, 2]]
+    ]
+    assert len(list(cache_dir.glob("airports_*.parquet"))) == 1
+    result = pd.concat(parts, ignore_index=True)
+    assert list(result["exclude"]) == list(expected["exclude"]) == [1, 1, 0]
+
+
+def test_get_exclusion_distances(tmp_path, monkeypatch):
+    points = [Point(-86.8, 32.5), Point(-86.8, 32.51), Point(-84.5, 32.5)]
+    gdf = gpd.GeoDataFrame({"state": ["AL"] * 3}, geometry=points, crs=WGS84)
+    gpd.GeoDataFrame(geometry=[points[0]], crs=WGS84).to_file(
+        tmp_path / "airports.geojson", driver="GeoJSON"
+    )
+    gpd.GeoDataFrame(geometry=[points[1].buffer(0.01)], crs=WGS84).to_file(
+        tmp_path / "parks.geojson", driver="GeoJSON"
+    )
+    filters_config = [
+        {"description": "airports", "filename": "airports.geojson", "buffer": 800},
+        {"description": "parks", "filename": "parks.geojson"},
+    ]
+
+    loaded = []
+
+    def load_layer(config, *args, **kwargs):
+        loaded.append(config["description"])
+        return load_exclusion_layer(config, *args, **kwargs)
+
+    monkeypatch.setattr("rafi.filter_barns.load_exclusion_layer", load_layer)
+    result = get_exclusion_distances(
+        gdf, filters_config, tmp_path, max_distance=5000, use_cache=False
+    )
+    # Only point and line layers get distances, and polygon layers aren't read
+    assert list(result.columns) == ["airports"]
+    assert loaded == ["airports"]
+    assert result["airports"][0] == 0
+    assert result["airports"][1] == pytest.approx(1109, rel=0.01)
+    assert np.isinf(result["airports"][2])
+
+
+def test_get_city_keys():
+    names = pd.Series(["Huntsville city, Alabama", "St. Louis, Missouri", None])
+    keys = get_city_keys(names)
+    assert keys["city"].tolist() == ["huntsville", "st louis", ""]
+    assert keys["state"].tolist() == ["alabama", "missouri", ""]
+
+    names = pd.Series(
+        [
+            "Lower Merion township, Pennsylvania",
+            "Indianapolis city (balance), Indiana",
+            "Nashville-Davidson metropolitan government (balance), Tennessee",
+            "Louisville/Jefferson County metro government (balance), Kentucky",
+            "Lexington-Fayette urban county, Kentucky",
+            "Augusta-Richmond County consolidated government (balance), Georgia",
+            "Athens-Clarke County unified government (balance), Georgia",
+            "Kansas City city, Missouri",
+        ]
+    )
+    assert get_city_keys(names)["city"].tolist() == [
+        "lower merion",
+        "indianapolis",
+        "nashville davidson",
+        "louisville jefferson county",
+        "lexington fayette",
+        "augusta richmond county",
+        "athens clarke county",
+        "kansas city",
+    ]
+
+
+def test_load_city_polygons(tmp_path):
+    places = gpd.GeoDataFrame(
+        {
+            "name": [
+                "Madison city, Alabama",
+                "Madison city, Alabama",
+                "Madison, Wisconsin",
+                "North Madison, Alabama",
+            ]
+        },
+        geometry=[box(0, 0, 1, 1), box(1, 0, 2, 1), box(5, 5, 6, 6), box(8, 8, 9, 9)],
+        crs=WGS84,
+    )
+    places.to_parquet(tmp_path / "cities.geoparquet")
+    kwargs = {
+        "cities_path": tmp_path / "cities.geoparquet",
+        "tolerance": 0,
+        "cache_dir": tmp_path / "cache",
+    }
+
+    gdf_cities = load_city_polygons({"Alabama": ["Madison"]}, WGS84, **kwargs)
+    assert gdf_cities[["city", "state"]].values.tolist() == [["madison", "alabama"]]
+    assert gdf_cities.geometry.area.sum() == pytest.approx(2)
+
+    cached = load_city_polygons({"Alabama": ["Madison"]}, WGS84, **kwargs)
+    assert cached.geometry.area.sum() == pytest.approx(2)
+    assert len(list((tmp_path / "cache").glob("major_cities_*.parquet"))) == 1
+
+
+def test_load_city_polygons_census_names(tmp_path):
+    places = gpd.GeoDataFrame(
+        {
+            "name": [
+                "Bensalem township, Pennsylvania",
+                "Nashville-Davidson metropolitan government (balance), Tennessee",
+                "Macon-Bibb County, Georgia",
+                "Lexington-Fayette urban county, Kentucky",
+            ]
+        },
+        geometry=[box(i, 0, i + 1, 1) for i in range(4)],
+        crs=WGS84,
+    )
+    places.to_parquet(tmp_path / "cities.geoparquet")
+    kwargs = {
+        "cities_path": tmp_path / "cities.geoparquet",
+        "tolerance": 0,
+        "use_cache": False,
+    }
+    cities_by_state = {
+        "Pennsylvania": ["Bensalem"],
+        "Tennessee": ["Nashville"],
+        "Georgia": ["Macon"],
+        "Kentucky": ["Lexington"],
+    }
+
+    gdf_cities = load_city_polygons(cities_by_state, WGS84, **kwargs)
+    assert sorted(gdf_cities["city"]) == ["bensalem", "lexington", "macon", "nashville"]
+
+    # Cities that don't match any place are an error rather than silently not filtered
+    with pytest.raises(ValueError, match="louisville, kentucky"):
+        load_city_polygons({"Kentucky": ["Louisville"]}, WGS84, **kwargs)
+
+
+def test_get_membership_mask_distance():
+    points = gpd.GeoSeries(
+        [Point(0, 0), Point(0, 150), Point(0, 300)], crs=CONUS_ALBERS
+    )
+    railroads = gpd.GeoDataFrame(
+        geometry=[LineString([(-1000, 0), (1000, 0)])], crs=CONUS_ALBERS
+    )
+    mask = get_membership_mask(points, railroads, distance=200)
+    assert mask.tolist() == [True, True, False]
+
+    # Points are projected to the CRS of the exclusion layer
+    mask = get_membership_mask(points.to_crs(WGS84), railroads, distance=200)
+    assert mask.tolist() == [True, True, False]
+
+
+def test_filter_on_tiles(tmp_path, barns):
+    points = barns.to_crs(CONUS_ALBERS).centroid
+    # A highway through the first pair of barns and a minor road through the second pair
+    roads = gpd.GeoDataFrame(
+        {"CLASS": [1, 5]},
+        geometry=[
+            LineString([(-86.8, 32.0), (-86.8, 33.0)]),
+            LineString([(-86.3, 32.0), (-86.3, 33.0)]),
+        ],
+        crs=WGS84,
+    )
+    roads.to_file(tmp_path / "roads.geojson", driver="GeoJSON")
+    config = {
+        "description": "major roads",
+        "filename": "roads.geojson",
+        "buffer": 200,
+        "tiled": True,
+        "tile_size": 10000,
+        "where": "CLASS IN (1, 2, 3)",
+    }
+
+    result = filter_on_tiles(
+        BarnTable.from_points(points),
+        config,
+        tmp_path,
+        cache_dir=tmp_path / "cache",
+        reason_bit=2,
+    )
+    assert result.exclude.tolist() == [True, True] + [False] * 10
+    assert result.exclude_reasons.tolist() == [2, 2] + [0] * 10
+    assert len(list((tmp_path / "cache").glob("major_roads_*.gpkg"))) == 1
+
+    # Reading tiles straight from the source gives the same result
+    uncached = filter_on_tiles(
+        BarnTable.from_points(points), config, tmp_path, use_cache=False
+    )
+    assert uncached.exclude.tolist() == result.exclude.tolist()
@@ -0,0 +1,52 @@
+import numpy as np
+
+from rafi.filter_stats import (
+    get_cost_per_excluded,
+    get_filter_stats,
+    load_filter_stats,
+    order_filters,
+    save_filter_stats,
+)
+
+
+def test_get_cost_per_excluded():
+    assert get_cost_per_excluded(get_filter_stats(1.0, 3.0, 100, 8)) == 0.375
+    # Load time doesn't depend on the order, so it doesn't count
+    assert get_cost_per_excluded(get_filter_stats(100.0, 3.0, 100, 8)) == 0.375
+    assert get_cost_per_excluded(get_filter_stats(1.0, 3.0, 100, 0)) == np.inf
+    assert get_filter_stats(1.0, 3.0, 0, 0)["fraction_excluded"] == 0
+
+
+def test_order_filters():
+    filters_config = [
+        {"description": "coastline"},
+        {"description": "airports"},
+        {"description": "new"},
+        {"description": "parks"},
+    ]
+    filter_stats = {
+        "coastline": get_filter_stats(0.1, 50.0, 1000, 10),
+        # Slow to load but cheap to join
+        "airports": get_filter_stats(100.0, 0.9, 1000, 100),
+        "parks": get_filter_stats(1.0, 1.0, 1000, 0),
+    }
+    ordered = order_filters(filters_config, filter_stats)
+    # Filters without statistics go first, and filters that exclude nothing go last
+    assert [config["description"] for config in ordered] == [
+        "new",
+        "airports",
+        "coastline",
+        "parks",
+    ]
+
+
+def test_save_filter_stats_merges_runs(tmp_path):
+    filepath = tmp_path / "filter_stats.json"
+    assert load_filter_stats(filepath) == {}
+
+    save_filter_stats({"airports": get_filter_stats(1.0, 1.0, 10, 1)}, filepath)
+    save_filter_stats({"parks": get_filter_stats(2.0, 2.0, 10, 2)}, filepath)
+    filter_stats = load_filter_stats(filepath)
+    assert sorted(filter_stats) == ["airports", "parks"]
+    assert filter_stats["parks"]["n_excluded"] == 2
+    assert list(tmp_path.iterdir()) == [filepath]
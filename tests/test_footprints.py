@@ -0,0 +1,57 @@
+import warnings
+
+import geopandas as gpd
+import numpy as np
+import pytest
+from shapely import affinity
+from shapely.geometry import Polygon, box
+
+from rafi.constants import CONUS_ALBERS
+from rafi.footprints import filter_footprints, get_footprint_mask, get_footprint_stats
+
+
+def make_footprints():
+    barn = box(0, 0, 150, 15)
+    return gpd.GeoDataFrame(
+        geometry=[
+            barn,
+            affinity.rotate(barn, 30),  # Rotated barns have the same dimensions
+            box(0, 0, 5, 5),  # Shed
+            box(0, 0, 400, 4),  # Sliver
+            Polygon([(0, 0), (1, 1), (2, 2)]),  # Degenerate detection
+        ],
+        crs=CONUS_ALBERS,
+    )
+
+
+def test_get_footprint_stats():
+    stats = get_footprint_stats(make_footprints().geometry, crs=CONUS_ALBERS)
+    assert stats["area"].tolist()[:3] == pytest.approx([2250, 2250, 25])
+    assert stats["length"].tolist()[:2] == pytest.approx([150, 150])
+    assert stats["width"].tolist()[:2] == pytest.approx([15, 15])
+    assert stats["aspect_ratio"].tolist()[:4] == pytest.approx([10, 10, 1, 100])
+    assert stats["width"][4] == 0
+    assert np.isinf(stats["aspect_ratio"][4])
+
+
+def test_get_footprint_mask():
+    stats = get_footprint_stats(make_footprints().geometry, crs=CONUS_ALBERS)
+    keep, counts = get_footprint_mask(
+        stats, {"min_area": 300, "max_aspect_ratio": 30, "max_width": None}
+    )
+    assert keep.tolist() == [True, True, False, False, False]
+    assert counts == {"min_area": 2, "max_aspect_ratio": 2}
+
+    with pytest.raises(ValueError, match="Unknown footprint thresholds"):
+        get_footprint_mask(stats, {"min_height": 3})
+
+
+def test_filter_footprints():
+    footprints = make_footprints()
+    gdf, counts = filter_footprints(footprints, {"min_width": 8}, crs=CONUS_ALBERS)
+    assert gdf.index.tolist() == [0, 1]
+    assert counts == {"min_width": 3}
+    # The kept barns are a copy, so they can be modified without a SettingWithCopyWarning
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        gdf["n_barns"] = 1
@@ -0,0 +1,74 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+from shapely.geometry import Polygon, box
+
+from rafi.geometry import is_coverage, parallel_dissolve, parallel_union, subdivide
+
+
+def test_parallel_union_matches_union_all():
+    rng = np.random.default_rng(0)
+    polygons = shapely.buffer(
+        shapely.points(rng.uniform(0, 50, 300), rng.uniform(0, 50, 300)), 2
+    )
+    result = parallel_union(polygons, n_workers=2, chunk_size=32)
+    expected = shapely.union_all(polygons)
+    assert shapely.symmetric_difference(result, expected).area < 1e-6 * expected.area
+
+
+def test_parallel_union_coverage():
+    grid = np.array(
+        [box(i, j, i + 1, j + 1) for i in range(5) for j in range(5)], dtype=object
+    )
+    assert is_coverage(grid)
+    assert not is_coverage(np.append(grid, box(0.5, 0.5, 1.5, 1.5)))
+    assert parallel_union(grid).equals(box(0, 0, 5, 5))
+
+
+def test_parallel_union_coverage_noding():
+    # The shared edge has an extra vertex on one side, which the coverage union can't handle
+    geoms = np.array(
+        [box(0, 0, 1, 1), Polygon([(1, 0), (1, 0.5), (1, 1), (2, 1), (2, 0)])],
+        dtype=object,
+    )
+    assert is_coverage(geoms)
+    assert parallel_union(geoms).equals(box(0, 0, 2, 1))
+
+
+def test_parallel_dissolve(monkeypatch):
+    gdf = gpd.GeoDataFrame(
+        {"corp": ["a"] * 40 + ["b"] * 2},
+        geometry=[box(i, 0, i + 1.5, 1) for i in range(40)] + [box(0, 5, 1, 6)] * 2,
+    )
+    expected = [box(0, 0, 40.5, 1), box(0, 5, 1, 6)]
+
+    result = parallel_dissolve(
+        gdf, by="corp", n_workers=2, chunk_size=8, min_parallel_size=0
+    )
+    assert result["corp"].tolist() == ["a", "b"]
+    assert all(a.equals(b) for a, b in zip(result.geometry, expected, strict=True))
+
+    # Small inputs are unioned without starting a process pool
+    monkeypatch.setattr("rafi.geometry.ProcessPoolExecutor", None)
+    result = parallel_dissolve(gdf, by="corp", n_workers=2)
+    assert all(a.equals(b) for a, b in zip(result.geometry, expected, strict=True))
+
+
+def test_subdivide():
+    # A detailed lake with an island, a small polygon, and a line
+    lake = shapely.Point(0, 0).buffer(10, quad_segs=512) - shapely.Point(3, 3).buffer(2)
+    line = shapely.LineString(np.column_stack([np.arange(1000), np.zeros(1000)]))
+    geoms = np.array([lake, box(20, 20, 21, 21), line], dtype=object)
+
+    pieces, parents = subdivide(geoms, max_vertices=64)
+    assert parents.tolist() == sorted(parents)
+    assert (shapely.get_num_coordinates(pieces[parents == 0]) <= 64).all()
+    assert shapely.union_all(pieces[parents == 0]).area == pytest.approx(lake.area)
+    assert pieces[parents == 1][0].equals(geoms[1])
+    assert pieces[parents == 2][0].equals(line)
+
+    rng = np.random.default_rng(0)
+    points = shapely.points(rng.uniform(-11, 11, (500, 2)))
+    point_idx, _ = shapely.STRtree(pieces).query(points, predicate="within")
+    assert set(point_idx) == set(np.flatnonzero(shapely.within(points, lake)))
@@ -0,0 +1,21 @@
+import numpy as np
+
+from rafi.partition import get_partitions
+
+
+def test_get_partitions():
+    x = np.array([5.0, 95.0, 105.0, 150.0, 250.0])
+    y = np.array([5.0, 50.0, 50.0, 50.0, 50.0])
+    partitions = get_partitions(x, y, size=100, halo=10)
+
+    assert [partition.bounds for partition in partitions] == [
+        (0, 0, 100, 100),
+        (100, 0, 200, 100),
+        (200, 0, 300, 100),
+    ]
+    # Every point is in the core of exactly one partition
+    assert sorted(np.concatenate([partition.core for partition in partitions])) == list(range(5))
+    # Points near a shared edge are in the halo of the neighbouring partition
+    assert partitions[0].halo.tolist() == [2]
+    assert partitions[1].halo.tolist() == [1]
+    assert partitions[2].halo.tolist() == []
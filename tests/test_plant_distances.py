@@ -0,0 +1,69 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+from shapely.geometry import Point
+
+from rafi.constants import CONUS_ALBERS
+from rafi.plant_distances import (
+    get_corp_column,
+    get_plant_distances,
+    query_nearest,
+    save_plant_distances,
+)
+
+
+def make_plants():
+    return gpd.GeoDataFrame(
+        {
+            "Parent Corporation": ["Tyson", "Perdue", "Tyson"],
+            "Establishment Name": ["Tyson A", "Perdue A", "Tyson B"],
+            "Sales": [100.0, 200.0, 300.0],
+        },
+        geometry=[Point(0, 0), Point(1000, 0), Point(5000, 0)],
+        crs=CONUS_ALBERS,
+    )
+
+
+def test_get_plant_distances(tmp_path):
+    gdf_barns = gpd.GeoDataFrame(
+        geometry=[Point(100, 0), Point(4000, 0)], index=[5, 6], crs=CONUS_ALBERS
+    )
+    distances = get_plant_distances(gdf_barns, make_plants(), k=2)
+
+    assert distances.index.tolist() == [5, 6]
+    assert distances["plant_1"].tolist() == ["Tyson A", "Tyson B"]
+    assert distances["plant_1_distance"].tolist() == pytest.approx([100, 1000])
+    assert distances["plant_2"].tolist() == ["Perdue A", "Perdue A"]
+    assert distances["plant_2_corporation"].tolist() == ["Perdue", "Perdue"]
+    assert distances["plant_2_sales"].tolist() == [200, 200]
+    assert distances["distance_tyson"].tolist() == pytest.approx([100, 1000])
+    assert distances["distance_perdue"].tolist() == pytest.approx([900, 3000])
+
+    save_plant_distances(distances, tmp_path / "plant_distances.parquet")
+    loaded = pd.read_parquet(tmp_path / "plant_distances.parquet")
+    assert loaded.index.tolist() == [5, 6]
+    assert loaded["plant_1"].tolist() == ["Tyson A", "Tyson B"]
+
+
+def test_get_corp_column():
+    assert get_corp_column("Pilgrim's Pride") == "distance_pilgrim_s_pride"
+    assert get_corp_column("Wayne-Sanderson Farms") == "distance_wayne_sanderson_farms"
+
+
+def test_get_plant_distances_more_neighbors_than_plants():
+    gdf_barns = gpd.GeoDataFrame(geometry=[Point(100, 0)], crs=CONUS_ALBERS)
+    distances = get_plant_distances(gdf_barns, make_plants(), k=4)
+    assert np.isinf(distances["plant_4_distance"][0])
+    assert pd.isna(distances["plant_4"][0])
+    assert np.isnan(distances["plant_4_sales"][0])
+
+
+def test_query_nearest_batches():
+    from scipy.spatial import cKDTree
+
+    tree = cKDTree(np.array([[0.0, 0.0], [10.0, 0.0]]))
+    coords = np.column_stack([np.arange(5.0), np.zeros(5)])
+    distances, indices = query_nearest(tree, coords, k=1, batch_size=2)
+    assert indices[:, 0].tolist() == [0, 0, 0, 0, 0]
+    assert distances[:, 0].tolist() == [0, 1, 2, 3, 4]
@@ -0,0 +1,98 @@
+import geopandas as gpd
+import pytest
+from shapely.geometry import Point, box
+
+from rafi.barn_access import get_barn_access
+from rafi.constants import WGS84
+from rafi.scenario import get_scenario
+
+
+def make_run():
+    gdf_plants = gpd.GeoDataFrame(
+        {
+            "Parent Corporation": ["Tyson", "Tyson", "Perdue"],
+            "Establishment Name": ["Tyson A", "Tyson B", "Perdue A"],
+            "duns_number_fsis": ["001", "002", "003"],
+        },
+        geometry=[box(0, 0, 2, 2), box(1, 0, 3, 2), box(1.5, 0, 4, 2)],
+        crs=WGS84,
+    )
+    gdf_barns = gpd.GeoDataFrame(
+        {
+            "state": ["AL", "AL", "GA", "GA"],
+            "parent_corporation": ["Tyson", "Tyson", None, "Perdue"],
+            "integrator_access": [1, 1, 2, 1],
+            "exclude": [0, 0, 0, 1],
+        },
+        geometry=[Point(0.5, 1), Point(1.2, 1), Point(1.7, 1), Point(3.5, 1)],
+        crs=WGS84,
+    )
+    access = get_barn_access(gdf_barns, gdf_plants)
+    return gdf_barns, access, gdf_plants
+
+
+def test_get_scenario_closure():
+    gdf_barns, access, gdf_plants = make_run()
+    result = get_scenario(gdf_barns, access, gdf_plants, closures=["001"])
+
+    # The third barn can still reach Tyson B, so only the first barn loses access
+    assert result.barns.index.tolist() == [1, 2, 3]
+    assert result.deltas.index.tolist() == [0]
+    assert result.deltas["integrator_access_after"].tolist() == [0]
+    assert result.state_counts.loc["AL", 1] == 1
+    assert result.state_count_deltas.loc["AL"].tolist() == [-1, 0]
+    assert result.state_count_deltas.loc["GA"].tolist() == [0, 0]
+
+
+def test_get_scenario_opening():
+    gdf_barns, access, gdf_plants = make_run()
+    gdf_openings = gpd.GeoDataFrame(
+        {"Parent Corporation": ["Wayne"], "Establishment Name": ["Wayne A"]},
+        geometry=[box(1, 0, 2, 2)],
+        crs=WGS84,
+    )
+    result = get_scenario(gdf_barns, access, gdf_plants, gdf_openings=gdf_openings)
+
+    assert result.deltas.index.tolist() == [1, 2]
+    assert result.barns["integrator_access"].tolist() == [1, 2, 3, 1]
+    assert result.barns["parent_corporation"].tolist() == [
+        "Tyson",
+        None,
+        None,
+        "Perdue",
+    ]
+    assert result.state_count_deltas.loc["AL"].tolist() == [-1, 1, 0]
+    assert result.state_count_deltas.loc["GA"].tolist() == [0, -1, 1]
+
+
+def test_get_scenario_closure_to_single_corporation():
+    gdf_barns, access, gdf_plants = make_run()
+    result = get_scenario(gdf_barns, access, gdf_plants, closures=["003"])
+    assert result.deltas.index.tolist() == [2, 3]
+    assert result.barns["parent_corporation"].tolist() == ["Tyson", "Tyson", "Tyson"]
+
+
+def test_get_scenario_unknown_plant():
+    gdf_barns, access, gdf_plants = make_run()
+    with pytest.raises(ValueError, match="Unknown plants"):
+        get_scenario(gdf_barns, access, gdf_plants, closures=["Nowhere"])
+
+
+def test_get_scenario_closure_by_id():
+    gdf_barns, access, gdf_plants = make_run()
+    # Two plants with the same name are closed separately by ID
+    gdf_plants["Establishment Name"] = ["Tyson", "Tyson", "Perdue A"]
+    access = get_barn_access(gdf_barns, gdf_plants)
+    result = get_scenario(gdf_barns, access, gdf_plants, closures=["002"])
+    assert result.deltas.empty
+    assert result.barns.index.tolist() == [0, 1, 2, 3]
+
+
+def test_get_scenario_closure_duplicate_duns():
+    gdf_barns, _, gdf_plants = make_run()
+    # Tyson A and B share a DUNS number, so each is closed by its establishment number
+    gdf_plants["duns_number_fsis"] = ["001", "001", "003"]
+    gdf_plants["establishment_number"] = ["P1", "P2", "P3"]
+    access = get_barn_access(gdf_barns, gdf_plants)
+    result = get_scenario(gdf_barns, access, gdf_plants, closures=["001-P1"])
+    assert result.deltas.index.tolist() == [0]
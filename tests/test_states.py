@@ -0,0 +1,56 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely.geometry import Point, box
+
+from rafi.constants import CONUS_ALBERS
+from rafi.states import BOUNDARY, build_state_grid, lookup_states
+
+
+def make_states():
+    # Two neighbouring states and a state with a hole
+    return gpd.GeoDataFrame(
+        {"ABBREV": ["AA", "BB", "CC"]},
+        geometry=[
+            box(0, 0, 100000, 100000).difference(box(50000, 0, 100000, 50000)),
+            box(50000, 0, 100000, 50000),
+            box(200000, 0, 300000, 100000).difference(box(230000, 30000, 270000, 70000)),
+        ],
+        crs=CONUS_ALBERS,
+    )
+
+
+def test_build_state_grid():
+    grid = build_state_grid(make_states(), cell_size=10000)
+    assert grid.codes.shape == (10, 30)
+    assert grid.codes[9, 0] == 0
+    assert grid.codes[0, 9] == 1
+    assert grid.codes[5, 5] == BOUNDARY
+    assert grid.codes[5, 15] == -1  # Between the states
+    assert grid.codes[5, 25] == -1  # In the hole
+
+
+def test_lookup_states():
+    gdf_states = make_states()
+    grid = build_state_grid(gdf_states, cell_size=10000)
+    points = gpd.GeoSeries(
+        [
+            Point(5000, 95000),
+            Point(95000, 5000),
+            Point(52000, 48000),  # Boundary cell
+            Point(50000, 20000),  # On the border
+            Point(150000, 50000),
+            Point(250000, 50000),
+            Point(-1000000, 0),
+            None,
+        ],
+        crs=CONUS_ALBERS,
+    )
+    states = lookup_states(points, gdf_states, grid)
+    assert isinstance(states, pd.Categorical)
+    expected = ["AA", "BB", "BB", "AA", np.nan, np.nan, np.nan, np.nan]
+    assert pd.Series(states).tolist() == pd.Series(expected).tolist()
+
+    # The grid is only a shortcut, so an exact lookup gives the same states
+    exact = lookup_states(points, gdf_states, build_state_grid(gdf_states, cell_size=1e6))
+    assert pd.Series(exact).equals(pd.Series(states))
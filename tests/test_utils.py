@@ -0,0 +1,49 @@
+import geopandas as gpd
+import numpy as np
+from shapely.geometry import box
+
+from rafi.constants import ALBERS_EQUAL_AREA, WGS84
+from rafi.utils import read_barn_centroids
+
+
+def test_read_barn_centroids(tmp_path):
+    barns = gpd.GeoDataFrame(
+        {"id": range(5), "unused": ["a"] * 5},
+        geometry=[box(-86 + i, 32, -86 + i + 0.0002, 32.0001) for i in range(5)],
+        crs=WGS84,
+    )
+    filepath = tmp_path / "barns.gpkg"
+    barns.to_file(filepath, driver="GPKG")
+
+    # Chunks smaller than the file so barns are read across several batches
+    gdf = read_barn_centroids(filepath, columns=["id"], chunk_size=2)
+
+    expected = barns.to_crs(ALBERS_EQUAL_AREA).centroid
+    assert list(gdf.columns) == ["id", "geometry"]
+    assert gdf.crs == ALBERS_EQUAL_AREA
+    assert (gdf.geom_type == "Point").all()
+    assert gdf["id"].tolist() == list(range(5))
+    assert np.allclose(gdf.geometry.x, expected.x)
+    assert np.allclose(gdf.geometry.y, expected.y)
+
+
+def test_read_barn_centroids_footprint_thresholds(tmp_path):
+    # Barns get longer from west to east, and the first one is a shed
+    barns = gpd.GeoDataFrame(
+        {"id": range(5)},
+        geometry=[
+            box(-86 + i, 32, -86 + i + 0.0005 * (i + 1), 32.0001) for i in range(5)
+        ],
+        crs=WGS84,
+    )
+    filepath = tmp_path / "barns.gpkg"
+    barns.to_file(filepath, driver="GPKG")
+
+    gdf = read_barn_centroids(
+        filepath, columns=["id"], chunk_size=2, footprint_thresholds={"min_area": 1000}
+    )
+    assert gdf["id"].tolist() == [1, 2, 3, 4]
+
+    # Thresholds that are off keep every barn
+    gdf = read_barn_centroids(filepath, footprint_thresholds={"min_area": None})
+    assert len(gdf) == 5